@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+DOCUMENTATION = '''
+    name: pve_profile
+    type: aggregate
+    short_description: Profiles where the time of a run of this role goes
+    description:
+      - Aggregates the wall time of a playbook run per task file, per loop item
+        and per host, along with the pvesh calls reported by the modules of
+        this role when C(PVESH_PROFILE) is enabled.
+      - At the end of the playbook, writes the aggregates to C(pve_profile.json)
+        and the same timings as folded stacks (suitable for C(flamegraph.pl) or
+        speedscope) to C(pve_profile.folded).
+    requirements:
+      - enable in configuration
+    options:
+      output_dir:
+        description: Directory the reports are written to.
+        default: pve_profile
+        env:
+          - name: PVE_PROFILE_DIR
+        ini:
+          - section: callback_pve_profile
+            key: output_dir
+        type: path
+'''
+
+import json
+import os
+import time
+from collections import defaultdict
+
+from ansible.plugins.callback import CallbackBase
+
+# Keys identifying the items this role loops over, in order of preference
+ITEM_KEYS = ["name", "userid", "groupid", "poolid", "roleid", "path", "realm"]
+
+
+def item_label(result):
+    label = result.get("_ansible_item_label", result.get("item"))
+    if isinstance(label, dict):
+        for key in ITEM_KEYS:
+            if key in label:
+                return str(label[key])
+        label = json.dumps(label, sort_keys=True)
+    label = str(label)
+    return label if len(label) <= 60 else label[:57] + "..."
+
+
+def frame(name):
+    # Semicolons separate frames and the last space separates the value in
+    # the folded format, so neither can appear within a frame.
+    return str(name).replace(";", ":").replace(" ", "_").replace("\n", "_")
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'pve_profile'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+        self.started = time.time()
+        self.play = None
+        self.current = None
+        self.current_started = None
+        self.host_started = {}
+        self.item_time = defaultdict(float)
+        self.task_files = defaultdict(lambda: {"time": 0.0, "tasks": 0})
+        self.tasks = {}
+        self.hosts = defaultdict(lambda: {"time": 0.0, "task_files": defaultdict(float)})
+        self.items = defaultdict(lambda: {"time": 0.0, "count": 0})
+        self.pvesh = defaultdict(lambda: {"calls": 0, "time": 0.0, "backends": defaultdict(int)})
+        self.folded = defaultdict(float)
+
+    def task_file(self, task):
+        path = task.get_path()
+        if not path:
+            return "(unknown)"
+        return os.path.basename(path.rsplit(":", 1)[0])
+
+    def task_stack(self, task):
+        role = task._role.get_name() if task._role else "(playbook)"
+        return [frame(self.play), frame(role), frame(self.task_file(task)), frame(task.get_name())]
+
+    def end_task(self):
+        if self.current is None:
+            return
+        elapsed = time.time() - self.current_started
+        self.task_files[self.task_file(self.current)]["time"] += elapsed
+        self.tasks[self.current._uuid]["time"] += elapsed
+        self.current = None
+
+    def v2_playbook_on_play_start(self, play):
+        self.end_task()
+        self.play = play.get_name() or "(play)"
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.end_task()
+        self.current = task
+        self.current_started = time.time()
+        self.task_files[self.task_file(task)]["tasks"] += 1
+        self.tasks.setdefault(task._uuid, {
+            "task": task.get_name(),
+            "file": self.task_file(task),
+            "path": task.get_path(),
+            "time": 0.0,
+            "host_time": 0.0,
+        })
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self.v2_playbook_on_task_start(task, False)
+
+    def v2_runner_on_start(self, host, task):
+        self.host_started[(host.get_name(), task._uuid)] = time.time()
+
+    def record_pvesh_calls(self, stack, calls):
+        total = 0.0
+        for call in calls or []:
+            name = "{} {}".format(call.get("handler"), call.get("resource"))
+            stats = self.pvesh[name]
+            stats["calls"] += 1
+            stats["time"] += call.get("time", 0)
+            stats["backends"][call.get("backend")] += 1
+            self.folded[tuple(stack + [frame("pvesh " + name)])] += call.get("time", 0)
+            total += call.get("time", 0)
+        return total
+
+    def record_item(self, result):
+        key = (result._host.get_name(), result._task._uuid)
+        now = time.time()
+        # Items are reported in order as they finish, so each one took the
+        # time since the previous one (or since the task started on the host).
+        elapsed = now - self.host_started.get(key, now)
+        self.host_started[key] = now
+        self.item_time[key] += elapsed
+
+        label = item_label(result._result)
+        stack = self.task_stack(result._task) + [frame(label)]
+        stats = self.items["{} [{}]".format(result._task.get_name(), label)]
+        stats["time"] += elapsed
+        stats["count"] += 1
+        pvesh_time = self.record_pvesh_calls(stack, result._result.get("pvesh_calls"))
+        self.folded[tuple(stack)] += max(elapsed - pvesh_time, 0)
+
+    def record_host(self, result):
+        host = result._host.get_name()
+        task = result._task
+        key = (host, task._uuid)
+        started = self.host_started.pop(key, None)
+        elapsed = time.time() - started if started else 0.0
+        stack = self.task_stack(task)
+
+        # The pvesh calls of loops were already accounted for per item, so
+        # only the time since the last item is left.
+        if "results" not in result._result:
+            elapsed -= self.record_pvesh_calls(stack, result._result.get("pvesh_calls"))
+        self.folded[tuple(stack)] += max(elapsed, 0)
+        elapsed = max(elapsed, 0) + self.item_time.pop(key, 0.0)
+
+        self.hosts[host]["time"] += elapsed
+        self.hosts[host]["task_files"][self.task_file(task)] += elapsed
+        if task._uuid in self.tasks:
+            self.tasks[task._uuid]["host_time"] += elapsed
+
+    def v2_runner_item_on_ok(self, result):
+        self.record_item(result)
+
+    def v2_runner_item_on_failed(self, result):
+        self.record_item(result)
+
+    def v2_runner_item_on_skipped(self, result):
+        self.record_item(result)
+
+    def v2_runner_on_ok(self, result):
+        self.record_host(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self.record_host(result)
+
+    def v2_runner_on_skipped(self, result):
+        self.record_host(result)
+
+    def v2_runner_on_unreachable(self, result):
+        self.record_host(result)
+
+    def report(self):
+        def by_time(stats):
+            return dict(sorted(stats.items(), key=lambda kv: kv[1]["time"], reverse=True))
+
+        hosts = {}
+        for host, stats in self.hosts.items():
+            hosts[host] = {
+                "time": stats["time"],
+                "task_files": dict(sorted(stats["task_files"].items(), key=lambda kv: kv[1], reverse=True)),
+            }
+        pvesh = {}
+        for name, stats in self.pvesh.items():
+            pvesh[name] = dict(stats, backends=dict(stats["backends"]))
+
+        return {
+            "time": time.time() - self.started,
+            "task_files": by_time(self.task_files),
+            "tasks": sorted(self.tasks.values(), key=lambda task: task["time"], reverse=True),
+            "hosts": by_time(hosts),
+            "items": by_time(self.items),
+            "pvesh": by_time(pvesh),
+        }
+
+    def v2_playbook_on_stats(self, stats):
+        self.end_task()
+        output_dir = self.get_option("output_dir")
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        with open(os.path.join(output_dir, "pve_profile.json"), "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+        # Folded stacks are weighted in milliseconds of (summed) host time
+        with open(os.path.join(output_dir, "pve_profile.folded"), "w") as f:
+            for stack, elapsed in sorted(self.folded.items()):
+                weight = int(round(elapsed * 1000))
+                if weight > 0:
+                    f.write("{} {}\n".format(";".join(stack), weight))
+
+        self._display.display("pve_profile: wrote reports to {}".format(output_dir))
@@ -7,6 +7,87 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_text
 
 
+def char_order(char):
+    # The sort order of a character in a non-digit part of a version, as
+    # defined by dpkg: "~" sorts before everything, even the end of the
+    # part, and letters sort before all other characters.
+    if char == "~":
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def compare_part(left, right):
+    # Compares an upstream version or revision the way dpkg's verrevcmp does,
+    # i.e. alternating between non-digit and digit parts.
+    i = j = 0
+    while i < len(left) or j < len(right):
+        while (i < len(left) and not left[i].isdigit()) or (j < len(right) and not right[j].isdigit()):
+            left_order = char_order(left[i]) if i < len(left) and not left[i].isdigit() else 0
+            right_order = char_order(right[j]) if j < len(right) and not right[j].isdigit() else 0
+            if left_order != right_order:
+                return left_order - right_order
+            i += 1
+            j += 1
+
+        left_start = i
+        while i < len(left) and left[i].isdigit():
+            i += 1
+        right_start = j
+        while j < len(right) and right[j].isdigit():
+            j += 1
+        left_number = int(left[left_start:i] or 0)
+        right_number = int(right[right_start:j] or 0)
+        if left_number != right_number:
+            return left_number - right_number
+    return 0
+
+
+def parse_version(version):
+    epoch = 0
+    if ":" in version:
+        epoch, version = version.split(":", 1)
+        epoch = int(epoch)
+    upstream, revision = version, ""
+    if "-" in version:
+        upstream, revision = version.rsplit("-", 1)
+    return (epoch, upstream, revision)
+
+
+def compare_versions(left, right):
+    """Compares two Debian package versions like dpkg --compare-versions."""
+    left_epoch, left_upstream, left_revision = parse_version(left)
+    right_epoch, right_upstream, right_revision = parse_version(right)
+    if left_epoch != right_epoch:
+        return left_epoch - right_epoch
+    return (compare_part(left_upstream, right_upstream)
+            or compare_part(left_revision, right_revision))
+
+
+def package_owners(paths):
+    # Asks dpkg for the packages owning all paths at once. Paths which don't
+    # belong to any package are simply left out.
+    if not paths:
+        return {}
+    dpkg_env = dict(os.environ)
+    dpkg_env["LC_ALL"] = "C"
+    sp = subprocess.run(["dpkg-query", "-S"] + paths, capture_output=True, env=dpkg_env)
+    for line in to_text(sp.stderr).splitlines():
+        # Ignore errors about directories not associated with a package
+        if line and not line.startswith("dpkg-query: no path found matching"):
+            raise subprocess.CalledProcessError(sp.returncode, sp.args, sp.stdout, sp.stderr)
+
+    owners = {}
+    for line in to_text(sp.stdout).splitlines():
+        if line.startswith("diversion by "):
+            continue
+        pkgs, _, path = line.partition(": ")
+        if path in paths:
+            owners[path] = pkgs.split(", ")
+    return owners
+
+
 def main():
     module = AnsibleModule(
         argument_spec = dict(
@@ -30,30 +111,21 @@ def main():
         # should be something like 5.4.78-1-pve, that we can compare
         right = latest_kernel.split("/")[-1]
         left = kernel.split("/")[-1]
-        cmp_str = "gt"
-        if subprocess.call(["dpkg", "--compare-versions", left, cmp_str, right]) == 0:
+        if compare_versions(left, right) > 0:
             latest_kernel = kernel
 
-    booted_kernel = "/lib/modules/{}".format(to_text(
-            subprocess.run(["uname", "-r"], capture_output=True).stdout).strip())
+    booted_kernel = "/lib/modules/{}".format(os.uname().release)
 
     booted_kernel_packages = ""
     old_kernel_packages = []
     if params['lookup_packages']:
-        dpkg_env = dict(os.environ)
-        dpkg_env["LC_ALL"] = "C"
+        # Identify the currently booted kernel and unused old kernels by
+        # querying which packages own directories in /lib/modules
+        owners = package_owners(kernels)
         for kernel in kernels:
-            # Identify the currently booted kernel and unused old kernels by
-            # querying which packages own directories in /lib/modules
-            try:
-                sp = subprocess.run(["dpkg-query", "-S", kernel],
-                                    check=True, capture_output=True, env=dpkg_env)
-            except subprocess.CalledProcessError as e:
-                # Ignore errors about directories not associated with a package
-                if e.stderr.startswith(b"dpkg-query: no path found matching"):
-                    continue
-                raise e
-            pkgs = to_text(sp.stdout).split(":")[0].split(", ")
+            if kernel not in owners:
+                continue
+            pkgs = owners[kernel]
             if kernel.split("/")[-1] == booted_kernel.split("/")[-1]:
                 booted_kernel_packages = pkgs
             elif kernel != latest_kernel:
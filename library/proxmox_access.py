@@ -0,0 +1,388 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_access
+
+short_description: Manages pools, roles, groups, users and ACLs in Proxmox in bulk
+
+description:
+    - Takes the desired state of any number of pools, roles, groups, users and
+      ACLs, reads each affected collection from PVE once and only issues the
+      writes needed to converge them. Objects are created and modified in
+      dependency order (pools, roles, groups, users, then ACLs), before
+      anything is removed in reverse order.
+    - The options of each entry are the same as those of the
+      M(proxmox_pool), M(proxmox_role), M(proxmox_group), M(proxmox_user)
+      and M(proxmox_acl) modules.
+
+options:
+    pools:
+        required: false
+        type: list
+        description:
+            - Pools to manage, each with a C(name), C(state) and C(comment).
+    roles:
+        required: false
+        type: list
+        description:
+            - Roles to manage, each with a C(name), C(state) and a list of
+              C(privileges).
+    groups:
+        required: false
+        type: list
+        description:
+            - Groups to manage, each with a C(name), C(state) and C(comment).
+    users:
+        required: false
+        type: list
+        description:
+            - Users to manage, each with a C(name), C(state), C(enable),
+              C(groups), C(comment), C(email), C(firstname), C(lastname),
+              C(password) and C(expire). Unlike with M(proxmox_user), users
+              are removed from all groups if C(groups) is omitted.
+    acls:
+        required: false
+        type: list
+        description:
+            - ACL entries to manage, each with a C(path), C(state), a list of
+              C(roles) and lists of C(users) and/or C(groups). With
+              C(exclusive), all entries for the path that aren't given in
+              this list are removed.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure users and groups
+  proxmox_access:
+    groups:
+      - name: Admins
+        comment: Administrators of this PVE cluster
+    users:
+      - name: lae@pam
+        email: lae@pve.example
+        groups: [ "Admins" ]
+      - name: tempuser@pam
+        state: absent
+- name: Configure ACLs
+  proxmox_access:
+    acls:
+      - path: /
+        roles: [ "Administrator" ]
+        groups: [ "Admins" ]
+'''
+
+RETURN = '''
+pools:
+    description: For each pool, its name, state, whether it changed and which
+                 fields were modified if it already existed.
+    type: list
+roles:
+    description: The same as I(pools), for roles.
+    type: list
+groups:
+    description: The same as I(pools), for groups.
+    type: list
+users:
+    description: The same as I(pools), for users.
+    type: list
+acls:
+    description: For each ACL entry, its path, state and whether it changed.
+    type: list
+'''
+
+from ansible.module_utils._text import to_text
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+import ansible.module_utils.pvesh as pvesh
+from ansible.module_utils.pveacl import (index_acls, expand_acl,
+                                         without_propagate, batch_acl_changes)
+
+def split_list(value):
+    if isinstance(value, list):
+        return value
+    return [item for item in (value or '').split(',') if item]
+
+class ProxmoxAccess(object):
+    def __init__(self, module):
+        self.module = module
+        self.pools = module.params['pools'] or []
+        self.roles = module.params['roles'] or []
+        self.groups = module.params['groups'] or []
+        self.users = module.params['users'] or []
+        self.acls = module.params['acls'] or []
+
+        # Writes are collected while comparing, so that nothing is changed if
+        # any object turns out to be invalid.
+        self.writes = []
+        self.removals = []
+
+        try:
+            self.existing_pools = self.snapshot(self.pools, "pools", "poolid")
+            self.existing_roles = self.snapshot(self.roles, "access/roles", "roleid")
+            self.existing_groups = self.snapshot(self.groups or self.users, "access/groups", "groupid")
+            self.existing_users = self.snapshot(self.users, "access/users", "userid", full=1)
+            self.existing_acl = index_acls(pvesh.get("access/acl")) if self.acls else set()
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
+
+    def snapshot(self, wanted, resource, key, **params):
+        if not wanted:
+            return {}
+        return dict((item[key], item) for item in pvesh.get(resource, **params) or [])
+
+    def plan_comment_objects(self, objects, existing, resource, key):
+        # Pools and groups only have a comment to manage
+        results = []
+        for obj in objects:
+            result = {'name': obj['name'], 'state': obj['state'], 'changed': False}
+            lookup = existing.get(obj['name'])
+            if obj['state'] == 'absent':
+                if lookup is not None:
+                    result['changed'] = True
+                    self.removals.insert(0, ("delete", "{}/{}".format(resource, obj['name']), {}))
+            elif lookup is None:
+                result['changed'] = True
+                args = {key: obj['name']}
+                if obj['comment'] is not None:
+                    args['comment'] = obj['comment']
+                self.writes.append(("create", resource, args))
+            elif obj['comment'] is not None and to_text(obj['comment']) != lookup.get('comment', ''):
+                result['changed'] = True
+                result['updated_fields'] = ['comment']
+                self.writes.append(("set", "{}/{}".format(resource, obj['name']),
+                                    {'comment': obj['comment']}))
+            results.append(result)
+        return results
+
+    def plan_roles(self):
+        results = []
+        for role in self.roles:
+            result = {'name': role['name'], 'state': role['state'], 'changed': False}
+            lookup = self.existing_roles.get(role['name'])
+            privs = ','.join(sorted(role['privileges'] or []))
+            if role['state'] == 'absent':
+                if lookup is not None:
+                    result['changed'] = True
+                    self.removals.insert(0, ("delete", "access/roles/{}".format(role['name']), {}))
+            elif lookup is None:
+                result['changed'] = True
+                self.writes.append(("create", "access/roles", {'roleid': role['name'], 'privs': privs}))
+            elif privs != ','.join(sorted(split_list(lookup.get('privs')))):
+                result['changed'] = True
+                result['updated_fields'] = ['privs']
+                self.writes.append(("set", "access/roles/{}".format(role['name']), {'privs': privs}))
+            results.append(result)
+        return results
+
+    def prepare_user_args(self, user):
+        args = {}
+        args['enable'] = 1 if user['enable'] else 0
+        args['expire'] = user['expire']
+        for key in ['comment', 'firstname', 'lastname', 'email']:
+            if user[key] is not None:
+                args[key] = user[key]
+        if user['groups'] is not None:
+            args['groups'] = ','.join(user['groups'])
+        return args
+
+    def plan_users(self):
+        # Groups that will exist once the groups given to this module are applied
+        groups = set(self.existing_groups)
+        for group in self.groups:
+            if group['state'] == 'absent':
+                groups.discard(group['name'])
+            else:
+                groups.add(group['name'])
+
+        results = []
+        for user in self.users:
+            result = {'name': user['name'], 'state': user['state'], 'changed': False}
+            lookup = self.existing_users.get(user['name'])
+            if user['state'] == 'absent':
+                if lookup is not None:
+                    result['changed'] = True
+                    self.removals.insert(0, ("delete", "access/users/{}".format(user['name']), {}))
+                results.append(result)
+                continue
+
+            if user['groups'] is not None and not set(user['groups']).issubset(groups):
+                self.module.fail_json(name=user['name'], msg="One or more specified groups do not exist.")
+
+            staged_user = self.prepare_user_args(user)
+            if lookup is None:
+                result['changed'] = True
+                if user['password'] is not None:
+                    staged_user['password'] = user['password']
+                staged_user['userid'] = user['name']
+                self.writes.append(("create", "access/users", staged_user))
+                results.append(result)
+                continue
+
+            modified_user = {}
+            for key in staged_user:
+                if key == 'groups':
+                    if set(user['groups']) != set(split_list(lookup.get('groups'))):
+                        modified_user[key] = staged_user[key]
+                else:
+                    staged_value = to_text(staged_user[key]) if isinstance(staged_user[key], str) else staged_user[key]
+                    if key not in lookup or staged_value != lookup[key]:
+                        modified_user[key] = staged_user[key]
+
+            if modified_user:
+                result['changed'] = True
+                result['updated_fields'] = sorted(modified_user)
+                self.writes.append(("set", "access/users/{}".format(user['name']), modified_user))
+            results.append(result)
+        return results
+
+    def plan_acls(self):
+        existing = without_propagate(self.existing_acl)
+        added = set()
+        removed = set()
+
+        # Everything that's wanted on each path, for exclusive entries
+        wanted = {}
+        for acl in self.acls:
+            if acl['state'] == 'present':
+                keys = expand_acl(acl['path'], acl['roles'], acl['users'], acl['groups'])
+                wanted.setdefault(acl['path'], set()).update(without_propagate(keys))
+
+        results = []
+        for acl in self.acls:
+            result = {'path': acl['path'], 'state': acl['state'], 'changed': False}
+            keys = expand_acl(acl['path'], acl['roles'], acl['users'], acl['groups'])
+            if acl['state'] == 'absent':
+                keys = [key for key in keys if key[:4] in existing]
+                removed.update(keys)
+            else:
+                keys = [key for key in keys if key not in self.existing_acl]
+                added.update(keys)
+                if acl['exclusive']:
+                    unmanaged = [key for key in self.existing_acl if key[0] == acl['path']
+                                 and key[:4] not in wanted[acl['path']]]
+                    removed.update(unmanaged)
+                    keys += unmanaged
+            result['changed'] = bool(keys)
+            results.append(result)
+
+        for args in batch_acl_changes(added):
+            self.writes.append(("set", "access/acl", args))
+        # ACL entries are removed before anything they could refer to
+        self.removals[:0] = [("set", "access/acl", args) for args in batch_acl_changes(removed, delete=True)]
+        return results
+
+    def plan(self):
+        result = {}
+        # The order of these determines the order of the writes
+        result['pools'] = self.plan_comment_objects(self.pools, self.existing_pools, "pools", "poolid")
+        result['roles'] = self.plan_roles()
+        result['groups'] = self.plan_comment_objects(self.groups, self.existing_groups, "access/groups", "groupid")
+        result['users'] = self.plan_users()
+        result['acls'] = self.plan_acls()
+        return result
+
+    def apply(self):
+        handlers = {"create": pvesh.create, "set": pvesh.set, "delete": pvesh.delete}
+        for (handler, resource, params) in self.writes + self.removals:
+            try:
+                handlers[handler](resource, **params)
+            except ProxmoxShellError as e:
+                return "{} {}: {}".format(handler, resource, e.message)
+        return None
+
+def main():
+    # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html
+    module = PveshModule(
+        argument_spec = dict(
+            pools=dict(type='list', elements='dict', default=None, options=dict(
+                name=dict(type='str', required=True, aliases=['pool', 'poolid']),
+                state=dict(default='present', choices=['present', 'absent'], type='str'),
+                comment=dict(default=None, type='str'),
+            )),
+            roles=dict(type='list', elements='dict', default=None, options=dict(
+                name=dict(type='str', required=True, aliases=['role', 'roleid']),
+                state=dict(default='present', choices=['present', 'absent'], type='str'),
+                privileges=dict(default=None, type='list'),
+            ), required_if=[['state', 'present', ['privileges']]]),
+            groups=dict(type='list', elements='dict', default=None, options=dict(
+                name=dict(type='str', required=True, aliases=['group', 'groupid']),
+                state=dict(default='present', choices=['present', 'absent'], type='str'),
+                comment=dict(default=None, type='str'),
+            )),
+            users=dict(type='list', elements='dict', default=None, options=dict(
+                name=dict(type='str', required=True, aliases=['user', 'userid']),
+                state=dict(default='present', choices=['present', 'absent'], type='str'),
+                enable=dict(default='yes', type='bool'),
+                groups=dict(default=[], type='list'),
+                comment=dict(default=None, type='str'),
+                email=dict(default=None, type='str'),
+                firstname=dict(default=None, type='str'),
+                lastname=dict(default=None, type='str'),
+                password=dict(default=None, type='str', no_log=True),
+                expire=dict(default=0, type='int'),
+            )),
+            acls=dict(type='list', elements='dict', default=None, options=dict(
+                path=dict(type='str', required=True, aliases=['resource']),
+                roles=dict(type='list', required=True),
+                state=dict(default='present', choices=['present', 'absent'], type='str'),
+                groups=dict(default=[], type='list'),
+                users=dict(default=[], type='list'),
+                exclusive=dict(default=False, type='bool'),
+            )),
+        ),
+        supports_check_mode=True
+    )
+
+    access = ProxmoxAccess(module)
+    result = access.plan()
+    result['changed'] = bool(access.writes or access.removals)
+
+    if result['changed'] and not module.check_mode:
+        error = access.apply()
+        if error is not None:
+            module.fail_json(msg=error, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,10 @@ module: proxmox_acl
 
 short_description: Manages the Access Control List in Proxmox
 
+description:
+    - Grants roles to users and groups on a path in the Proxmox access
+      control list, or revokes them.
+
 options:
     path:
         required: true
@@ -41,6 +45,45 @@ options:
         type: list
         description:
             - Specifies a list of PVE users to apply this access control for.
+    exclusive:
+        required: false
+        default: no
+        type: bool
+        description:
+            - Removes all other access control entries for I(path), so that
+              only the given roles are granted to the given users and groups
+              on it. Only allowed with C(state=present).
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 
 author:
     - Musee Ullah (@lae)
@@ -60,14 +103,27 @@ EXAMPLES = '''
       - pveapi@pve
     groups:
       - test_users
+- name: Only allow the Admins group access to /storage
+  proxmox_acl:
+    path: /storage
+    roles: [ "PVEDatastoreAdmin" ]
+    groups: [ "Admins" ]
+    exclusive: yes
 '''
 
 RETURN = '''
+added:
+    description: ACL entries that were (or would be) added or updated.
+    type: list
+removed:
+    description: ACL entries that were (or would be) removed.
+    type: list
 '''
 
-from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pvesh import ProxmoxShellError
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
 import ansible.module_utils.pvesh as pvesh
+from ansible.module_utils.pveacl import (index_acls, expand_acl,
+                                         without_propagate, batch_acl_changes)
 
 class ProxmoxACL(object):
     def __init__(self, module):
@@ -77,106 +133,75 @@ class ProxmoxACL(object):
         self.roles = module.params['roles']
         self.groups = module.params['groups']
         self.users = module.params['users']
+        self.exclusive = module.params['exclusive']
 
         try:
-            self.existing_acl = pvesh.get("access/acl")
+            self.existing_acl = index_acls(pvesh.get("access/acl"))
         except ProxmoxShellError as e:
             self.module.fail_json(msg=e.message, status_code=e.status_code)
 
-        # PVE 5.x (unnecessarily) uses a string for this value. This ensures
-        # that it's an integer for when we compare values later.
-        for acl in self.existing_acl:
-            acl['propagate'] = int(acl['propagate'])
-
-        self.parse_acls()
-
-    def parse_acls(self):
-        constituents = []
-
-        if self.users is not None:
-            [constituents.append(["user", user]) for user in self.users]
-
-        if self.groups is not None:
-            [constituents.append(["group", group]) for group in self.groups]
-
-        self.acls = []
-        for role in self.roles:
-            for constituent in constituents:
-                self.acls.append({
-                    "path": self.path,
-                    "propagate": 1, # possibly make this configurable in the module later
-                    "roleid": role,
-                    "type": constituent[0],
-                    "ugid": constituent[1]
-                })
-
-    def exists(self):
-        for acl in self.acls:
-            if acl not in self.existing_acl:
-                return False
-
-        return True
-
-    def prepare_acl_args(self):
-        args = {}
-        args['path'] = self.path
-        args['roles'] = ','.join(self.roles)
-
-        if self.groups is not None:
-            args['groups'] = ','.join(self.groups)
-
-        if self.users is not None:
-            args['users'] = ','.join(self.users)
-
-        return args
-
-    def set_acl(self, delete=0):
-        acls = self.prepare_acl_args()
-
+        # propagate is possibly made configurable in the module later
+        self.acls = set(expand_acl(self.path, self.roles, self.users, self.groups, propagate=1))
+
+    def changes(self):
+        """Returns the ACL entries to add and to remove."""
+        if self.state == 'absent':
+            # Entries are deleted regardless of propagate
+            unwanted = without_propagate(self.acls)
+            return (set(), set(key for key in self.existing_acl if key[:4] in unwanted))
+
+        added = self.acls - self.existing_acl
+        removed = set()
+        if self.exclusive:
+            # Entries that only differ in propagate are updated by adding them
+            wanted = without_propagate(self.acls)
+            removed = set(key for key in self.existing_acl
+                          if key[0] == self.path and key[:4] not in wanted)
+        return (added, removed)
+
+    def set_acls(self, added, removed):
         try:
-            pvesh.set("access/acl", delete=delete, **acls)
+            for acls in batch_acl_changes(removed, delete=True) + batch_acl_changes(added):
+                pvesh.set("access/acl", **acls)
             return None
         except ProxmoxShellError as e:
             return e.message
 
+def acl_entries(keys):
+    return [dict(zip(["path", "type", "ugid", "roleid", "propagate"], key)) for key in sorted(keys)]
+
 def main():
     # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec = dict(
             path=dict(type='str', required=True, aliases=['resource']),
             roles=dict(type='list', required=True),
             state=dict(default='present', choices=['present', 'absent'], type='str'),
             groups=dict(default=None, type='list'),
             users=dict(default=None, type='list'),
+            exclusive=dict(default=False, type='bool'),
         ),
         required_one_of=[["groups", "users"]],
         supports_check_mode=True
     )
 
+    if module.params['exclusive'] and module.params['state'] == 'absent':
+        module.fail_json(msg="exclusive can only be used with state=present")
+
     acl = ProxmoxACL(module)
 
-    error = None
     result = {}
     result['state'] = acl.state
-    result['changed'] = False
-
-    if acl.state == 'absent':
-        if acl.exists():
-            result['changed'] = True
-            if module.check_mode:
-                module.exit_json(**result)
-
-            error = acl.set_acl(delete=1)
-    elif acl.state == 'present':
-        if not acl.exists():
-            result['changed'] = True
-            if module.check_mode:
-                module.exit_json(**result)
 
-            error = acl.set_acl()
+    (added, removed) = acl.changes()
+    result['changed'] = bool(added or removed)
+    result['added'] = acl_entries(added)
+    result['removed'] = acl_entries(removed)
 
-    if error is not None:
-        module.fail_json(path=acl.path, msg=error)
+    if result['changed'] and not module.check_mode:
+        error = acl.set_acls(added, removed)
+        if error is not None:
+            module.fail_json(path=acl.path, msg=error)
 
     module.exit_json(**result)
 
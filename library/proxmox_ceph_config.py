@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_ceph_config
+
+short_description: Manages options in the Ceph configuration database
+
+description:
+    - Compares the given options with C(ceph config dump) and only writes the
+      options that differ. Options of plain sections like C(global), C(osd)
+      or C(osd.3) are written in a single C(ceph config assimilate-conf)
+      call, while options for masked sections like C(osd/host:pve1) are set
+      one by one with C(ceph config set).
+    - Options that aren't given are left alone.
+
+options:
+    config:
+        required: false
+        type: dict
+        description:
+            - Options to set, as a dictionary of sections (who the options
+              apply to, optionally with a mask) containing dictionaries of
+              option names and values.
+    osd_memory_reserved:
+        required: false
+        type: float
+        description:
+            - When set, C(osd_memory_target) is set for the OSDs on this host
+              (the C(osd/host:<host>) section), so that they use all memory
+              except this share of it, which is left to VMs and the host.
+            - The memory is divided between the OSDs found in the ceph tags
+              of the host's logical volumes, like with M(pve_ceph_volume).
+              Nothing is set if the host has no OSDs.
+    host:
+        required: false
+        type: str
+        description:
+            - The CRUSH host name of this host, used for I(osd_memory_reserved).
+              Defaults to the short hostname.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure Ceph
+  proxmox_ceph_config:
+    config:
+      global:
+        mon_allow_pool_delete: false
+      osd:
+        osd_max_backfills: 2
+        bluestore_cache_autotune: true
+- name: Leave 60% of RAM to VMs and give the rest to OSDs
+  proxmox_ceph_config:
+    osd_memory_reserved: 0.6
+'''
+
+RETURN = '''
+updated:
+    description: The options that were changed, as section/name strings.
+    type: list
+osd_memory_target:
+    description: The osd_memory_target computed for this host, if any.
+    type: int
+'''
+
+import os
+import socket
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pveceph import CephCommandError, OSD_CACHE_PATH, ceph_command, ceph_json, cached_lvm_osds
+
+# Ceph refuses smaller values for osd_memory_target
+MIN_OSD_MEMORY_TARGET = 896 * 1024 ** 2
+# Below this, OSDs are likely to perform poorly
+LOW_OSD_MEMORY_TARGET = 2 * 1024 ** 3
+
+def option_name(name):
+    # Ceph accepts spaces and dashes in option names, but stores underscores
+    return name.replace(' ', '_').replace('-', '_')
+
+def option_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def same_value(current, wanted):
+    if current == wanted:
+        return True
+    try:
+        return float(current) == float(wanted)
+    except ValueError:
+        return False
+
+def total_memory():
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+class ProxmoxCephConfig(object):
+    def __init__(self, module):
+        self.module = module
+        self.wanted = {}
+        for section, options in (module.params['config'] or {}).items():
+            if not isinstance(options, dict):
+                self.module.fail_json(msg="Options of section {} must be a dictionary.".format(section))
+            for name, value in options.items():
+                self.wanted[(section, option_name(name))] = option_value(value)
+
+        self.osd_memory_target = None
+        if module.params['osd_memory_reserved'] is not None:
+            self.osd_memory_target = self.compute_osd_memory_target()
+            if self.osd_memory_target is not None:
+                host = module.params['host'] or socket.gethostname().split('.')[0]
+                self.wanted[("osd/host:{}".format(host), "osd_memory_target")] = str(self.osd_memory_target)
+
+    def compute_osd_memory_target(self):
+        reserved = self.module.params['osd_memory_reserved']
+        if not 0 <= reserved < 1:
+            self.module.fail_json(msg="osd_memory_reserved must be at least 0 and less than 1.")
+        try:
+            osds, _ = cached_lvm_osds(self.module, OSD_CACHE_PATH, [])
+        except (OSError, IOError, ValueError, KeyError) as e:
+            self.module.fail_json(msg="Failed to list OSDs: {}".format(e))
+        if not osds:
+            return None
+
+        target = int(total_memory() * (1 - reserved) / len(osds)) // 1024 ** 2 * 1024 ** 2
+        if target < LOW_OSD_MEMORY_TARGET:
+            self.module.warn("Only {} MiB of memory are left for each of the {} OSDs on this host."
+                             .format(target // 1024 ** 2, len(osds)))
+        return max(target, MIN_OSD_MEMORY_TARGET)
+
+    def current(self):
+        options = {}
+        for option in ceph_json(self.module, ["config", "dump"]) or []:
+            section = option['section']
+            if option.get('mask'):
+                section = "{}/{}".format(section, option['mask'])
+            options[(section, option['name'])] = option['value']
+        return options
+
+    def changes(self):
+        current = self.current()
+        return dict((key, value) for (key, value) in self.wanted.items()
+                    if key not in current or not same_value(current[key], value))
+
+    def apply(self, changes):
+        batched = dict((key, value) for (key, value) in changes.items() if "/" not in key[0])
+        if batched:
+            self.assimilate(batched)
+        for (section, name), value in sorted(changes.items()):
+            if "/" in section:
+                ceph_command(self.module, ["config", "set", section, name, value])
+
+    def assimilate(self, changes):
+        sections = {}
+        for (section, name), value in sorted(changes.items()):
+            sections.setdefault(section, []).append("{} = {}".format(name, value))
+
+        directory = tempfile.mkdtemp()
+        conf = os.path.join(directory, "ceph.conf")
+        leftover = os.path.join(directory, "leftover.conf")
+        try:
+            with open(conf, "w") as f:
+                for section, lines in sections.items():
+                    f.write("[{}]\n{}\n".format(section, "\n".join(lines)))
+            ceph_command(self.module, ["config", "assimilate-conf", "-i", conf, "-o", leftover])
+            # Options which can't be stored in the configuration database are
+            # returned instead of being set
+            with open(leftover) as f:
+                rejected = [line.strip() for line in f
+                            if "=" in line and not line.strip().startswith(("#", ";"))]
+            if rejected:
+                raise CephCommandError(["ceph", "config", "assimilate-conf"], 0,
+                                       "options not stored in the configuration database: {}"
+                                       .format(", ".join(rejected)))
+        finally:
+            for path in [conf, leftover]:
+                if os.path.exists(path):
+                    os.unlink(path)
+            os.rmdir(directory)
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            config=dict(type='dict', default=None),
+            osd_memory_reserved=dict(type='float', default=None),
+            host=dict(type='str', default=None),
+        ),
+        supports_check_mode=True
+    )
+
+    config = ProxmoxCephConfig(module)
+    try:
+        changes = config.changes()
+        result = {
+            'changed': bool(changes),
+            'updated': ["{}/{}".format(section, name) for (section, name) in sorted(changes)],
+        }
+        if config.osd_memory_target is not None:
+            result['osd_memory_target'] = config.osd_memory_target
+        if changes and not module.check_mode:
+            config.apply(changes)
+    except CephCommandError as e:
+        module.fail_json(msg=e.message)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_ceph_crush_rule
+
+short_description: Creates and updates replicated Ceph CRUSH rules
+
+description:
+    - Compares the output of C(ceph osd crush rule dump) with the given rules
+      and only creates or replaces the rules that differ, without fetching
+      or uploading the whole CRUSH map.
+    - CRUSH rules can't be modified in place. A rule that differs is replaced
+      by moving the pools using it to a temporary rule with the new
+      definition, recreating the rule, and moving the pools back. The rule
+      keeps its ID unless a lower ID is free, so the rule new pools default
+      to doesn't change.
+    - C(min_size) and C(max_size) only exist in releases before Quincy. If
+      they differ, they're changed by editing the decompiled CRUSH map.
+
+options:
+    rules:
+        required: true
+        type: list
+        description:
+            - Rules to manage, each with a C(name), the failure domain
+              C(type) (default C(host)), an optional device C(class), the
+              C(root) to choose from (default C(default)), and optionally
+              C(min_size) and C(max_size).
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure CRUSH rules
+  proxmox_ceph_crush_rule:
+    rules:
+      - name: replicated_rule
+        type: osd
+      - name: ssd
+        class: ssd
+'''
+
+RETURN = '''
+rules:
+    description: For each rule, its name, whether it was created or changed
+                 and which fields were updated.
+    type: list
+'''
+
+import os
+import re
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pveceph import CephCommandError, ceph_command, ceph_json
+
+# What "ceph osd crush rule create-replicated" sets min_size and max_size to
+DEFAULT_SIZES = {'min_size': 1, 'max_size': 10}
+
+def rule_definition(rule):
+    """Returns the root, device class and failure domain of a replicated rule."""
+    take = [step for step in rule['steps'] if step['op'] == 'take']
+    choose = [step for step in rule['steps'] if step['op'].startswith('choose')]
+    if len(take) != 1 or len(choose) != 1:
+        return None
+    root, _, device_class = take[0]['item_name'].partition('~')
+    return {'root': root, 'class': device_class or None, 'type': choose[0]['type']}
+
+class ProxmoxCephCrushRules(object):
+    def __init__(self, module):
+        self.module = module
+        self.rules = module.params['rules']
+        self.commands = []
+        self.size_changes = {}
+
+        try:
+            self.existing = dict((rule['rule_name'], rule)
+                                 for rule in ceph_json(module, ["osd", "crush", "rule", "dump"]) or [])
+        except CephCommandError as e:
+            self.module.fail_json(msg=e.message)
+        # Releases since Quincy don't have rule sizes anymore
+        self.has_sizes = any('min_size' in rule for rule in self.existing.values())
+        self.pools = None
+
+    def pools_using(self, rule_id):
+        if self.pools is None:
+            self.pools = ceph_json(self.module, ["osd", "pool", "ls", "detail"]) or []
+        return [pool['pool_name'] for pool in self.pools if pool['crush_rule'] == rule_id]
+
+    def create_args(self, name, rule):
+        args = ["osd", "crush", "rule", "create-replicated", name, rule['root'], rule['type']]
+        if rule['class']:
+            args.append(rule['class'])
+        return args
+
+    def replace(self, rule, current):
+        temporary = "{}-ansible-tmp".format(rule['name'])
+        pools = self.pools_using(current['rule_id'])
+        if pools:
+            self.commands.append(self.create_args(temporary, rule))
+            for pool in pools:
+                self.commands.append(["osd", "pool", "set", pool, "crush_rule", temporary])
+        self.commands.append(["osd", "crush", "rule", "rm", rule['name']])
+        self.commands.append(self.create_args(rule['name'], rule))
+        if pools:
+            for pool in pools:
+                self.commands.append(["osd", "pool", "set", pool, "crush_rule", rule['name']])
+            self.commands.append(["osd", "crush", "rule", "rm", temporary])
+
+    def plan(self):
+        results = []
+        for rule in self.rules:
+            result = {'name': rule['name'], 'changed': False, 'created': False}
+            current = self.existing.get(rule['name'])
+            wanted = dict((key, rule[key]) for key in ['root', 'class', 'type'])
+            if current is None:
+                result['changed'] = result['created'] = True
+                self.commands.append(self.create_args(rule['name'], rule))
+                current_sizes = DEFAULT_SIZES
+            else:
+                if current['type'] != 1:
+                    self.module.fail_json(msg="CRUSH rule {} is not a replicated rule.".format(rule['name']))
+                definition = rule_definition(current)
+                updated_fields = sorted(key for key in wanted
+                                        if definition is None or definition[key] != wanted[key])
+                if updated_fields:
+                    try:
+                        self.replace(rule, current)
+                    except CephCommandError as e:
+                        self.module.fail_json(msg=e.message)
+                    current_sizes = DEFAULT_SIZES
+                else:
+                    current_sizes = current
+                result['updated_fields'] = updated_fields
+
+            if self.has_sizes:
+                sizes = dict((key, rule[key]) for key in DEFAULT_SIZES
+                             if rule[key] is not None and rule[key] != current_sizes.get(key))
+                if sizes:
+                    self.size_changes[rule['name']] = sizes
+                    result.setdefault('updated_fields', []).extend(sorted(sizes))
+
+            if result.get('updated_fields'):
+                result['changed'] = True
+            else:
+                result.pop('updated_fields', None)
+            results.append(result)
+        return results
+
+    def set_sizes(self):
+        """Changes rule sizes, which no ceph command can do, in the CRUSH map."""
+        directory = tempfile.mkdtemp()
+        compiled = os.path.join(directory, "crush_map")
+        decompiled = os.path.join(directory, "crush_map.txt")
+        try:
+            ceph_command(self.module, ["osd", "getcrushmap", "-o", compiled])
+            ceph_command(self.module, ["-d", compiled, "-o", decompiled], binary="crushtool")
+            with open(decompiled) as f:
+                crush_map = f.read()
+            for name, sizes in self.size_changes.items():
+                match = re.search(r"^rule {} {{\n(.*?)^}}".format(re.escape(name)), crush_map, re.M | re.S)
+                if match is None:
+                    raise CephCommandError(["crushtool", "-d"], 0, "rule {} not found in the CRUSH map".format(name))
+                body = match.group(1)
+                for key, value in sizes.items():
+                    body = re.sub(r"^(\s*{})\s+\d+$".format(key), r"\g<1> {}".format(value), body, flags=re.M)
+                crush_map = crush_map[:match.start(1)] + body + crush_map[match.end(1):]
+            with open(decompiled, "w") as f:
+                f.write(crush_map)
+            ceph_command(self.module, ["-c", decompiled, "-o", compiled], binary="crushtool")
+            ceph_command(self.module, ["osd", "setcrushmap", "-i", compiled])
+        finally:
+            for path in [compiled, decompiled]:
+                if os.path.exists(path):
+                    os.unlink(path)
+            os.rmdir(directory)
+
+    def apply(self):
+        try:
+            for args in self.commands:
+                ceph_command(self.module, args)
+            if self.size_changes:
+                self.set_sizes()
+        except CephCommandError as e:
+            return e.message
+        return None
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            rules=dict(type='list', elements='dict', required=True, options={
+                'name': dict(type='str', required=True),
+                'type': dict(type='str', default='host'),
+                'class': dict(type='str'),
+                'root': dict(type='str', default='default'),
+                'min_size': dict(type='int', aliases=['min-size']),
+                'max_size': dict(type='int', aliases=['max-size']),
+            }),
+        ),
+        supports_check_mode=True
+    )
+    rules = ProxmoxCephCrushRules(module)
+    result = {'rules': rules.plan()}
+    result['changed'] = bool(rules.commands or rules.size_changes)
+
+    if result['changed'] and not module.check_mode:
+        error = rules.apply()
+        if error is not None:
+            module.fail_json(msg=error, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
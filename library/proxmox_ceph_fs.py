@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_ceph_fs
+
+short_description: Creates and configures CephFS filesystems
+
+description:
+    - Reads all filesystems with C(ceph fs dump) and all pools with
+      C(ceph osd pool ls detail) once, creates missing filesystems with
+      C(pveceph fs create) and only changes the CRUSH rules of their pools
+      and the filesystem settings that differ.
+    - The pools of a filesystem are found from the filesystem itself, so
+      this also works for pools which weren't named by pveceph.
+
+options:
+    filesystems:
+        required: true
+        type: list
+        description:
+            - Filesystems to manage, each with a C(name) and optionally
+              C(pgs), C(storage), the C(rule) of its data and metadata pools,
+              C(max_mds) and C(standby_replay).
+            - C(pgs) and C(storage) are only used when the filesystem is
+              created. C(mountpoint) is accepted but ignored, as it's used by
+              the role to mount the filesystem.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure CephFS
+  proxmox_ceph_fs:
+    filesystems:
+      - name: backup
+        pgs: 64
+        rule: hdd
+        storage: false
+        max_mds: 2
+        standby_replay: true
+'''
+
+RETURN = '''
+filesystems:
+    description: For each filesystem, its name, whether it was created or
+                 changed and which settings were updated.
+    type: list
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pveceph import (CephCommandError, apply_with_second_pass, ceph_command,
+                                          ceph_json, crush_rule_ids)
+
+# CEPH_MDSMAP_ALLOW_STANDBY_REPLAY, for releases whose fs dump doesn't have
+# flags_state yet
+ALLOW_STANDBY_REPLAY = 1 << 5
+
+def standby_replay(mdsmap):
+    if 'flags_state' in mdsmap:
+        return mdsmap['flags_state'].get('allow_standby_replay', False)
+    return bool(mdsmap.get('flags', 0) & ALLOW_STANDBY_REPLAY)
+
+class ProxmoxCephFilesystems(object):
+    def __init__(self, module):
+        self.module = module
+        self.filesystems = module.params['filesystems']
+        self.commands = []
+
+        try:
+            self.read_state()
+            rules = [fs['rule'] for fs in self.filesystems if fs['rule'] is not None]
+            self.rule_ids = crush_rule_ids(module) if rules else {}
+        except CephCommandError as e:
+            self.module.fail_json(msg=e.message)
+
+        for rule in rules:
+            if rule not in self.rule_ids:
+                self.module.fail_json(msg="CRUSH rule {} does not exist.".format(rule))
+
+    def read_state(self):
+        fs_dump = ceph_json(self.module, ["fs", "dump"]) or {}
+        self.existing = dict((fs['mdsmap']['fs_name'], fs['mdsmap'])
+                             for fs in fs_dump.get('filesystems', []))
+        self.pools = dict((pool['pool_id'], pool)
+                          for pool in ceph_json(self.module, ["osd", "pool", "ls", "detail"]) or [])
+
+    def create_args(self, fs):
+        args = ["fs", "create", "--name", fs['name']]
+        if fs['storage'] is not None:
+            args += ["--add-storage", int(fs['storage'])]
+        if fs['pgs'] is not None:
+            args += ["--pg_num", fs['pgs']]
+        return args
+
+    def diff_fs(self, fs):
+        """Returns the commands needed to apply the wanted settings to a filesystem."""
+        mdsmap = self.existing[fs['name']]
+        changes = []
+        if fs['rule'] is not None:
+            for pool_id in [mdsmap['metadata_pool']] + mdsmap['data_pools']:
+                pool = self.pools[pool_id]
+                if pool['crush_rule'] != self.rule_ids[fs['rule']]:
+                    changes.append(("{}.crush_rule".format(pool['pool_name']),
+                                    ["osd", "pool", "set", pool['pool_name'], "crush_rule", fs['rule']]))
+        if fs['max_mds'] is not None and fs['max_mds'] != mdsmap['max_mds']:
+            changes.append(("max_mds", ["fs", "set", fs['name'], "max_mds", fs['max_mds']]))
+        if fs['standby_replay'] is not None and fs['standby_replay'] != standby_replay(mdsmap):
+            changes.append(("standby_replay", ["fs", "set", fs['name'], "allow_standby_replay",
+                                               str(fs['standby_replay']).lower()]))
+        return changes
+
+    def plan(self, filesystems):
+        results = []
+        for fs in filesystems:
+            result = {'name': fs['name'], 'changed': False, 'created': False}
+            if fs['name'] not in self.existing:
+                result['changed'] = result['created'] = True
+                self.commands.append(("pveceph", self.create_args(fs)))
+            else:
+                changes = self.diff_fs(fs)
+                if changes:
+                    result['changed'] = True
+                    result['updated_fields'] = [field for (field, _) in changes]
+                    self.commands.extend(("ceph", args) for (_, args) in changes)
+            results.append(result)
+        return results
+
+    def apply(self):
+        try:
+            for (binary, args) in self.commands:
+                ceph_command(self.module, args, binary=binary)
+        except CephCommandError as e:
+            return e.message
+        return None
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            filesystems=dict(type='list', elements='dict', required=True, options=dict(
+                name=dict(type='str', required=True),
+                pgs=dict(type='int'),
+                storage=dict(type='bool'),
+                rule=dict(type='str'),
+                max_mds=dict(type='int'),
+                standby_replay=dict(type='bool'),
+                mountpoint=dict(type='str'),
+            )),
+        ),
+        supports_check_mode=True
+    )
+
+    filesystems = ProxmoxCephFilesystems(module)
+    result = {'filesystems': filesystems.plan(filesystems.filesystems)}
+    result['changed'] = bool(filesystems.commands)
+
+    if result['changed'] and not module.check_mode:
+        # The rules and settings of new filesystems are applied once pveceph
+        # has created them
+        error = apply_with_second_pass(filesystems, filesystems.filesystems, result['filesystems'])
+        if error is not None:
+            module.fail_json(msg=error, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
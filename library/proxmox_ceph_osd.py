@@ -0,0 +1,508 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_ceph_osd
+
+short_description: Creates Ceph OSDs in parallel
+
+description:
+    - Creates an OSD for each device that isn't already used by one. Existing
+      OSDs are found from the C(ceph.*) tags of the host's logical volumes,
+      the same way as M(pve_ceph_volume) does.
+    - C(pveceph osd create) holds a host-wide lock while creating an OSD, so
+      this module prepares devices itself the way pveceph does and runs
+      C(ceph-volume lvm create) for up to I(concurrency) devices at a time.
+      It takes the same lock once for the whole run, so that disk operations
+      started from the web interface or the API wait for it (or fail)
+      instead of racing with it.
+    - If creating an OSD fails, the C(block.db) and C(block.wal) volumes
+      (and volume groups) created for it are removed again.
+    - OSDs that share a C(block.db) or C(block.wal) device are created one
+      after the other, since logical volumes for all of them are carved out
+      of that device.
+    - Progress of each device is appended to I(progress_file) while the
+      module runs, and the time taken by each step is returned.
+    - The planned size of every block.db and block.wal volume is returned
+      as I(layout), also in check mode.
+
+options:
+    osds:
+        required: true
+        type: list
+        description:
+            - OSDs to create, each with a C(device) and optionally
+              C(encrypted), C(crush.device.class), C(block.db) and
+              C(block.wal).
+            - If C(block.db) or C(block.wal) is a whole disk, a logical
+              volume of C(db_size) or C(wal_size) GiB is created on it. A
+              partition is used as is.
+            - C(wal_size) defaults to 1% of the OSD's device, like with
+              pveceph. Without C(db_size), the space of a C(block.db)
+              device that isn't taken by volumes of a fixed size is split
+              evenly between all OSDs given for it, including existing
+              ones, so that OSDs added later get the same size. The module
+              fails without creating anything if the new volumes don't fit
+              into the free space of the device.
+    concurrency:
+        required: false
+        default: 4
+        type: int
+        description:
+            - How many OSDs are created at the same time.
+    progress_file:
+        required: false
+        default: /var/log/pve-ceph-osd-create.log
+        type: path
+        description:
+            - File the progress of each device is appended to. Use
+              C(tail -f) on it to follow a long-running creation.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Create Ceph OSDs
+  proxmox_ceph_osd:
+    concurrency: 8
+    osds:
+      - device: /dev/sdc
+      - device: /dev/sdd
+        block.db: /dev/nvme0n1
+      - device: /dev/sde
+        block.db: /dev/nvme0n1
+        encrypted: true
+'''
+
+RETURN = '''
+osds:
+    description: For each OSD that was or would be created, its device, the
+                 OSD ID, its status and how many seconds each step took.
+    type: list
+skipped:
+    description: Devices which already hold an OSD.
+    type: list
+layout:
+    description: For each block.db and block.wal device used by new OSDs, its
+                 usable and free bytes, and the volumes planned on it with
+                 their size in bytes.
+    type: list
+'''
+
+import datetime
+import fcntl
+import os
+import re
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils._text import to_text
+from ansible.module_utils.pveceph import (CephCommandError, OSD_CACHE_PATH,
+                                          ceph_command, cached_lvm_osds)
+
+BOOTSTRAP_KEYRING = "/var/lib/ceph/bootstrap-osd/ceph.keyring"
+# Lock PVE::Diskmanage takes for disk operations, including pveceph osd create
+DISK_LOCK_FILE = "/run/lock/pve-diskmanage.lck"
+DISK_LOCK_TIMEOUT = 60
+# How much of the device pveceph wipes before creating an OSD
+WIPE_SIZE_MIB = 200
+GIB = 1024 ** 3
+# Default LVM extent size, and the space LVM keeps for metadata at the start
+# of a physical volume
+EXTENT_SIZE = 4 * 1024 ** 2
+PV_METADATA_SIZE = 1024 ** 2
+# Share of the OSD's device used for block.wal by default, as with pveceph
+WAL_SHARE = 0.01
+# Below this share of the OSD's device, BlueStore metadata is likely to spill
+# over from block.db to the slow device
+MIN_DB_SHARE = 0.01
+
+def device_name(path):
+    return os.path.basename(os.path.realpath(path))
+
+def device_size(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+
+def is_partition(path):
+    return os.path.exists("/sys/class/block/{}/partition".format(device_name(path)))
+
+def has_children(path):
+    """Returns whether any partition or device mapper device uses the device."""
+    name = device_name(path)
+    sys_path = "/sys/class/block/{}".format(name)
+    if os.listdir(os.path.join(sys_path, "holders")):
+        return True
+    return any(entry.startswith(name) for entry in os.listdir(sys_path))
+
+class OsdFailed(Exception):
+    def __init__(self, message):
+        self.message = message
+
+class ProxmoxCephOsds(object):
+    def __init__(self, module):
+        self.module = module
+        self.concurrency = max(1, module.params['concurrency'])
+        self.progress_file = module.params['progress_file']
+        self.progress_lock = threading.Lock()
+        self.binaries = {}
+
+        try:
+            existing, _ = cached_lvm_osds(module, OSD_CACHE_PATH, [])
+        except (OSError, IOError, ValueError, KeyError) as e:
+            self.module.fail_json(msg="Failed to list existing OSDs: {}".format(e))
+        self.existing = set(os.path.realpath(device)
+                            for volumes in existing.values() for volume in volumes
+                            for device in volume['devices'])
+
+        self.osds = []
+        self.skipped = []
+        for osd in module.params['osds']:
+            if os.path.realpath(osd['device']) in self.existing:
+                self.skipped.append(osd['device'])
+            else:
+                self.osds.append(osd)
+        self.validate()
+
+        if self.osds:
+            for name in ["ceph-volume", "wipefs", "dd", "blkid", "pvs", "vgs", "vgcreate", "lvcreate",
+                         "lvremove", "vgremove"]:
+                self.binaries[name] = self.module.get_bin_path(name, required=True)
+        self.volume_sizes = {}
+        self.layout = self.plan_fast_devices()
+
+    def fast_devices(self, osd):
+        return [os.path.realpath(osd[key]) for key in ['block.db', 'block.wal'] if osd[key]]
+
+    def validate(self):
+        devices = [os.path.realpath(osd['device']) for osd in self.osds]
+        fast_devices = set(device for osd in self.osds for device in self.fast_devices(osd))
+        for osd, device in zip(self.osds, devices):
+            if devices.count(device) > 1:
+                self.module.fail_json(msg="Device {} is listed more than once.".format(osd['device']))
+            if device in fast_devices:
+                self.module.fail_json(msg="Device {} is used both for an OSD and for block.db/block.wal."
+                                      .format(osd['device']))
+
+    def chains(self):
+        """Groups OSDs which have to be created one after the other.
+
+        OSDs sharing a block.db or block.wal device end up in the same group,
+        which may span several shared devices.
+        """
+        parent = list(range(len(self.osds)))
+
+        def find(index):
+            while parent[index] != index:
+                index = parent[index]
+            return index
+
+        first_user = {}
+        for index, osd in enumerate(self.osds):
+            for device in self.fast_devices(osd):
+                if device in first_user:
+                    parent[find(index)] = find(first_user[device])
+                else:
+                    first_user[device] = index
+
+        chains = {}
+        for index, osd in enumerate(self.osds):
+            chains.setdefault(find(index), []).append(osd)
+        # Longer chains first, so that they don't end up running alone at the end
+        return sorted(chains.values(), key=len, reverse=True)
+
+    def data_size(self, osd):
+        try:
+            return device_size(osd['device'])
+        except OSError as e:
+            self.module.fail_json(msg="Can't read the size of {}: {}".format(osd['device'], e))
+
+    def fast_device_space(self, device):
+        """Returns the usable and free bytes of a block.db/block.wal device."""
+        vg_name = self.volume_group(device)
+        if not vg_name:
+            usable = (device_size(device) - PV_METADATA_SIZE) // EXTENT_SIZE * EXTENT_SIZE
+            return usable, usable
+        if not vg_name.startswith("ceph-"):
+            self.module.fail_json(msg="{} is used by volume group {}".format(device, vg_name))
+        output = self.run("vgs", ["--noheadings", "--units", "b", "--nosuffix",
+                                  "-o", "vg_size,vg_free", vg_name])
+        usable, free = output.split()
+        return int(usable), int(free)
+
+    def plan_fast_devices(self):
+        """Sizes the block.db and block.wal volumes of new OSDs."""
+        volumes_per_device = {}
+        for osd in self.module.params['osds']:
+            for key in ['block.db', 'block.wal']:
+                if osd[key]:
+                    volumes_per_device.setdefault(os.path.realpath(osd[key]), []).append((osd, key))
+
+        layout = []
+        for device, volumes in sorted(volumes_per_device.items()):
+            new_volumes = [(osd, key) for (osd, key) in volumes if osd in self.osds]
+            if not new_volumes:
+                continue
+            if not os.path.exists(device):
+                self.module.fail_json(msg="{} does not exist".format(device))
+            if is_partition(device):
+                if len(volumes) > 1:
+                    self.module.fail_json(msg="Partition {} can only hold a single block.db or block.wal."
+                                          .format(device))
+                continue
+
+            try:
+                usable, free = self.fast_device_space(device)
+            except (OsdFailed, OSError) as e:
+                self.module.fail_json(msg=getattr(e, 'message', None) or str(e))
+            sizes = []
+            for (osd, key) in volumes:
+                size_key = 'db_size' if key == 'block.db' else 'wal_size'
+                if osd[size_key]:
+                    sizes.append(int(osd[size_key] * GIB) // EXTENT_SIZE * EXTENT_SIZE)
+                elif key == 'block.wal':
+                    sizes.append(int(self.data_size(osd) * WAL_SHARE) // EXTENT_SIZE * EXTENT_SIZE)
+                else:
+                    sizes.append(None)
+            automatic = sizes.count(None)
+            if automatic:
+                slot = (usable - sum(size for size in sizes if size)) // automatic // EXTENT_SIZE * EXTENT_SIZE
+                sizes = [slot if size is None else size for size in sizes]
+
+            planned = {'device': device, 'usable': usable, 'free': free, 'volumes': []}
+            for (osd, key), size in zip(volumes, sizes):
+                if osd in self.osds:
+                    planned['volumes'].append({'osd': osd['device'], 'type': key, 'size': size})
+                    self.volume_sizes[(osd['device'], key)] = size
+            layout.append(planned)
+
+            needed = sum(volume['size'] for volume in planned['volumes'])
+            if needed > free or any(volume['size'] <= 0 for volume in planned['volumes']):
+                self.module.fail_json(msg="The block.db/block.wal volumes planned on {} need {} bytes, "
+                                      "but only {} are free.".format(device, needed, free), layout=layout)
+            for volume in planned['volumes']:
+                osd = [osd for osd in self.osds if osd['device'] == volume['osd']][0]
+                if volume['type'] == 'block.db' and volume['size'] < self.data_size(osd) * MIN_DB_SHARE:
+                    self.module.warn("block.db of {} on {} is smaller than {:.0%} of the OSD, so metadata is "
+                                     "likely to spill over to the slow device.".format(osd['device'], device, MIN_DB_SHARE))
+        return layout
+
+    def progress(self, device, message):
+        line = "{} {}: {}".format(datetime.datetime.now().isoformat(), device, message)
+        with self.progress_lock:
+            self.module.log(line)
+            try:
+                with open(self.progress_file, "a") as f:
+                    f.write(line + "\n")
+            except (OSError, IOError):
+                pass
+
+    def run(self, name, args):
+        cmd = [self.binaries[name]] + [str(arg) for arg in args]
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=dict(os.environ, LC_ALL="C"))
+        if process.returncode != 0:
+            raise OsdFailed("{} failed: {}".format(" ".join(cmd), to_text(process.stderr).strip()))
+        return to_text(process.stdout) + to_text(process.stderr)
+
+    def prepare(self):
+        """Looks up what creating OSDs needs once, before starting to do so."""
+        try:
+            self.fsid = ceph_command(self.module, ["fsid"]).strip()
+            if not os.path.exists(BOOTSTRAP_KEYRING):
+                ceph_command(self.module, ["auth", "get", "client.bootstrap-osd", "-o", BOOTSTRAP_KEYRING])
+        except CephCommandError as e:
+            self.module.fail_json(msg=e.message)
+
+    def fast_volume(self, osd, key, created):
+        """Returns the block.db or block.wal argument of ceph-volume for an OSD.
+
+        The volume groups and logical volumes it creates are appended to
+        created, so that they can be removed if the OSD fails.
+        """
+        device = osd[key]
+        if is_partition(device):
+            return device
+        size = self.volume_sizes[(osd['device'], key)]
+
+        # Like pveceph, use the ceph volume group on the device or create one
+        vg_name = self.volume_group(device)
+        if not vg_name:
+            if vg_name is None and (has_children(device) or self.has_signature(device)):
+                raise OsdFailed("{} is in use".format(device))
+            vg_name = "ceph-{}".format(uuid.uuid4())
+            self.run("vgcreate", [vg_name, device])
+            created.append(("vgremove", vg_name))
+        elif not vg_name.startswith("ceph-"):
+            raise OsdFailed("{} is used by volume group {}".format(device, vg_name))
+        lv_name = "osd-{}-{}".format(key.split(".")[1], uuid.uuid4())
+        self.run("lvcreate", ["-n", lv_name, "-L", "{}b".format(size), "-y", vg_name])
+        created.append(("lvremove", "{}/{}".format(vg_name, lv_name)))
+        return "{}/{}".format(vg_name, lv_name)
+
+    def roll_back(self, created):
+        """Removes the volumes and volume groups created for a failed OSD."""
+        errors = []
+        for (name, target) in reversed(created):
+            try:
+                self.run(name, ["-y", target] if name == "lvremove" else [target])
+            except OsdFailed as e:
+                errors.append(e.message)
+        if errors:
+            raise OsdFailed("; ".join(errors))
+
+    def volume_group(self, device):
+        """Returns the volume group on a device, or None if it isn't a physical volume."""
+        process = subprocess.run([self.binaries["pvs"], "--noheadings", "-o", "vg_name", device],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            return None
+        return to_text(process.stdout).strip()
+
+    def has_signature(self, device):
+        # blkid exits with 2 if it doesn't find any filesystem, RAID or
+        # partition table signature
+        process = subprocess.run([self.binaries["blkid"], "-p", device],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return process.returncode != 2
+
+    def create(self, osd):
+        device = osd['device']
+        result = {'device': device, 'status': 'failed', 'steps': {}}
+        started = time.time()
+        created = []
+
+        def step(name, function, *args):
+            self.progress(device, name)
+            step_started = time.time()
+            value = function(*args)
+            result['steps'][name] = round(time.time() - step_started, 3)
+            return value
+
+        try:
+            if not os.path.exists(device):
+                raise OsdFailed("{} does not exist".format(device))
+            if has_children(device) or self.has_signature(device):
+                raise OsdFailed("{} is in use".format(device))
+
+            args = ["lvm", "create", "--cluster-fsid", self.fsid, "--data", device]
+            if osd['encrypted']:
+                args.append("--dmcrypt")
+            if osd['crush.device.class']:
+                args += ["--crush-device-class", osd['crush.device.class']]
+            for key in ['block.db', 'block.wal']:
+                if osd[key]:
+                    args += ["--{}".format(key), step("create {}".format(key), self.fast_volume, osd, key, created)]
+
+            step("wipe", self.wipe, device)
+            output = step("ceph-volume lvm create", self.run, "ceph-volume", args)
+            match = re.search(r"ceph-osd@(\d+)", output)
+            result['osd_id'] = int(match.group(1)) if match else None
+            result['status'] = 'created'
+            self.progress(device, "created osd.{}".format(result['osd_id']))
+        except (OsdFailed, OSError) as e:
+            result['msg'] = getattr(e, 'message', None) or str(e)
+            self.progress(device, "failed: {}".format(result['msg']))
+            if created:
+                try:
+                    step("roll back", self.roll_back, created)
+                except OsdFailed as e:
+                    result['msg'] += "; failed to remove {}: {}".format(
+                        ", ".join(target for (_, target) in created), e.message)
+                    self.progress(device, "roll back failed: {}".format(e.message))
+        result['seconds'] = round(time.time() - started, 3)
+        return result
+
+    def wipe(self, device):
+        self.run("wipefs", ["-a", device])
+        self.run("dd", ["if=/dev/zero", "of={}".format(device), "bs=1M",
+                        "count={}".format(WIPE_SIZE_MIB), "conv=fdatasync"])
+
+    def create_chain(self, chain):
+        results = []
+        for osd in chain:
+            results.append(self.create(osd))
+        return results
+
+    def disk_lock(self):
+        """Takes PVE's disk lock, waiting for running disk operations to finish."""
+        fd = os.open(DISK_LOCK_FILE, os.O_WRONLY | os.O_CREAT, 0o644)
+        deadline = time.monotonic() + DISK_LOCK_TIMEOUT
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except (OSError, IOError):
+                if time.monotonic() >= deadline:
+                    os.close(fd)
+                    self.module.fail_json(msg="Timed out waiting for {}".format(DISK_LOCK_FILE))
+                time.sleep(1)
+
+    def create_all(self):
+        self.prepare()
+        chains = self.chains()
+        # Held by this process for all of the workers, closing it unlocks it
+        lock = self.disk_lock()
+        try:
+            self.progress("-", "creating {} OSDs, {} at a time".format(len(self.osds), self.concurrency))
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                finished = list(executor.map(self.create_chain, chains))
+        finally:
+            os.close(lock)
+        results = dict((result['device'], result) for chain in finished for result in chain)
+        # Report in the order OSDs were given
+        return [results[osd['device']] for osd in self.osds]
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            osds=dict(type='list', elements='dict', required=True, options={
+                'device': dict(type='str', required=True),
+                'encrypted': dict(type='bool', default=False),
+                'crush.device.class': dict(type='str'),
+                'block.db': dict(type='str'),
+                'block.wal': dict(type='str'),
+                'db_size': dict(type='float'),
+                'wal_size': dict(type='float'),
+            }),
+            concurrency=dict(type='int', default=4),
+            progress_file=dict(type='path', default='/var/log/pve-ceph-osd-create.log'),
+        ),
+        supports_check_mode=True
+    )
+
+    osds = ProxmoxCephOsds(module)
+    result = {'skipped': osds.skipped, 'changed': bool(osds.osds), 'layout': osds.layout}
+
+    if module.check_mode:
+        result['osds'] = [{'device': osd['device'], 'status': 'planned', 'chain': index}
+                          for index, chain in enumerate(osds.chains()) for osd in chain]
+        module.exit_json(**result)
+
+    if osds.osds:
+        result['osds'] = osds.create_all()
+        result['changed'] = any(osd['status'] == 'created' for osd in result['osds'])
+        failed = [osd['device'] for osd in result['osds'] if osd['status'] == 'failed']
+        if failed:
+            module.fail_json(msg="Failed to create OSDs on {}".format(", ".join(failed)), **result)
+    else:
+        result['osds'] = []
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
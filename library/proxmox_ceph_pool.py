@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_ceph_pool
+
+short_description: Creates and updates Ceph pools
+
+description:
+    - Reads all pools with C(ceph osd pool ls detail) once, creates missing
+      pools with C(pveceph pool create) and sets only the properties that
+      differ on existing ones.
+    - Erasure coded pools consist of a C(<name>-data) and a
+      C(<name>-metadata) pool. C(size), C(min_size) and C(rule) apply to the
+      replicated metadata pool, while C(pgs) and the target size apply to the
+      data pool.
+    - Pools are never deleted, and C(pgs) is not enforced on pools whose
+      C(autoscale_mode) is C(on).
+    - When C(application) is set, any other application enabled on the pool
+      is disabled.
+
+options:
+    pools:
+        required: true
+        type: list
+        description:
+            - Pools to manage, each with a C(name) and optionally C(size),
+              C(min_size), C(pgs), C(rule), C(autoscale_mode),
+              C(application), C(target_size_ratio), C(target_size_bytes),
+              C(storage), C(protection_strategy), C(k) and C(m).
+            - C(storage) and the erasure coding options are only used when
+              the pool is created.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure Ceph pools
+  proxmox_ceph_pool:
+    pools:
+      - name: vm-storage
+        rule: replicated_rule
+        application: rbd
+        autoscale_mode: "on"
+        target_size_ratio: 0.8
+        storage: true
+      - name: backups
+        size: 2
+        min_size: 1
+        pgs: 32
+'''
+
+RETURN = '''
+pools:
+    description: For each pool, its name, whether it was created or changed
+                 and which properties were updated.
+    type: list
+'''
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pveceph import (CephCommandError, apply_with_second_pass, ceph_command,
+                                          ceph_json, crush_rule_ids)
+
+class ProxmoxCephPools(object):
+    def __init__(self, module):
+        self.module = module
+        self.pools = module.params['pools']
+        self.commands = []
+
+        try:
+            self.read_state()
+            rules = [pool['rule'] for pool in self.pools if pool['rule'] is not None]
+            self.rule_ids = crush_rule_ids(module) if rules else {}
+        except CephCommandError as e:
+            self.module.fail_json(msg=e.message)
+
+        for rule in rules:
+            if rule not in self.rule_ids:
+                self.module.fail_json(msg="CRUSH rule {} does not exist.".format(rule))
+
+    def read_state(self):
+        self.existing = dict((pool['pool_name'], pool)
+                             for pool in ceph_json(self.module, ["osd", "pool", "ls", "detail"]) or [])
+
+    def erasure_coded(self, pool):
+        return pool['protection_strategy'] == 'erasure-coding'
+
+    def exists(self, pool):
+        if self.erasure_coded(pool):
+            return "{}-data".format(pool['name']) in self.existing
+        return pool['name'] in self.existing
+
+    def create_args(self, pool):
+        args = ["pool", "create", pool['name']]
+        if pool['storage'] is not None:
+            args += ["--add_storages", int(pool['storage'])]
+        if pool['application'] is not None:
+            args += ["--application", pool['application']]
+        if pool['rule'] is not None:
+            args += ["--crush_rule", pool['rule']]
+        if pool['autoscale_mode'] is not None:
+            args += ["--pg_autoscale_mode", pool['autoscale_mode']]
+        if pool['pgs'] is not None:
+            args += ["--pg_num", pool['pgs']]
+        if pool['size'] is not None:
+            args += ["--size", pool['size']]
+        if pool['min_size'] is not None:
+            args += ["--min_size", pool['min_size']]
+        if self.erasure_coded(pool):
+            args += ["--erasure-coding", "k={},m={}".format(pool['k'], pool['m'])]
+        return args
+
+    def wanted_properties(self, pool):
+        """Returns the Ceph pools making up an entry and their wanted properties."""
+        common = {
+            'pg_autoscale_mode': pool['autoscale_mode'],
+            'application': pool['application'],
+        }
+        replication = {
+            'size': pool['size'],
+            'min_size': pool['min_size'],
+            'crush_rule': pool['rule'],
+        }
+        placement = {
+            'pg_num': pool['pgs'],
+            'target_size_ratio': pool['target_size_ratio'],
+            'target_size_bytes': pool['target_size_bytes'],
+        }
+        if self.erasure_coded(pool):
+            targets = [("{}-data".format(pool['name']), dict(common, **placement)),
+                       ("{}-metadata".format(pool['name']), dict(common, **replication))]
+        else:
+            targets = [(pool['name'], dict(common, **dict(replication, **placement)))]
+        return [(name, dict((key, value) for (key, value) in properties.items() if value is not None))
+                for (name, properties) in targets]
+
+    def diff_pool(self, name, wanted):
+        """Returns the changed properties of a pool and the commands to apply them."""
+        current = self.existing.get(name)
+        if current is None:
+            return []
+
+        changes = []
+        autoscale_mode = wanted.get('pg_autoscale_mode', current.get('pg_autoscale_mode'))
+        options = current.get('options') or {}
+        for key, value in sorted(wanted.items()):
+            if key == 'application':
+                # Ceph refuses to enable a second application without being
+                # forced to, so any other application is disabled first
+                enabled = sorted(current.get('application_metadata') or {})
+                changes.extend((key, ["osd", "pool", "application", "disable", name, application,
+                                      "--yes-i-really-mean-it"])
+                               for application in enabled if application != value)
+                if value not in enabled:
+                    changes.append((key, ["osd", "pool", "application", "enable", name, value]))
+                continue
+            elif key == 'crush_rule':
+                differs = self.rule_ids[value] != current['crush_rule']
+            elif key == 'pg_num':
+                # The autoscaler manages pg_num itself, and pg_num only moves
+                # towards pg_num_target gradually
+                differs = (autoscale_mode != 'on' and
+                           value != current.get('pg_num_target', current['pg_num']))
+            elif key == 'target_size_ratio':
+                differs = abs(value - float(options.get(key, 0))) > 1e-9
+            elif key == 'target_size_bytes':
+                differs = value != int(options.get(key, 0))
+            else:
+                differs = value != current.get(key)
+            if differs:
+                changes.append((key, ["osd", "pool", "set", name, key, value]))
+        return changes
+
+    def plan(self, pools):
+        results = []
+        for pool in pools:
+            result = {'name': pool['name'], 'changed': False, 'created': False}
+            if not self.exists(pool):
+                result['changed'] = result['created'] = True
+                self.commands.append(("pveceph", self.create_args(pool)))
+            else:
+                updated_fields = []
+                for (name, wanted) in self.wanted_properties(pool):
+                    for key, args in self.diff_pool(name, wanted):
+                        field = "{}.{}".format(name, key) if name != pool['name'] else key
+                        if field not in updated_fields:
+                            updated_fields.append(field)
+                        self.commands.append(("ceph", args))
+                if updated_fields:
+                    result['changed'] = True
+                    result['updated_fields'] = updated_fields
+            results.append(result)
+        return results
+
+    def apply(self):
+        try:
+            for (binary, args) in self.commands:
+                ceph_command(self.module, args, binary=binary)
+        except CephCommandError as e:
+            return e.message
+        return None
+
+def main():
+    module = AnsibleModule(
+        argument_spec = dict(
+            pools=dict(type='list', elements='dict', required=True, options=dict(
+                name=dict(type='str', required=True),
+                size=dict(type='int'),
+                min_size=dict(type='int', aliases=['min-size']),
+                pgs=dict(type='int'),
+                rule=dict(type='str'),
+                autoscale_mode=dict(type='str', choices=['on', 'off', 'warn']),
+                application=dict(type='str', choices=['rbd', 'cephfs', 'rgw']),
+                target_size_ratio=dict(type='float'),
+                target_size_bytes=dict(type='int'),
+                storage=dict(type='bool'),
+                protection_strategy=dict(type='str', default='replicated',
+                                         choices=['replicated', 'erasure-coding']),
+                k=dict(type='int'),
+                m=dict(type='int'),
+            ), required_if=[['protection_strategy', 'erasure-coding', ['k', 'm']]]),
+        ),
+        supports_check_mode=True
+    )
+
+    pools = ProxmoxCephPools(module)
+    result = {'pools': pools.plan(pools.pools)}
+    result['changed'] = bool(pools.commands)
+
+    if result['changed'] and not module.check_mode:
+        # Properties which pveceph pool create doesn't set, like the target
+        # size, are applied to the new pools in a second pass
+        error = apply_with_second_pass(pools, pools.pools, result['pools'])
+        if error is not None:
+            module.fail_json(msg=error, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
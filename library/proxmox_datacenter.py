@@ -0,0 +1,203 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_datacenter
+
+short_description: Manages options in datacenter.cfg
+
+description:
+    - Compares the given options with the ones in datacenter.cfg and only
+      sets the ones that differ through C(cluster/options). Options that
+      aren't given, e.g. ones set through the web UI, are left alone.
+    - Options holding property strings, like C(migration) or C(bwlimit), are
+      compared and merged per property. They can be given as a dictionary or
+      as a property string, and properties that aren't given are kept.
+
+options:
+    config:
+        required: true
+        type: dict
+        description:
+            - Options to set in datacenter.cfg.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure migrations
+  proxmox_datacenter:
+    config:
+      keyboard: en-us
+      migration:
+        type: insecure
+        network: 10.10.10.0/24
+      bwlimit: migration=512000
+'''
+
+RETURN = '''
+updated_fields:
+    description: Options that were modified, with the modified property for
+                 property strings (e.g. C(migration.network)).
+    type: list
+'''
+
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+import ansible.module_utils.pmxcfs as pmxcfs
+import ansible.module_utils.pvesh as pvesh
+
+# Options of datacenter.cfg that hold property strings
+PROPERTY_STRING_OPTIONS = [
+    "bwlimit", "crs", "ha", "migration", "next-id", "notify", "replication",
+    "tag-style", "u2f", "user-tag-access", "webauthn",
+]
+# Properties which can be given without their key
+DEFAULT_KEYS = {
+    "migration": "type",
+}
+
+def normalize_value(value):
+    if isinstance(value, bool):
+        value = int(value)
+    return str(value)
+
+def parse_property_string(option, value):
+    """Returns the properties of a property string as a list of (key, value)."""
+    if isinstance(value, dict):
+        return [(key, normalize_value(item)) for (key, item) in value.items()]
+    properties = []
+    for part in normalize_value(value).split(","):
+        if not part:
+            continue
+        key, sep, item = part.partition("=")
+        if not sep:
+            if option not in DEFAULT_KEYS:
+                return None
+            key, item = DEFAULT_KEYS[option], part
+        properties.append((key, item))
+    return properties
+
+def format_property_string(properties):
+    return ",".join("{}={}".format(key, value) for (key, value) in properties)
+
+class ProxmoxDatacenter(object):
+    def __init__(self, module):
+        self.module = module
+        self.config = module.params['config']
+
+        try:
+            self.current = self.read_options()
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
+
+    def read_options(self):
+        if pvesh.env_bool("PVESH_LOCAL_READS", True):
+            options = pmxcfs.read_datacenter_config()
+            if options is not None:
+                return options
+        # The API returns some property strings already parsed
+        return pvesh.get("cluster/options") or {}
+
+    def merge_property_string(self, option, wanted):
+        """Returns the merged property string and the properties that differ."""
+        wanted_properties = parse_property_string(option, wanted)
+        current_properties = parse_property_string(option, self.current.get(option, ""))
+        if wanted_properties is None or current_properties is None:
+            return None
+
+        merged = list(current_properties)
+        updated = []
+        for key, value in wanted_properties:
+            current = dict(merged).get(key)
+            if current == value:
+                continue
+            updated.append("{}.{}".format(option, key))
+            if current is None:
+                merged.append((key, value))
+            else:
+                merged = [(k, value if k == key else v) for (k, v) in merged]
+        return (format_property_string(merged), updated)
+
+    def changes(self):
+        """Returns the options to set and the fields they update."""
+        changes = {}
+        updated_fields = []
+        for option, wanted in self.config.items():
+            if option in PROPERTY_STRING_OPTIONS or isinstance(wanted, dict):
+                merged = self.merge_property_string(option, wanted)
+                if merged is not None:
+                    if merged[1]:
+                        changes[option] = merged[0]
+                        updated_fields.extend(merged[1])
+                    continue
+                if isinstance(wanted, dict):
+                    self.module.fail_json(msg="Can't merge the properties of option {}.".format(option))
+
+            # Values that can't be merged are compared as a whole
+            if option not in self.current or normalize_value(self.current[option]) != normalize_value(wanted):
+                changes[option] = normalize_value(wanted)
+                updated_fields.append(option)
+        return (changes, sorted(updated_fields))
+
+def main():
+    # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html#/cluster/options
+    module = PveshModule(
+        argument_spec = dict(
+            config=dict(type='dict', required=True),
+        ),
+        supports_check_mode=True
+    )
+
+    datacenter = ProxmoxDatacenter(module)
+    (changes, updated_fields) = datacenter.changes()
+    result = {'changed': bool(changes), 'updated_fields': updated_fields}
+
+    if changes and not module.check_mode:
+        try:
+            pvesh.set("cluster/options", **changes)
+        except ProxmoxShellError as e:
+            module.fail_json(msg=e.message, status_code=e.status_code, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
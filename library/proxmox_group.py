@@ -13,6 +13,9 @@ module: proxmox_group
 
 short_description: Manages groups in Proxmox
 
+description:
+    - Creates, updates and removes groups in Proxmox.
+
 options:
     name:
         required: true
@@ -29,6 +32,37 @@ options:
         required: false
         description:
             - Optionally sets the group's comment in PVE.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 
 author:
     - Musee Ullah (@lae)
@@ -53,9 +87,8 @@ group:
     type: json
 '''
 
-from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_text
-from ansible.module_utils.pvesh import ProxmoxShellError
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
 import ansible.module_utils.pvesh as pvesh
 
 class ProxmoxGroup(object):
@@ -120,7 +153,7 @@ class ProxmoxGroup(object):
 
 def main():
     # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec = dict(
             name=dict(type='str', required=True, aliases=['group', 'groupid']),
             state=dict(default='present', choices=['present', 'absent'], type='str'),
@@ -0,0 +1,285 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_ha
+
+short_description: Manages HA groups and resources in Proxmox in bulk
+
+description:
+    - Reads C(cluster/ha/groups) and C(cluster/ha/resources) once, and
+      issues at most one create or update per group and per resource with
+      all of the fields that differ.
+    - Groups are created and updated before resources, and unmanaged
+      resources are removed before unmanaged groups, so that resources can
+      be moved to new groups and groups can be removed once they're unused.
+
+options:
+    groups:
+        required: false
+        type: list
+        description:
+            - HA groups to manage, each with a C(name), C(nodes) (a list or
+              comma separated string of nodes, each optionally with a
+              C(:priority)), and optionally C(comment), C(nofailback) and
+              C(restricted).
+    resources:
+        required: false
+        type: list
+        description:
+            - HA resources to manage, each with a C(sid) (e.g. C(vm:100) or
+              C(ct:101), a plain VMID meaning a VM), and optionally C(state),
+              C(group), C(max_restart), C(max_relocate) and C(comment).
+              Fields that aren't given aren't compared.
+    exclusive_groups:
+        required: false
+        type: bool
+        default: false
+        description:
+            - Whether to remove HA groups that aren't given.
+    exclusive_resources:
+        required: false
+        type: bool
+        default: false
+        description:
+            - Whether to remove HA resources that aren't given.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure HA
+  proxmox_ha:
+    groups:
+      - name: lab_node01
+        comment: My HA group
+        nodes: lab-node01
+        nofailback: 0
+        restricted: 0
+    resources:
+      - sid: vm:100
+        group: lab_node01
+        max_restart: 2
+'''
+
+RETURN = '''
+groups:
+    description: For each group, its name, whether it was created, changed
+                 or removed and which fields were updated.
+    type: list
+resources:
+    description: For each resource, its sid, whether it was created, changed
+                 or removed and which fields were updated.
+    type: list
+'''
+
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+import ansible.module_utils.pvesh as pvesh
+
+# Values PVE uses for fields that aren't set
+GROUP_DEFAULTS = {"comment": "", "nofailback": 0, "restricted": 0}
+RESOURCE_DEFAULTS = {"state": "started", "max_restart": 1, "max_relocate": 1, "group": "", "comment": ""}
+# States PVE accepts but stores under another name
+STATE_ALIASES = {"enabled": "started"}
+
+def normalize_nodes(nodes):
+    if isinstance(nodes, list):
+        nodes = ",".join(str(node) for node in nodes)
+    return sorted(node.strip() for node in (nodes or "").split(",") if node.strip())
+
+def normalize_sid(sid):
+    sid = str(sid)
+    return "vm:{}".format(sid) if sid.isdigit() else sid
+
+def normalize_value(value):
+    if isinstance(value, bool):
+        value = int(value)
+    return str(value)
+
+def diff_fields(current, wanted, defaults):
+    return dict((key, value) for (key, value) in wanted.items()
+                if normalize_value(current.get(key, defaults.get(key, ""))) != value)
+
+def set_args(changes):
+    # Options are cleared with delete, an empty value isn't accepted by PVE
+    args = dict((key, value) for (key, value) in changes.items() if value != "")
+    cleared = sorted(key for (key, value) in changes.items() if value == "")
+    if cleared:
+        args['delete'] = ",".join(cleared)
+    return args
+
+def create_args(wanted):
+    return dict((key, value) for (key, value) in wanted.items() if value != "")
+
+class ProxmoxHA(object):
+    def __init__(self, module):
+        self.module = module
+        self.groups = module.params['groups']
+        self.resources = module.params['resources']
+        self.commands = []
+        self.removals = []
+
+        try:
+            self.existing_groups = {}
+            if self.groups is not None or module.params['exclusive_groups']:
+                self.existing_groups = dict((group['group'], group)
+                                            for group in pvesh.get("cluster/ha/groups") or [])
+            self.existing_resources = {}
+            if self.resources is not None or module.params['exclusive_resources']:
+                self.existing_resources = dict((resource['sid'], resource)
+                                               for resource in pvesh.get("cluster/ha/resources") or [])
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
+
+    def plan_groups(self):
+        results = []
+        for group in self.groups or []:
+            result = {'name': group['name'], 'changed': False, 'created': False}
+            wanted = dict((key, normalize_value(group[key])) for key in GROUP_DEFAULTS
+                          if group[key] is not None)
+            wanted_nodes = normalize_nodes(group['nodes'])
+            current = self.existing_groups.get(group['name'])
+
+            if current is None:
+                result['changed'] = result['created'] = True
+                self.commands.append(("create", "cluster/ha/groups",
+                                      dict(create_args(wanted), group=group['name'], nodes=",".join(wanted_nodes))))
+            else:
+                changes = diff_fields(current, wanted, GROUP_DEFAULTS)
+                if normalize_nodes(current.get('nodes')) != wanted_nodes:
+                    changes['nodes'] = ",".join(wanted_nodes)
+                if changes:
+                    result['changed'] = True
+                    result['updated_fields'] = sorted(changes)
+                    self.commands.append(("set", "cluster/ha/groups/{}".format(group['name']), set_args(changes)))
+            results.append(result)
+
+        if self.module.params['exclusive_groups']:
+            wanted = [group['name'] for group in self.groups or []]
+            for name in sorted(self.existing_groups):
+                if name not in wanted:
+                    results.append({'name': name, 'changed': True, 'created': False, 'removed': True})
+                    self.removals.append(("delete", "cluster/ha/groups/{}".format(name), {}))
+        return results
+
+    def plan_resources(self):
+        results = []
+        for resource in self.resources or []:
+            sid = normalize_sid(resource['sid'])
+            result = {'sid': sid, 'changed': False, 'created': False}
+            wanted = dict((key, normalize_value(resource[key])) for key in RESOURCE_DEFAULTS
+                          if resource[key] is not None)
+            if 'state' in wanted:
+                wanted['state'] = STATE_ALIASES.get(wanted['state'], wanted['state'])
+            current = self.existing_resources.get(sid)
+
+            if current is None:
+                result['changed'] = result['created'] = True
+                self.commands.append(("create", "cluster/ha/resources", dict(create_args(wanted), sid=sid)))
+            else:
+                changes = diff_fields(current, wanted, RESOURCE_DEFAULTS)
+                if changes:
+                    result['changed'] = True
+                    result['updated_fields'] = sorted(changes)
+                    self.commands.append(("set", "cluster/ha/resources/{}".format(sid), set_args(changes)))
+            results.append(result)
+
+        if self.module.params['exclusive_resources']:
+            wanted = [normalize_sid(resource['sid']) for resource in self.resources or []]
+            for sid in sorted(self.existing_resources):
+                if sid not in wanted:
+                    results.append({'sid': sid, 'changed': True, 'created': False, 'removed': True})
+                    # Resources have to be removed before the groups they use
+                    self.removals.insert(0, ("delete", "cluster/ha/resources/{}".format(sid), {}))
+        return results
+
+    def apply(self):
+        try:
+            for (handler, resource, params) in self.commands + self.removals:
+                if handler == "create":
+                    pvesh.create(resource, **params)
+                elif handler == "set":
+                    pvesh.set(resource, **params)
+                else:
+                    pvesh.delete(resource)
+        except ProxmoxShellError as e:
+            return e.message
+        return None
+
+def main():
+    # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html#/cluster/ha
+    module = PveshModule(
+        argument_spec = dict(
+            groups=dict(type='list', elements='dict', default=None, options=dict(
+                name=dict(type='str', required=True, aliases=['group']),
+                nodes=dict(type='raw', required=True),
+                comment=dict(type='str'),
+                nofailback=dict(type='bool'),
+                restricted=dict(type='bool'),
+            )),
+            resources=dict(type='list', elements='dict', default=None, options=dict(
+                sid=dict(type='str', required=True),
+                state=dict(type='str', choices=['started', 'stopped', 'enabled', 'disabled', 'ignored']),
+                group=dict(type='str'),
+                max_restart=dict(type='int'),
+                max_relocate=dict(type='int'),
+                comment=dict(type='str'),
+            )),
+            exclusive_groups=dict(type='bool', default=False),
+            exclusive_resources=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True
+    )
+
+    ha = ProxmoxHA(module)
+    result = {'groups': ha.plan_groups(), 'resources': ha.plan_resources()}
+    result['changed'] = bool(ha.commands or ha.removals)
+
+    if result['changed'] and not module.check_mode:
+        error = ha.apply()
+        if error is not None:
+            module.fail_json(msg=error, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,8 @@ DOCUMENTATION = """
 ---
 module: proxmox_metric_server
 short_description: Manages the Metric Server in Proxmox
+description:
+    - Creates, updates and removes external metric servers in Proxmox.
 options:
     id:
         required: true
@@ -39,8 +41,8 @@ options:
         choices: [ "udp", "tcp", "http", "https" ]
         description:
             - Protocol used to send metrics.
-            - "http" and "https" are only available for "influxdb" type and using http v2 api.
-            - "tcp" is only available for "graphite" type.
+            - C(http) and C(https) are only available for the C(influxdb) type and using http v2 api.
+            - C(tcp) is only available for the C(graphite) type.
     disable:
         type: bool
         default: false
@@ -62,6 +64,15 @@ options:
             - The InfluxDB access token.
             - Only necessary when using the http v2 api.
             - If the v2 compatibility api is used, use 'user:password' instead.
+    update_token:
+        type: str
+        default: "on_create"
+        choices: [ "always", "on_create" ]
+        description:
+            - PVE never returns the token, so it can't be compared with the
+              one that is stored. C(on_create) only sets it when the server is
+              created, C(always) sets it on every run (which always reports a
+              change).
     path:
         type: str
         description:
@@ -99,6 +110,37 @@ options:
         choices: [ "present", "absent" ]
         description:
             - Whether the server should exist or not.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 
 author:
     - ThysTips (@thystips)
@@ -118,14 +160,37 @@ EXAMPLES = """
 """
 
 RETURN = """
+updated_fields:
+    description: Fields that were modified for an existing server
+    type: list
 """
 
-from ansible.module_utils.basic import AnsibleModule  # noqa: E402
-from ansible.module_utils._text import to_text  # noqa: E402, F401
-from ansible.module_utils.pvesh import ProxmoxShellError  # type: ignore # noqa: E402
+from ansible.module_utils._text import to_text  # noqa: E402
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule  # type: ignore # noqa: E402
 import ansible.module_utils.pvesh as pvesh  # type: ignore # noqa: E402
 
 
+# Values PVE uses for properties that aren't set in status.cfg
+PROPERTY_DEFAULTS = {
+    "disable": 0,
+    "proto": "udp",
+    "influxdbproto": "udp",
+    "verify-certificate": 1,
+}
+
+
+def normalize_value(value):
+    # The API returns numbers and booleans as integers, while they may be
+    # strings elsewhere.
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, list):
+        return ",".join(sorted(value))
+    if isinstance(value, str):
+        return int(value) if value.lstrip("-").isdigit() else to_text(value)
+    return value
+
+
 class ProxmoxMetricServer(object):
     def __init__(self, module):
         self.module = module
@@ -145,6 +210,7 @@ class ProxmoxMetricServer(object):
         self.mtu = module.params["mtu"]
         self.verify_certificate = module.params["verify_certificate"]
         self.state = module.params["state"]
+        self.update_token = module.params["update_token"]
 
         try:
             self.existing_servers = pvesh.get("cluster/metrics/server")
@@ -161,14 +227,12 @@ class ProxmoxMetricServer(object):
         )
 
     def lookup(self):
-        return next(
-            (
-                {"id": existing_servers.get("id")}
-                for existing_servers in self.existing_servers
-                if existing_servers.get("id") == self.id
-            ),
-            None,
-        )
+        if not self.exists():
+            return None
+        try:
+            return pvesh.get(f"cluster/metrics/server/{self.id}")
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
 
     def exists(self):
         return self.id in self.servers
@@ -219,24 +283,22 @@ class ProxmoxMetricServer(object):
             return (False, e.message)
 
     def modify_server(self):
-        existing_servers = self.lookup()
-        modified_server = self.prepare_server_args(create=False)
-        updated_fields = []
+        existing_server = self.lookup() or {}
+        staged_server = self.prepare_server_args(create=False)
+        modified_server = {}
         error = None
 
-        for key in modified_server:
-            if key not in existing_servers:  # type: ignore
-                updated_fields.append(key)
-            else:
-                new_value = modified_server.get(key)
-                old_value = existing_servers.get(key)  # type: ignore
-                if isinstance(old_value, list):
-                    old_value = ",".join(sorted(old_value))
-                if isinstance(new_value, list):
-                    new_value = ",".join(sorted(new_value))
+        for key, new_value in staged_server.items():
+            if key == "token":
+                # Write-only, see update_token
+                if self.update_token == "always":
+                    modified_server[key] = new_value
+                continue
 
-                if new_value != old_value:
-                    updated_fields.append(key)
+            old_value = existing_server.get(key, PROPERTY_DEFAULTS.get(key))
+            if normalize_value(new_value) != normalize_value(old_value):
+                modified_server[key] = new_value
+        updated_fields = list(modified_server)
 
         if self.module.check_mode:
             self.module.exit_json(
@@ -277,10 +339,11 @@ def main():
         max_body_size=dict(type="bytes"),
         mtu=dict(type="int"),
         verify_certificate=dict(type="bool"),
+        update_token=dict(type="str", default="on_create", choices=["always", "on_create"]),
         state=dict(default="present", choices=["present", "absent"], type="str"),
     )
 
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec=module_args,
         supports_check_mode=True,
         required_if=[
@@ -0,0 +1,332 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_node_maintenance
+
+short_description: Drains a PVE node before a reboot and brings it back after
+
+description:
+    - With C(state=present), puts the node into HA maintenance mode if the
+      cluster has HA resources, so that the HA manager moves them away, and
+      migrates its other running guests to I(migration_target) in parallel. With I(ceph), the
+      OSDs of the node are flagged C(noout) so that Ceph doesn't start
+      rebalancing while it reboots. Waits until the guests being moved have
+      left the node.
+    - With C(state=absent), waits until the node is back in a quorate
+      cluster, pveproxy answers and, with I(ceph), the OSDs of the node are
+      up and no placement group is inactive or degraded, before removing the
+      C(noout) flag and taking the node out of maintenance mode.
+    - Whether this module put the node into maintenance mode is kept in
+      C(/var/lib/ansible-pve-node-maintenance), so that it's taken out again
+      even if the HA manager hasn't reported the node as in maintenance yet,
+      e.g. because no CRM is master after the reboot.
+    - Must be run on the node itself.
+
+options:
+    state:
+        required: false
+        default: "present"
+        choices: [ "present", "absent" ]
+        description:
+            - Whether the node should be in maintenance mode.
+    node:
+        required: false
+        type: str
+        description:
+            - Name of the node. Defaults to the short hostname.
+    migration_target:
+        required: false
+        type: str
+        description:
+            - Node to migrate running guests which aren't HA resources to.
+              They're left alone if not given.
+    max_workers:
+        required: false
+        type: int
+        default: 4
+        description:
+            - How many guests to migrate at the same time.
+    ceph:
+        required: false
+        type: bool
+        default: false
+        description:
+            - Whether the node runs Ceph OSDs. Ignored until Ceph has been
+              initialized.
+    timeout:
+        required: false
+        type: int
+        default: 900
+        description:
+            - Seconds to wait for the node to be drained or ready.
+    fail_on_running_guests:
+        required: false
+        type: bool
+        default: false
+        description:
+            - Whether to fail if guests that are being moved are still running
+              on the node after I(timeout), instead of leaving them to be shut
+              down by the reboot.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Drain node
+  proxmox_node_maintenance:
+    migration_target: pve02
+    ceph: true
+- name: Reboot node
+  ansible.builtin.reboot:
+- name: Wait for the node and undrain it
+  proxmox_node_maintenance:
+    state: absent
+    ceph: true
+'''
+
+RETURN = '''
+running_guests:
+    description: Guests still running on the node after it was drained,
+                 which the reboot will shut down.
+    type: list
+'''
+
+import os
+import socket
+import ssl
+import time
+
+import http.client as http_client
+
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+from ansible.module_utils.pveceph import CephCommandError, ceph_command, ceph_json
+import ansible.module_utils.pvesh as pvesh
+
+CEPH_CONF_PATH = "/etc/pve/ceph.conf"
+# Outside of /run, since it has to outlast the reboot
+MAINTENANCE_MARKER = "/var/lib/ansible-pve-node-maintenance"
+PVEPROXY_PORT = 8006
+POLL_INTERVAL = 5
+# Placement group states in which some data has fewer copies than it should
+DEGRADED_PG_STATES = ["degraded", "undersized", "down", "incomplete", "stale", "peering"]
+
+class ProxmoxNodeMaintenance(object):
+    def __init__(self, module):
+        self.module = module
+        self.node = module.params['node'] or socket.gethostname().split('.')[0]
+        self.ceph = module.params['ceph'] and os.path.exists(CEPH_CONF_PATH)
+        self.deadline = time.monotonic() + module.params['timeout']
+
+    def wait(self, description, ready, fail=True):
+        """Polls ready until it returns True, or fails once the timeout is over."""
+        while not ready():
+            if time.monotonic() >= self.deadline:
+                if fail:
+                    self.module.fail_json(msg="Timed out waiting for {}.".format(description))
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def in_maintenance(self):
+        status = pvesh.get("cluster/ha/status/manager_status") or {}
+        node_status = status.get('manager_status', {}).get('node_status', {})
+        return node_status.get(self.node) == 'maintenance'
+
+    def maintenance_requested(self):
+        # The manager status lags behind, and is empty while no CRM is master
+        return os.path.exists(MAINTENANCE_MARKER) or self.in_maintenance()
+
+    def noout(self):
+        # set-group flags are kept per CRUSH node in the OSD map
+        osd_map = ceph_json(self.module, ["osd", "dump"]) or {}
+        return "noout" in osd_map.get('crush_node_flags', {}).get(self.node, [])
+
+    def ha_manager(self, action):
+        if action == "enable":
+            # Created first, so that a disable follows even if this fails
+            # after the HA manager got the command
+            with open(MAINTENANCE_MARKER, "w") as f:
+                f.write(self.node + "\n")
+        self.module.run_command(["ha-manager", "crm-command", "node-maintenance", action, self.node],
+                                check_rc=True)
+        if action == "disable" and os.path.exists(MAINTENANCE_MARKER):
+            os.unlink(MAINTENANCE_MARKER)
+
+    def running_guests(self):
+        guests = []
+        for guest_type in ["qemu", "lxc"]:
+            for guest in pvesh.get("nodes/{}/{}".format(self.node, guest_type)) or []:
+                if guest.get('status') == 'running':
+                    guests.append("{}:{}".format("vm" if guest_type == "qemu" else "ct", guest['vmid']))
+        return sorted(guests)
+
+    def ha_resources(self):
+        # The HA manager leaves ignored resources alone
+        return [resource['sid'] for resource in pvesh.get("cluster/ha/resources") or []
+                if resource.get('state') != 'ignored']
+
+    def drain(self):
+        changed = False
+        if self.ceph and not self.noout():
+            changed = True
+            ceph_command(self.module, ["osd", "set-group", "noout", self.node])
+
+        ha_resources = self.ha_resources()
+        if ha_resources and not self.maintenance_requested():
+            changed = True
+            self.ha_manager("enable")
+
+        target = self.module.params['migration_target']
+        running = self.running_guests()
+        leaving = [guest for guest in running if guest in ha_resources]
+        others = [guest for guest in running if guest not in ha_resources]
+        if target and others:
+            changed = True
+            # Migrates the guests in parallel and waits for all of them
+            pvesh.run_task("nodes/{}/migrateall".format(self.node), target=target,
+                           maxworkers=self.module.params['max_workers'],
+                           vms=",".join(guest.split(":")[1] for guest in others))
+            leaving += others
+
+        # Guests which aren't moved are shut down by the reboot
+        remaining = []
+        def drained():
+            remaining[:] = [guest for guest in self.running_guests() if guest in leaving]
+            return not remaining
+        if not self.wait("guests to leave {}".format(self.node), drained,
+                         fail=self.module.params['fail_on_running_guests']):
+            self.module.warn("Guests {} are still running on {}.".format(", ".join(remaining), self.node))
+        return changed, sorted(set(remaining) | set(guest for guest in running if guest not in leaving))
+
+    def pveproxy_ready(self):
+        # Any response means pveproxy is up, the certificate doesn't matter
+        connection = http_client.HTTPSConnection("127.0.0.1", PVEPROXY_PORT, timeout=POLL_INTERVAL,
+                                                 context=ssl._create_unverified_context())
+        try:
+            connection.request("GET", "/")
+            connection.getresponse()
+            return True
+        except (socket.error, ssl.SSLError, http_client.HTTPException):
+            return False
+        finally:
+            connection.close()
+
+    def cluster_ready(self):
+        try:
+            status = pvesh.get("cluster/status") or []
+        except ProxmoxShellError:
+            return False
+        cluster = [entry for entry in status if entry['type'] == 'cluster']
+        node = [entry for entry in status if entry['type'] == 'node' and entry['name'] == self.node]
+        return (not cluster or bool(cluster[0].get('quorate'))) and bool(node and node[0].get('online'))
+
+    def ceph_ready(self):
+        try:
+            tree = ceph_json(self.module, ["osd", "tree"]) or {}
+            status = ceph_json(self.module, ["pg", "stat"]) or {}
+        except CephCommandError:
+            return False
+        hosts = [item for item in tree.get('nodes', []) if item['type'] == 'host' and item['name'] == self.node]
+        osds = hosts[0].get('children', []) if hosts else []
+        if any(item['status'] != 'up' for item in tree.get('nodes', []) if item['id'] in osds):
+            return False
+        # Older releases return the summary nested in pg_summary
+        states = status.get('pg_summary', status).get('num_pg_by_state', [])
+        return all('active' in state['name'] and
+                   not any(degraded in state['name'] for degraded in DEGRADED_PG_STATES)
+                   for state in states)
+
+    def undrain(self):
+        changed = False
+        self.wait("pveproxy to answer on {}".format(self.node), self.pveproxy_ready)
+        self.wait("{} to join a quorate cluster".format(self.node), self.cluster_ready)
+        if self.ceph:
+            self.wait("the OSDs of {} and all placement groups to be active and clean".format(self.node),
+                      self.ceph_ready)
+            if self.noout():
+                changed = True
+                ceph_command(self.module, ["osd", "unset-group", "noout", self.node])
+
+        if self.maintenance_requested():
+            changed = True
+            self.ha_manager("disable")
+        return changed
+
+def main():
+    module = PveshModule(
+        argument_spec = dict(
+            state=dict(default='present', choices=['present', 'absent'], type='str'),
+            node=dict(type='str', default=None),
+            migration_target=dict(type='str', default=None),
+            max_workers=dict(type='int', default=4),
+            ceph=dict(type='bool', default=False),
+            timeout=dict(type='int', default=900),
+            fail_on_running_guests=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True
+    )
+
+    maintenance = ProxmoxNodeMaintenance(module)
+    result = {'node': maintenance.node}
+
+    try:
+        if module.check_mode:
+            if module.params['state'] == 'present':
+                result['changed'] = ((bool(maintenance.ha_resources()) and not maintenance.maintenance_requested()) or
+                                     (maintenance.ceph and not maintenance.noout()))
+            else:
+                result['changed'] = (maintenance.maintenance_requested() or
+                                     (maintenance.ceph and maintenance.noout()))
+        elif module.params['state'] == 'present':
+            result['changed'], result['running_guests'] = maintenance.drain()
+        else:
+            result['changed'] = maintenance.undrain()
+    except ProxmoxShellError as e:
+        module.fail_json(msg=e.message, status_code=e.status_code, **result)
+    except CephCommandError as e:
+        module.fail_json(msg=e.message, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
@@ -12,12 +12,46 @@ module: proxmox_query
 
 short_description: Uses pvesh to query Proxmox API
 
+description:
+    - Runs a GET against the Proxmox API and returns the response.
+
 options:
     query:
         required: true
         aliases: [ "name" ]
         description:
             - Specifies what resource to query
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 
 author:
     - Musee Ullah (@lae)
@@ -42,12 +76,11 @@ response:
     type: json
 '''
 
-from ansible.module_utils.basic import AnsibleModule
-from ansible.module_utils.pvesh import ProxmoxShellError
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
 import ansible.module_utils.pvesh as pvesh
 
 def main():
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec = dict(
             query=dict(type='str', required=True, aliases=['name']),
         ),
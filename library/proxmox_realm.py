@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_realm
+
+short_description: Manages authentication realms in Proxmox in bulk
+
+description:
+    - Compares the realms defined in domains.cfg with the given ones, per
+      realm and per attribute, and only creates, updates or removes what
+      differs through the C(access/domains) API. Attributes of a realm that
+      aren't given are removed from it.
+    - The bind password of LDAP and AD realms is given as the
+      C(bind_password) attribute. It's compared with the one stored in
+      C(/etc/pve/priv/realm/<realm>.pw) when that file can be read, and set
+      on every run otherwise.
+
+options:
+    realms:
+        required: true
+        type: list
+        description:
+            - Realms to manage, each with a C(name), C(type) and a dictionary
+              of C(attributes) as found in domains.cfg. C(sync) and
+              C(sync_options) are accepted but ignored, as they're used by
+              the role to sync the realm with M(proxmox_realm_sync).
+    exclusive:
+        required: false
+        type: bool
+        default: false
+        description:
+            - Whether to remove realms that aren't given. The built-in C(pam)
+              and C(pve) realms are never removed.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Configure realms
+  proxmox_realm:
+    realms:
+      - name: ldap
+        type: ldap
+        attributes:
+          comment: LDAP authentication
+          base_dn: CN=Users,dc=yourdomain,dc=com
+          bind_dn: "uid=svc-reader,CN=Users,dc=yourdomain,dc=com"
+          bind_password: "{{ secret_ldap_svc_reader_password }}"
+          server1: ldap1.yourdomain.com
+          user_attr: uid
+'''
+
+RETURN = '''
+realms:
+    description: For each realm, its name, whether it was created, changed
+                 or removed and which attributes were updated.
+    type: list
+'''
+
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+import ansible.module_utils.pmxcfs as pmxcfs
+import ansible.module_utils.pvesh as pvesh
+
+BUILTIN_REALMS = ["pam", "pve"]
+# Returned by the API, but not part of a realm's configuration
+READ_ONLY_ATTRIBUTES = ["type", "digest"]
+
+def normalize_value(value):
+    if isinstance(value, bool):
+        value = int(value)
+    return str(value)
+
+class ProxmoxRealms(object):
+    def __init__(self, module):
+        self.module = module
+        self.realms = module.params['realms']
+        self.commands = []
+
+        for realm in self.realms:
+            password = (realm['attributes'] or {}).get('bind_password')
+            if password is not None:
+                self.module.no_log_values.add(str(password))
+
+        try:
+            self.existing = dict((realm['realm'], realm) for realm in pvesh.get("access/domains") or [])
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
+
+    def lookup(self, name):
+        try:
+            return pvesh.get("access/domains/{}".format(name)) or {}
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
+
+    def password_differs(self, name, password):
+        current = pmxcfs.read_file("priv/realm/{}.pw".format(name))
+        return current is None or current.strip() != str(password)
+
+    def diff_realm(self, realm, attributes, password):
+        """Returns the parameters needed to update a realm and the attributes they change."""
+        current = self.lookup(realm['name'])
+        current_type = current.get('type', self.existing[realm['name']]['type'])
+        if current_type != realm['type']:
+            self.module.fail_json(msg="Realm {} is of type {}, and its type can't be changed.".format(
+                realm['name'], current_type))
+
+        changes = dict((key, value) for (key, value) in attributes.items()
+                       if key not in current or normalize_value(current[key]) != value)
+        updated_fields = list(changes)
+        removed = sorted(key for key in current
+                         if key not in attributes and key not in READ_ONLY_ATTRIBUTES)
+        if removed:
+            changes['delete'] = ",".join(removed)
+            updated_fields += removed
+        if password is not None and self.password_differs(realm['name'], password):
+            changes['password'] = password
+            updated_fields.append('bind_password')
+        return (changes, sorted(updated_fields))
+
+    def plan(self):
+        results = []
+        for realm in self.realms:
+            result = {'name': realm['name'], 'changed': False, 'created': False}
+            attributes = dict((key, normalize_value(value))
+                              for (key, value) in (realm['attributes'] or {}).items())
+            password = attributes.pop('bind_password', None)
+
+            if realm['name'] not in self.existing:
+                params = dict(attributes, realm=realm['name'], type=realm['type'])
+                if password is not None:
+                    params['password'] = password
+                result['changed'] = result['created'] = True
+                self.commands.append(("create", "access/domains", params))
+            else:
+                (changes, updated_fields) = self.diff_realm(realm, attributes, password)
+                if changes:
+                    result['changed'] = True
+                    result['updated_fields'] = updated_fields
+                    self.commands.append(("set", "access/domains/{}".format(realm['name']), changes))
+            results.append(result)
+
+        if self.module.params['exclusive']:
+            wanted = [realm['name'] for realm in self.realms]
+            for name in sorted(self.existing):
+                if name not in wanted and name not in BUILTIN_REALMS:
+                    results.append({'name': name, 'changed': True, 'created': False, 'removed': True})
+                    self.commands.append(("delete", "access/domains/{}".format(name), {}))
+        return results
+
+    def apply(self):
+        try:
+            for (handler, resource, params) in self.commands:
+                if handler == "create":
+                    pvesh.create(resource, **params)
+                elif handler == "set":
+                    pvesh.set(resource, **params)
+                else:
+                    pvesh.delete(resource)
+        except ProxmoxShellError as e:
+            return e.message
+        return None
+
+def main():
+    # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html#/access/domains
+    module = PveshModule(
+        argument_spec = dict(
+            realms=dict(type='list', elements='dict', required=True, options=dict(
+                name=dict(type='str', required=True, aliases=['realm']),
+                type=dict(type='str', required=True),
+                attributes=dict(type='dict', default=None),
+                sync=dict(type='bool'),
+                sync_options=dict(type='dict'),
+            )),
+            exclusive=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True
+    )
+
+    realms = ProxmoxRealms(module)
+    result = {'realms': realms.plan()}
+    result['changed'] = bool(realms.commands)
+
+    if result['changed'] and not module.check_mode:
+        error = realms.apply()
+        if error is not None:
+            module.fail_json(msg=error, **result)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
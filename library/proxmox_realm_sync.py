@@ -0,0 +1,205 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_realm_sync
+
+short_description: Syncs the users and groups of an LDAP or AD realm
+
+description:
+    - Triggers a sync of the given realm and compares the users and groups
+      of PVE before and after it, reporting the realm as changed only if
+      the sync actually added, removed or modified any of them.
+    - Options that aren't given are taken from the realm's
+      C(sync-defaults-options).
+    - The sync isn't run in check mode.
+
+options:
+    realm:
+        required: true
+        aliases: [ "name" ]
+        description:
+            - Name of the realm to sync.
+    scope:
+        required: false
+        choices: [ "users", "groups", "both" ]
+        description:
+            - Whether to sync users, groups, or both.
+    remove_vanished:
+        required: false
+        type: list
+        description:
+            - What to remove for users and groups which are gone from the
+              directory, any of C(acl), C(entry) and C(properties), or
+              C(none).
+    enable_new:
+        required: false
+        type: bool
+        description:
+            - Whether new users are enabled.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Sync the users of the ad realm
+  proxmox_realm_sync:
+    realm: ad
+    scope: users
+    remove_vanished:
+      - acl
+      - entry
+    enable_new: true
+'''
+
+RETURN = '''
+users:
+    description: The number of users added, removed and modified by the sync.
+    type: dict
+groups:
+    description: The number of groups added, removed and modified by the sync.
+    type: dict
+'''
+
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+import ansible.module_utils.pvesh as pvesh
+
+def split_ids(value):
+    # Lists of ids are returned comma separated by the API, but as lists by
+    # some versions of pvesh
+    if isinstance(value, list):
+        return sorted(value)
+    return sorted(item for item in (value or "").split(",") if item)
+
+def snapshot():
+    """Returns all users and groups, keyed by their id."""
+    users = {}
+    for user in pvesh.get("access/users", full=1) or []:
+        user = dict(user)
+        user["groups"] = split_ids(user.get("groups"))
+        # Only describes the realm, which is part of the id already
+        user.pop("realm-type", None)
+        users[user.pop("userid")] = user
+
+    groups = {}
+    for group in pvesh.get("access/groups") or []:
+        group = dict(group)
+        group["users"] = split_ids(group.get("users"))
+        groups[group.pop("groupid")] = group
+
+    return {"users": users, "groups": groups}
+
+def compare(before, after):
+    """Returns the ids of the added, removed and modified entries."""
+    return {
+        "added": sorted(set(after) - set(before)),
+        "removed": sorted(set(before) - set(after)),
+        "modified": sorted(key for key in set(before) & set(after) if before[key] != after[key]),
+    }
+
+class ProxmoxRealmSync(object):
+    def __init__(self, module):
+        self.module = module
+        self.realm = module.params['realm']
+
+    def sync_params(self):
+        params = {}
+        if self.module.params['scope'] is not None:
+            params['scope'] = self.module.params['scope']
+        if self.module.params['remove_vanished'] is not None:
+            params['remove-vanished'] = ";".join(self.module.params['remove_vanished']) or "none"
+        if self.module.params['enable_new'] is not None:
+            params['enable-new'] = int(self.module.params['enable_new'])
+        return params
+
+    def sync(self):
+        pvesh.run_task("access/domains/{}/sync".format(self.realm), **self.sync_params())
+
+    def diff(self, before, after, changes):
+        """Returns the entries that changed, for Ansible's diff mode."""
+        diff = {"before": {}, "after": {}}
+        for kind in ["users", "groups"]:
+            ids = changes[kind]["added"] + changes[kind]["removed"] + changes[kind]["modified"]
+            diff["before"][kind] = dict((key, before[kind][key]) for key in ids if key in before[kind])
+            diff["after"][kind] = dict((key, after[kind][key]) for key in ids if key in after[kind])
+        return diff
+
+def main():
+    module = PveshModule(
+        argument_spec = dict(
+            realm=dict(type='str', required=True, aliases=['name']),
+            scope=dict(type='str', default=None, choices=['users', 'groups', 'both']),
+            remove_vanished=dict(type='list', elements='str', default=None),
+            enable_new=dict(type='bool', default=None),
+        ),
+        supports_check_mode=True
+    )
+
+    for item in module.params['remove_vanished'] or []:
+        if item not in ['acl', 'entry', 'properties', 'none']:
+            module.fail_json(msg="remove_vanished may only contain acl, entry, properties or none.")
+
+    realm_sync = ProxmoxRealmSync(module)
+    result = {'realm': realm_sync.realm, 'changed': False}
+
+    if module.check_mode:
+        module.exit_json(msg="Realms aren't synced in check mode.", **result)
+
+    try:
+        before = snapshot()
+        realm_sync.sync()
+        after = snapshot()
+    except ProxmoxShellError as e:
+        module.fail_json(msg=e.message, status_code=e.status_code, **result)
+
+    changes = dict((kind, compare(before[kind], after[kind])) for kind in ["users", "groups"])
+    for kind in ["users", "groups"]:
+        result[kind] = dict((change, len(ids)) for (change, ids) in changes[kind].items())
+        result['changed'] = result['changed'] or any(changes[kind].values())
+
+    if module._diff and result['changed']:
+        result['diff'] = realm_sync.diff(before, after, changes)
+
+    module.exit_json(**result)
+
+if __name__ == '__main__':
+    main()
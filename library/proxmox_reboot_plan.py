@@ -0,0 +1,252 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+ANSIBLE_METADATA = {
+    'metadata_version': '0.1',
+    'status': ['preview'],
+    'supported_by': 'lae'
+}
+
+DOCUMENTATION = '''
+---
+module: proxmox_reboot_plan
+
+short_description: Plans waves of nodes that can be rebooted at the same time
+
+description:
+    - Splits the given nodes into waves, so that rebooting all nodes of a
+      wave at once keeps the cluster quorate and, with I(ceph), keeps every
+      pool above its C(min_size) and the Ceph monitors in quorum.
+    - The corosync votes of each node are read from C(cluster/config/nodes)
+      and its state from C(cluster/status). How many votes may be lost is
+      asked from votequorum with C(corosync-quorumtool), so that the votes
+      of a QDevice count too. Nodes that are already offline, and hosts that
+      already have OSDs down, count against the budget.
+    - Ceph pools are assumed to use hosts as their failure domain, so that a
+      pool can lose C(size - min_size) hosts and still serve I/O.
+    - A node is rebooted on its own if even that exceeds the budget, as
+      nodes would be without this module, and a warning is shown.
+
+options:
+    nodes:
+        required: true
+        type: list
+        description:
+            - Names of the PVE nodes to reboot.
+    max_wave_size:
+        required: false
+        type: int
+        description:
+            - Maximum number of nodes to reboot at the same time.
+    ceph:
+        required: false
+        type: bool
+        default: false
+        description:
+            - Whether to take Ceph pools and monitors into account. Ignored
+              until Ceph has been initialized.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
+
+author:
+    - Musee Ullah (@lae)
+'''
+
+EXAMPLES = '''
+- name: Plan reboot waves
+  proxmox_reboot_plan:
+    nodes:
+      - pve01
+      - pve02
+      - pve03
+    ceph: true
+'''
+
+RETURN = '''
+waves:
+    description: Lists of nodes to reboot together, in order.
+    type: list
+migration_targets:
+    description: For each node, an online node outside of its wave to
+                 migrate guests to.
+    type: dict
+budget:
+    description: How many votes, Ceph hosts and monitors may be down at once.
+    type: dict
+'''
+
+import os
+import re
+
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
+from ansible.module_utils.pveceph import CephCommandError, ceph_json
+import ansible.module_utils.pvesh as pvesh
+
+CEPH_CONF_PATH = "/etc/pve/ceph.conf"
+
+class ProxmoxRebootPlan(object):
+    def __init__(self, module):
+        self.module = module
+        self.nodes = sorted(set(module.params['nodes']))
+
+        try:
+            self.read_cluster()
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
+
+        self.osd_hosts = set()
+        self.mons = set()
+        self.host_budget = self.mon_budget = None
+        # Ceph may not be set up yet, e.g. when installing a new cluster
+        if module.params['ceph'] and os.path.exists(CEPH_CONF_PATH):
+            try:
+                self.read_ceph()
+            except CephCommandError as e:
+                self.module.fail_json(msg=e.message)
+
+    def read_cluster(self):
+        status = pvesh.get("cluster/status") or []
+        self.online = dict((entry['name'], bool(entry.get('online')))
+                           for entry in status if entry['type'] == 'node')
+        self.clustered = any(entry['type'] == 'cluster' for entry in status)
+        self.votes = {}
+        if self.clustered:
+            self.votes = dict((node['node'], int(node.get('quorum_votes', 1)))
+                              for node in pvesh.get("cluster/config/nodes") or [])
+
+        self.vote_budget = None
+        if self.clustered:
+            quorum = self.votequorum()
+            if quorum is not None:
+                (total, needed) = quorum
+            else:
+                # Corosync needs a majority of all expected votes
+                total = sum(votes for (node, votes) in self.votes.items() if self.online.get(node))
+                needed = sum(self.votes.values()) // 2 + 1
+            self.vote_budget = total - needed
+
+    def votequorum(self):
+        """Returns the votes currently cast, QDevice included, and the quorum."""
+        path = self.module.get_bin_path("corosync-quorumtool")
+        if path is None:
+            return None
+        # Exits non-zero without quorum, but still prints the votes
+        (_, out, _) = self.module.run_command([path, "-s"], environ_update={"LC_ALL": "C"})
+        total = re.search(r"^Total votes:\s+(\d+)", out, re.M)
+        needed = re.search(r"^Quorum:\s+(\d+)", out, re.M)
+        if not total or not needed:
+            return None
+        return int(total.group(1)), int(needed.group(1))
+
+    def read_ceph(self):
+        pools = ceph_json(self.module, ["osd", "pool", "ls", "detail"]) or []
+        tree = ceph_json(self.module, ["osd", "tree"]) or {}
+        osds = dict((item['id'], item) for item in tree.get('nodes', []) if item['type'] == 'osd')
+
+        degraded_hosts = 0
+        for item in tree.get('nodes', []):
+            if item['type'] != 'host' or not item.get('children'):
+                continue
+            self.osd_hosts.add(item['name'])
+            if any(osds.get(osd, {}).get('status') != 'up' for osd in item['children']):
+                degraded_hosts += 1
+        if pools:
+            self.host_budget = min(pool['size'] - pool['min_size'] for pool in pools) - degraded_hosts
+
+        quorum = ceph_json(self.module, ["quorum_status"]) or {}
+        self.mons = set(mon['name'] for mon in quorum.get('monmap', {}).get('mons', []))
+        if self.mons:
+            in_quorum = len(quorum.get('quorum_names', []))
+            self.mon_budget = in_quorum - (len(self.mons) // 2 + 1)
+
+    def fits(self, wave, node):
+        """Returns whether node can be rebooted along with the nodes of wave."""
+        nodes = wave + [node]
+        if self.vote_budget is not None and sum(self.votes.get(n, 0) for n in nodes) > self.vote_budget:
+            return False
+        if self.host_budget is not None and len(self.osd_hosts.intersection(nodes)) > self.host_budget:
+            return False
+        if self.mon_budget is not None and len(self.mons.intersection(nodes)) > self.mon_budget:
+            return False
+        return True
+
+    def plan(self):
+        max_wave_size = self.module.params['max_wave_size']
+        waves = []
+        for node in self.nodes:
+            for wave in waves:
+                if (max_wave_size is None or len(wave) < max_wave_size) and self.fits(wave, node):
+                    wave.append(node)
+                    break
+            else:
+                if not self.fits([], node):
+                    self.module.warn("Rebooting {} on its own exceeds what the cluster can tolerate, "
+                                     "it will lose quorum or I/O while it reboots.".format(node))
+                waves.append([node])
+        return waves
+
+    def migration_targets(self, waves):
+        """Picks, for each node, an online node which isn't rebooted along with it."""
+        targets = {}
+        for index, wave in enumerate(waves):
+            # Nodes that were already rebooted or won't be are preferred, so
+            # that guests don't have to move twice
+            later = [node for later_wave in waves[index + 1:] for node in later_wave]
+            candidates = sorted(node for (node, online) in self.online.items()
+                                if online and node not in wave)
+            candidates = [node for node in candidates if node not in later] or candidates
+            for position, node in enumerate(wave):
+                if candidates:
+                    targets[node] = candidates[position % len(candidates)]
+        return targets
+
+def main():
+    module = PveshModule(
+        argument_spec = dict(
+            nodes=dict(type='list', elements='str', required=True),
+            max_wave_size=dict(type='int', default=None),
+            ceph=dict(type='bool', default=False),
+        ),
+        supports_check_mode=True
+    )
+
+    plan = ProxmoxRebootPlan(module)
+    waves = plan.plan()
+    module.exit_json(
+        changed=False,
+        waves=waves,
+        migration_targets=plan.migration_targets(waves),
+        budget={'votes': plan.vote_budget, 'ceph_hosts': plan.host_budget, 'ceph_mons': plan.mon_budget},
+    )
+
+if __name__ == '__main__':
+    main()
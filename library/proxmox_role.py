@@ -11,6 +11,8 @@ DOCUMENTATION = '''
 ---
 module: proxmox_role
 short_description: Manages the Access Control List in Proxmox
+description:
+    - Creates, updates and removes roles in Proxmox.
 options:
     name:
         required: true
@@ -27,6 +29,37 @@ options:
         choices: [ "present", "absent" ]
         description:
             - Specifies whether this role should exist or not.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 author:
     - Thoralf Rickert-Wendt (@trickert76)
 '''
@@ -41,9 +74,8 @@ EXAMPLES = '''
 RETURN = '''
 '''
 
-from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_text
-from ansible.module_utils.pvesh import ProxmoxShellError
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
 import ansible.module_utils.pvesh as pvesh
 
 class ProxmoxRole(object):
@@ -142,7 +174,7 @@ class ProxmoxRole(object):
 
 def main():
     # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec = dict(
             name=dict(type='str', required=True),
             privileges=dict(type='list', required=True),
@@ -13,6 +13,9 @@ module: proxmox_storage
 
 short_description: Manages the storage in Proxmox
 
+description:
+    - Creates, updates and removes storage definitions in Proxmox.
+
 options:
     name:
         required: true
@@ -174,7 +177,7 @@ options:
         type: bool
         description:
             - Specifies whether or not the given path is an externally managed
-            mountpoint.
+              mountpoint.
     create_subdirs:
         required: false
         type: bool
@@ -200,6 +203,37 @@ options:
         type: str
         description:
             - Specifies Realm to use for NTLM/LDAPS authentication if using an AD-enabled share
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 
 author:
     - Fabien Brachere (@fbrachere)
@@ -300,9 +334,8 @@ EXAMPLES = '''
 RETURN = '''
 '''
 
-from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_text
-from ansible.module_utils.pvesh import ProxmoxShellError
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
 import ansible.module_utils.pvesh as pvesh
 import re
 import json
@@ -637,7 +670,7 @@ def main():
         share=dict(default=None, type='str', required=False),
     )
 
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec=module_args,
         supports_check_mode=True,
         required_if=[
@@ -13,6 +13,9 @@ module: proxmox_user
 
 short_description: Manages user accounts in Proxmox
 
+description:
+    - Creates, updates and removes user accounts in Proxmox.
+
 options:
     name:
         required: true
@@ -68,6 +71,44 @@ options:
         description:
             - Account expiration date (seconds since epoch). C(0) means no
               expiration date.
+    verify:
+        required: false
+        default: no
+        type: bool
+        description:
+            - Reads the user back from PVE after changing it for the returned
+              I(user), instead of returning the state it's expected to be in.
+    pvesh_timeout:
+        required: false
+        type: float
+        description:
+            - Seconds a single call to pvesh or the API may take. Defaults to
+              C(PVESH_TIMEOUT), or 300.
+    pvesh_deadline:
+        required: false
+        type: float
+        description:
+            - Seconds all calls to pvesh or the API made by this task may take.
+              Defaults to C(PVESH_DEADLINE), or no limit.
+    pvesh_retries:
+        required: false
+        type: int
+        description:
+            - How many times a call failing for a transient reason, like a
+              pmxcfs lock held by another writer, is retried. Defaults to
+              C(PVESH_RETRIES), or 5.
+    pvesh_retry_budget:
+        required: false
+        type: float
+        description:
+            - Seconds this task may spend waiting between retries in total.
+              Defaults to C(PVESH_RETRY_BUDGET), or 60.
+    pvesh_profile:
+        required: false
+        type: bool
+        description:
+            - Whether to return every call made to pvesh or the API, with its
+              timing, as I(pvesh_calls). Defaults to C(PVESH_PROFILE), or no.
 
 author:
     - Musee Ullah (@lae)
@@ -109,13 +150,13 @@ updated_fields:
     description: Fields that were modified for an existing user
     type: list
 user:
-    description: Information about the user fetched from PVE after this task completed.
+    description: Information about the user in PVE after this task completed
+                 (as read back from PVE if I(verify) is set).
     type: json
 '''
 
-from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_text
-from ansible.module_utils.pvesh import ProxmoxShellError
+from ansible.module_utils.pvesh import ProxmoxShellError, PveshModule
 import ansible.module_utils.pvesh as pvesh
 
 class ProxmoxUser(object):
@@ -132,6 +173,9 @@ class ProxmoxUser(object):
         self.lastname = module.params['lastname']
         self.password = module.params['password']
 
+        # Everything below is compared against this one snapshot of the user
+        self.existing_user = self.lookup()
+
     def lookup(self):
         try:
             return pvesh.get("access/users/{}".format(self.name))
@@ -139,15 +183,20 @@ class ProxmoxUser(object):
             self.module.fail_json(msg=e.message, status_code=e.status_code)
 
     def check_groups_exist(self):
-        # Checks to see if groups specified already exist or not
-        if self.groups is not None:
-            try:
-                groups = [group['groupid'] for group in pvesh.get("access/groups")]
-                return set(self.groups).issubset(set(groups))
-            except ProxmoxShellError as e:
-                self.module.fail_json(msg=e.message, status_code=e.status_code)
+        # Checks to see if groups specified already exist or not. Groups the
+        # user is already a member of obviously do.
+        if self.groups is None:
+            return True
 
-        return True
+        current_groups = (self.existing_user or {}).get('groups', [])
+        if set(self.groups).issubset(set(current_groups)):
+            return True
+
+        try:
+            groups = [group['groupid'] for group in pvesh.get("access/groups")]
+            return set(self.groups).issubset(set(groups))
+        except ProxmoxShellError as e:
+            self.module.fail_json(msg=e.message, status_code=e.status_code)
 
     def prepare_user_args(self):
         args = {}
@@ -172,6 +221,15 @@ class ProxmoxUser(object):
 
         return args
 
+    def projected_user(self, staged_user):
+        # What PVE will return for the user once staged_user has been applied
+        user = dict(self.existing_user or {})
+        user.update(staged_user)
+        user.pop('password', None)
+        if 'groups' in staged_user:
+            user['groups'] = sorted(self.groups)
+        return user
+
     def remove_user(self):
         try:
             pvesh.delete("access/users/{}".format(self.name))
@@ -190,27 +248,27 @@ class ProxmoxUser(object):
 
         try:
             pvesh.create("access/users", userid=self.name, **new_user)
+            self.existing_user = self.projected_user(new_user)
             return (True, None)
         except ProxmoxShellError as e:
             return (False, e.message)
 
     def modify_user(self):
-        lookup = self.lookup()
-        staged_user = self.prepare_user_args()
-
-        updated_fields = []
+        lookup = self.existing_user
+        staged_user = {}
         error = None
 
-        for key in staged_user:
+        for (key, value) in self.prepare_user_args().items():
             if key == 'groups':
-                # Since staged_user['groups'] is already converted to a string,
+                # Since the staged value is already converted to a string,
                 # we check our object instead
-                if set(self.groups) != set(lookup['groups']):
-                    updated_fields.append(key)
+                if set(self.groups) != set(lookup.get('groups', [])):
+                    staged_user[key] = value
             else:
-                staged_value = to_text(staged_user[key]) if isinstance(staged_user[key], str) else staged_user[key]
+                staged_value = to_text(value) if isinstance(value, str) else value
                 if key not in lookup or staged_value != lookup[key]:
-                    updated_fields.append(key)
+                    staged_user[key] = value
+        updated_fields = list(staged_user)
 
         if self.module.check_mode:
             self.module.exit_json(changed=bool(updated_fields), expected_changes=updated_fields)
@@ -219,11 +277,12 @@ class ProxmoxUser(object):
             # No changes necessary
             return (updated_fields, error)
 
-        if not self.check_groups_exist():
+        if 'groups' in staged_user and not self.check_groups_exist():
             error = "One or more specified groups do not exist."
         else:
             try:
                 pvesh.set("access/users/{}".format(self.name), **staged_user)
+                self.existing_user = self.projected_user(staged_user)
             except ProxmoxShellError as e:
                 error = e.message
 
@@ -231,7 +290,7 @@ class ProxmoxUser(object):
 
 def main():
     # Refer to https://pve.proxmox.com/pve-docs/api-viewer/index.html
-    module = AnsibleModule(
+    module = PveshModule(
         argument_spec = dict(
             name=dict(type='str', required=True, aliases=['user', 'userid']),
             state=dict(default='present', choices=['present', 'absent'], type='str'),
@@ -242,7 +301,8 @@ def main():
             firstname=dict(default=None, type='str'),
             lastname=dict(default=None, type='str'),
             password=dict(default=None, type='str', no_log=True),
-            expire=dict(default=0, type='int')
+            expire=dict(default=0, type='int'),
+            verify=dict(default=False, type='bool')
         ),
         supports_check_mode=True
     )
@@ -259,7 +319,7 @@ def main():
         result['password'] = 'NOT_LOGGING_PASSWORD'
 
     if user.state == 'absent':
-        if user.lookup() is not None:
+        if user.existing_user is not None:
             if module.check_mode:
                 module.exit_json(changed=True)
 
@@ -267,8 +327,9 @@ def main():
 
             if error is not None:
                 module.fail_json(name=user.name, msg=error)
+            user.existing_user = None
     elif user.state == 'present':
-        if not user.lookup():
+        if not user.existing_user:
             if module.check_mode:
                 module.exit_json(changed=True)
 
@@ -284,7 +345,9 @@ def main():
         if error is not None:
             module.fail_json(name=user.name, msg=error)
 
-    lookup = user.lookup()
+    # The user is only read again if asked to, otherwise we return what we
+    # expect PVE to have stored.
+    lookup = user.lookup() if module.params['verify'] and changed else user.existing_user
     if lookup:
         result['user'] = lookup
 
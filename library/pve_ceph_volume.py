@@ -1,7 +1,9 @@
 #!/usr/bin/python
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pveceph import OSD_CACHE_PATH, cached_lvm_osds
 import datetime
+import json
 
 ANSIBLE_METADATA = {
     'metadata_version': '1.0',
@@ -34,6 +36,28 @@ options:
         description:
             - If data is a lv, this must be the name of the volume group it belongs to.
         required: false
+    method:
+        description:
+            - How to find the OSDs. C(lvm) reads the C(ceph.*) tags of all
+              logical volumes with a single C(lvs) call instead of running
+              C(ceph-volume lvm list), which rescans every device. C(auto)
+              does the same, but falls back to C(ceph-volume) if the LVM
+              tools fail.
+            - Both methods return the same C(stdout), except that
+              C(ceph-volume) also lists partitions used for block.db and
+              block.wal.
+        required: false
+        default: auto
+        choices: [ "auto", "lvm", "ceph-volume" ]
+    cache_path:
+        description:
+            - Where the C(lvm) method caches the OSDs it found. The cache is
+              used as long as the metadata sequence numbers and physical
+              volumes of all volume groups are unchanged, so that unchanged
+              hosts only need a C(vgs) call. Set to an empty string to
+              disable the cache.
+        required: false
+        default: /run/ansible-pve-ceph-volume.json
 
 author:
     - Andrew Schoen (@andrewschoen)
@@ -48,6 +72,10 @@ EXAMPLES = '''
   ceph_volume:
     cluster: test
     data: /dev/sdc
+
+- name: query all osds with ceph-volume
+  ceph_volume:
+    method: ceph-volume
 '''
 
 def exec_command(module, cmd, stdin=None):
@@ -88,11 +116,46 @@ def list_osd(module):
     return cmd
 
 
+def filter_osds(osds, data):
+    '''
+    Keep the logical volumes that ceph-volume lvm list would show for data,
+    i.e. those on the device or named vg/lv
+    '''
+    if not data:
+        return osds
+    filtered = {}
+    for osd_id, volumes in osds.items():
+        volumes = [volume for volume in volumes
+                   if data in volume['devices'] or data == volume['lv_path']
+                   or data == '{0}/{1}'.format(volume['vg_name'], volume['lv_name'])]
+        if volumes:
+            filtered[osd_id] = volumes
+    return filtered
+
+
+def list_osd_lvm(module, commands):
+    '''
+    Query OSDs from their LVM tags, the way ceph-volume itself does
+    '''
+    cluster = module.params['cluster']
+    data = get_data(module.params.get('data', None), module.params.get('data_vg', None))
+
+    osds, cached = cached_lvm_osds(module, module.params['cache_path'], commands)
+    osds = dict((osd_id, [volume for volume in volumes
+                          if volume['tags'].get('ceph.cluster_name', cluster) == cluster])
+                for osd_id, volumes in osds.items())
+    osds = dict((osd_id, volumes) for osd_id, volumes in filter_osds(osds, data).items() if volumes)
+    return json.dumps(osds, indent=4, sort_keys=True), cached
+
+
 def run_module():
     module_args = dict(
         cluster=dict(type='str', required=False, default='ceph'),
         data=dict(type='str', required=False),
         data_vg=dict(type='str', required=False),
+        method=dict(type='str', required=False, default='auto',
+                    choices=['auto', 'lvm', 'ceph-volume']),
+        cache_path=dict(type='str', required=False, default=OSD_CACHE_PATH),
     )
 
     module = AnsibleModule(
@@ -116,14 +179,31 @@ def run_module():
     # start execution
     startd = datetime.datetime.now()
 
-    # List Ceph LVM Metadata on a device
-    rc, cmd, out, err = exec_command(module, list_osd(module))
+    method = module.params['method']
+    rc, cmd, out, err = 0, [], '', ''
+    cached = False
+    if method != 'ceph-volume':
+        commands = []
+        try:
+            out, cached = list_osd_lvm(module, commands)
+            method = 'lvm'
+            cmd = commands[-1]
+        except (OSError, IOError, ValueError, KeyError) as e:
+            if method == 'lvm':
+                module.fail_json(msg='failed to list OSDs with LVM: {0}'.format(e))
+
+    if method != 'lvm':
+        # List Ceph LVM Metadata on a device
+        method = 'ceph-volume'
+        rc, cmd, out, err = exec_command(module, list_osd(module))
 
     endd = datetime.datetime.now()
     delta = endd - startd
 
     result = dict(
         cmd=cmd,
+        method=method,
+        cached=cached,
         start=str(startd),
         end=str(endd),
         delta=str(delta),
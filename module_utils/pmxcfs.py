@@ -0,0 +1,445 @@
+#!/usr/bin/python
+
+# Read-only access to the configuration files in the pmxcfs mount (/etc/pve).
+#
+# Most lookups done by the modules in this role end up reading one of a few
+# files in /etc/pve through the PVE API. Reading those files directly is
+# orders of magnitude cheaper than forking pvesh, so for a handful of
+# resources we parse them here and return the same structures pvesh would.
+# Anything we're unsure about returns None, so that the caller can fall back
+# to asking the API.
+
+import hashlib
+import json
+import os
+import re
+
+from ansible.module_utils._text import to_text
+from urllib.parse import unquote
+
+PMXCFS_ROOT = os.environ.get("PVESH_PMXCFS_ROOT", "/etc/pve")
+
+# Storage types for which PVE always sets the shared flag
+SHARED_STORAGE_TYPES = ["iscsi", "nfs", "cifs", "rbd", "cephfs", "iscsidirect",
+                        "glusterfs", "zfs", "drbd", "pbs"]
+
+STORAGE_PROPERTY_TYPES = {
+    "disable": "boolean",
+    "shared": "boolean",
+    "krbd": "boolean",
+    "sparse": "boolean",
+    "mkdir": "boolean",
+    "create-base-path": "boolean",
+    "create-subdirs": "boolean",
+    "snapshot-as-volume-chain": "boolean",
+    "saferemove": "boolean",
+    "tagged_only": "boolean",
+    "nocow": "boolean",
+    "fuse": "boolean",
+    "maxfiles": "integer",
+    "port": "integer",
+    "max-protected-backups": "integer",
+}
+
+METRIC_SERVER_PROPERTY_TYPES = {
+    "disable": "boolean",
+    "verify-certificate": "boolean",
+    "port": "integer",
+    "mtu": "integer",
+    "timeout": "integer",
+    "max-body-size": "integer",
+}
+
+# Roles PVE defines itself, which user.cfg doesn't list
+BUILTIN_ROLES = [
+    "Administrator", "NoAccess", "PVEAdmin", "PVEAuditor", "PVEDatastoreAdmin",
+    "PVEDatastoreUser", "PVEMappingAdmin", "PVEMappingUser",
+    "PVEPoolAdmin", "PVEPoolUser", "PVESDNAdmin", "PVESDNUser", "PVESysAdmin",
+    "PVETemplateUser", "PVEUserAdmin", "PVEVMAdmin", "PVEVMUser",
+]
+
+DOMAIN_PROPERTY_TYPES = {
+    "default": "boolean",
+    "secure": "boolean",
+    "verify": "boolean",
+    "case-sensitive": "boolean",
+    "autocreate": "boolean",
+    "port": "integer",
+}
+
+def available():
+    # .version only exists when pmxcfs is actually mounted
+    return os.path.exists(os.path.join(PMXCFS_ROOT, ".version"))
+
+def read_file(name):
+    try:
+        with open(os.path.join(PMXCFS_ROOT, name), "rb") as f:
+            return to_text(f.read())
+    except (IOError, OSError):
+        return None
+
+def read_versions():
+    # The change counters pmxcfs keeps for some of its files, along with
+    # the start time of pmxcfs (since they get reset when it restarts).
+    raw = read_file(".version")
+    if raw is None:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+def digest(raw):
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def parse_boolean(value):
+    if value is None:
+        return 1
+    return 1 if value.lower() in ["1", "on", "yes", "true"] else 0
+
+def parse_section_config(raw, property_types=None):
+    """Parses a SectionConfig-style file into a list of (type, id, properties)."""
+    property_types = property_types or {}
+    sections = []
+    section = None
+
+    for line in raw.splitlines():
+        if line.lstrip().startswith("#"):
+            continue
+
+        if not line.strip():
+            section = None
+            continue
+
+        if section is None:
+            match = re.match(r"^(\S+):\s*(\S+)\s*$", line)
+            if match:
+                section = (match.group(1), match.group(2), {})
+                sections.append(section)
+            continue
+
+        match = re.match(r"^\s+(\S+)(\s+(.*\S))?\s*$", line)
+        if not match:
+            continue
+
+        key, value = match.group(1), match.group(3)
+        kind = property_types.get(key)
+        if kind == "boolean":
+            value = parse_boolean(value)
+        elif value is None:
+            # A key without a value is only valid for flags
+            value = 1
+        elif kind == "integer" and re.match(r"^-?\d+$", value):
+            value = int(value)
+        section[2][key] = value
+
+    return sections
+
+def decode_text(value):
+    return unquote(value)
+
+def split_list(value):
+    return [item for item in re.split(r"[;,\s]+", value or "") if item]
+
+def normalize_path(path):
+    return "/" + "/".join(part for part in path.split("/") if part)
+
+def parse_user_config(raw):
+    """Parses user.cfg into users, groups, pools, roles and acls, as PVE does."""
+    cfg = {"users": {}, "groups": {}, "pools": {}, "roles": {}, "acl": {}}
+    acl_lines = []
+
+    for line in raw.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        data = [item.strip() for item in line.split(":")]
+        entry_type = data.pop(0)
+        data += [""] * 8
+
+        if entry_type == "user":
+            userid, enable, expire, firstname, lastname, email, comment, keys = data[:8]
+            if "@" not in userid:
+                continue
+            user = {"enable": 1 if enable not in ["", "0"] else 0,
+                    "expire": int(expire) if expire.isdigit() else 0}
+            if firstname:
+                user["firstname"] = decode_text(firstname)
+            if lastname:
+                user["lastname"] = decode_text(lastname)
+            if email:
+                user["email"] = email
+            if comment:
+                user["comment"] = decode_text(comment)
+            if keys:
+                user["keys"] = keys
+            user["groups"] = []
+            cfg["users"][userid] = user
+        elif entry_type == "group":
+            groupid, members, comment = data[:3]
+            group = cfg["groups"].setdefault(groupid, {"users": []})
+            if comment:
+                group["comment"] = decode_text(comment)
+            for member in split_list(members):
+                # PVE drops members that aren't (yet) defined users
+                if member in cfg["users"]:
+                    cfg["users"][member]["groups"].append(groupid)
+                    group["users"].append(member)
+        elif entry_type == "pool":
+            poolid, comment = data[:2]
+            pool = {}
+            if comment:
+                pool["comment"] = decode_text(comment)
+            cfg["pools"][poolid] = pool
+        elif entry_type == "role":
+            roleid, privs = data[:2]
+            cfg["roles"][roleid] = split_list(privs)
+        elif entry_type == "token":
+            tokenid, expire, privsep, comment = data[:4]
+            userid, _, name = tokenid.partition("!")
+            if userid not in cfg["users"] or not name:
+                continue
+            token = {"expire": int(expire) if expire.isdigit() else 0,
+                     "privsep": 1 if privsep not in ["", "0"] else 0}
+            if comment:
+                token["comment"] = decode_text(comment)
+            cfg["users"][userid].setdefault("tokens", {})[name] = token
+        elif entry_type == "acl":
+            # Tokens have to be known before ACLs referencing them are parsed
+            acl_lines.append(data[:4])
+
+    # Like PVE, skip entries for roles, groups, users and tokens that don't exist
+    for propagate, path, ugids, roles in acl_lines:
+        propagate = 1 if propagate not in ["", "0"] else 0
+        path = normalize_path(path)
+        for role in split_list(roles):
+            if role not in cfg["roles"] and role not in BUILTIN_ROLES:
+                continue
+            for ugid in split_list(ugids):
+                if ugid.startswith("@"):
+                    (acl_type, ugid) = ("group", ugid[1:])
+                    if ugid not in cfg["groups"]:
+                        continue
+                elif "!" in ugid:
+                    userid, _, name = ugid.partition("!")
+                    if name not in cfg["users"].get(userid, {}).get("tokens", {}):
+                        continue
+                    acl_type = "token"
+                else:
+                    acl_type = "user"
+                    if ugid not in cfg["users"] and ugid != "root@pam":
+                        continue
+                cfg["acl"][(path, acl_type, ugid, role)] = propagate
+
+    # PVE makes sure root@pam always exists and is enabled
+    root = cfg["users"].setdefault("root@pam", {"expire": 0, "groups": []})
+    root["enable"] = 1
+
+    return cfg
+
+def read_user_config():
+    raw = read_file("user.cfg")
+    return parse_user_config(raw or "")
+
+def read_domains():
+    raw = read_file("domains.cfg") or ""
+    domains = dict((realm, dict(properties, type=realm_type))
+                   for (realm_type, realm, properties) in parse_section_config(raw))
+    # The pam and pve realms are always defined
+    domains.setdefault("pam", {"type": "pam"})
+    domains.setdefault("pve", {"type": "pve"})
+    return domains
+
+def get_domains():
+    domains = []
+    for realm, domain in sorted(read_domains().items()):
+        entry = dict((key, domain[key]) for key in ["type", "comment", "tfa"] if key in domain)
+        entry["realm"] = realm
+        domains.append(entry)
+    return {u"status": 200, u"data": domains}
+
+def get_domain(realm):
+    raw = read_file("domains.cfg") or ""
+    for (realm_type, name, properties) in parse_section_config(raw, DOMAIN_PROPERTY_TYPES):
+        if name == realm:
+            return {u"status": 200, u"data": dict(properties, type=realm_type, digest=digest(raw))}
+    # Let pvesh handle the built-in realms when they aren't in the file
+    return None
+
+def user_data(user, full):
+    data = dict((key, user[key]) for key in
+                ["enable", "expire", "firstname", "lastname", "email", "comment", "keys"]
+                if key in user)
+    if full:
+        data["groups"] = sorted(user["groups"])
+        if "tokens" in user:
+            data["tokens"] = user["tokens"]
+    return data
+
+def get_users(full=0, enabled=None):
+    cfg = read_user_config()
+    domains = read_domains()
+    users = []
+    for userid in sorted(cfg["users"]):
+        user = cfg["users"][userid]
+        if enabled is not None and bool(user["enable"]) != bool(int(enabled)):
+            continue
+        entry = user_data(user, int(full))
+        if "groups" in entry:
+            entry["groups"] = ",".join(entry["groups"])
+        if "tokens" in entry:
+            entry["tokens"] = [dict(token, tokenid=name)
+                               for (name, token) in sorted(entry["tokens"].items())]
+        entry["userid"] = userid
+        realm = userid.rsplit("@", 1)[-1]
+        if realm in domains:
+            entry["realm-type"] = domains[realm]["type"]
+        users.append(entry)
+    return {u"status": 200, u"data": users}
+
+def get_user(userid):
+    cfg = read_user_config()
+    if userid not in cfg["users"]:
+        return {u"status": 404, u"message": u"no such user ('{}')".format(userid)}
+    return {u"status": 200, u"data": user_data(cfg["users"][userid], True)}
+
+def get_groups():
+    cfg = read_user_config()
+    groups = []
+    for groupid in sorted(cfg["groups"]):
+        group = cfg["groups"][groupid]
+        entry = {"groupid": groupid, "users": ",".join(sorted(group["users"]))}
+        if "comment" in group:
+            entry["comment"] = group["comment"]
+        groups.append(entry)
+    return {u"status": 200, u"data": groups}
+
+def get_group(groupid):
+    cfg = read_user_config()
+    if groupid not in cfg["groups"]:
+        return {u"status": 404, u"message": u"group '{}' does not exist".format(groupid)}
+    group = cfg["groups"][groupid]
+    data = {"members": sorted(group["users"])}
+    if "comment" in group:
+        data["comment"] = group["comment"]
+    return {u"status": 200, u"data": data}
+
+def get_acl():
+    cfg = read_user_config()
+    order = {"user": 0, "group": 1, "token": 2}
+    acls = [{"path": path, "type": acl_type, "ugid": ugid, "roleid": role, "propagate": propagate}
+            for ((path, acl_type, ugid, role), propagate) in cfg["acl"].items()]
+    acls.sort(key=lambda acl: (acl["path"], order[acl["type"]], acl["ugid"], acl["roleid"]))
+    return {u"status": 200, u"data": acls}
+
+def read_storage_config():
+    raw = read_file("storage.cfg")
+    if raw is None:
+        # PVE generates a default 'local' storage in this case, leave it to pvesh
+        return None
+
+    storages = []
+    for (storage_type, storage, properties) in parse_section_config(raw, STORAGE_PROPERTY_TYPES):
+        if "content" not in properties:
+            # The default content types depend on the storage plugin
+            return None
+        entry = dict(properties, type=storage_type, storage=storage, digest=digest(raw))
+        if storage_type in SHARED_STORAGE_TYPES:
+            entry["shared"] = 1
+        storages.append(entry)
+
+    if not any(s["storage"] == "local" and s["type"] == "dir" for s in storages):
+        return None
+
+    for entry in storages:
+        if entry["storage"] == "local":
+            entry.pop("nodes", None)
+
+    return storages
+
+def get_storages(type=None):
+    storages = read_storage_config()
+    if storages is None:
+        return None
+    if type is not None:
+        storages = [s for s in storages if s["type"] == type]
+    return {u"status": 200, u"data": storages}
+
+def get_storage(storage):
+    storages = read_storage_config()
+    for entry in storages or []:
+        if entry["storage"] == storage:
+            return {u"status": 200, u"data": entry}
+    # Let pvesh produce the error for storages we don't know about
+    return None
+
+def read_datacenter_config():
+    """Returns the options set in datacenter.cfg as strings, or None if it can't."""
+    if not available():
+        return None
+    options = {}
+    for line in (read_file("datacenter.cfg") or "").splitlines():
+        # The description is stored as comments
+        if line.startswith("#") or not line.strip():
+            continue
+        match = re.match(r"^(\S+?):\s*(.*?)\s*$", line)
+        if match:
+            options[match.group(1)] = match.group(2)
+    return options
+
+def read_metric_servers():
+    raw = read_file("status.cfg") or ""
+    return [dict(properties, id=server_id, type=server_type, digest=digest(raw))
+            for (server_type, server_id, properties)
+            in parse_section_config(raw, METRIC_SERVER_PROPERTY_TYPES)]
+
+def get_metric_servers():
+    servers = []
+    for server in sorted(read_metric_servers(), key=lambda s: s["id"]):
+        servers.append({
+            "id": server["id"],
+            "disable": server.get("disable", 0),
+            "type": server["type"],
+            "server": server.get("server"),
+            "port": server.get("port"),
+        })
+    return {u"status": 200, u"data": servers}
+
+def get_metric_server(server_id):
+    for server in read_metric_servers():
+        if server["id"] == server_id:
+            return {u"status": 200, u"data": server}
+    return None
+
+def read(resource, **params):
+    """Serves a GET for resource from pmxcfs, returning None if it can't."""
+    if not available():
+        return None
+
+    parts = resource.strip("/").split("/")
+
+    if parts == ["access", "users"] and set(params).issubset(["full", "enabled"]):
+        return get_users(**params)
+    if len(parts) == 3 and parts[:2] == ["access", "users"] and not params:
+        return get_user(parts[2])
+    if parts == ["access", "groups"] and not params:
+        return get_groups()
+    if len(parts) == 3 and parts[:2] == ["access", "groups"] and not params:
+        return get_group(parts[2])
+    if parts == ["access", "domains"] and not params:
+        return get_domains()
+    if len(parts) == 3 and parts[:2] == ["access", "domains"] and not params:
+        return get_domain(parts[2])
+    if parts == ["access", "acl"] and not params:
+        return get_acl()
+    if parts == ["storage"] and set(params).issubset(["type"]):
+        return get_storages(**params)
+    if len(parts) == 2 and parts[0] == "storage" and not params:
+        return get_storage(parts[1])
+    if parts == ["cluster", "metrics", "server"] and not params:
+        return get_metric_servers()
+    if len(parts) == 4 and parts[:3] == ["cluster", "metrics", "server"] and not params:
+        return get_metric_server(parts[3])
+
+    return None
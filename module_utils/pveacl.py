@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+# Helpers for comparing and applying ACL entries in bulk. Entries are handled
+# as (path, type, ugid, roleid, propagate) tuples, so that existing ACLs can be
+# indexed in a set instead of being searched for each wanted entry.
+
+def acl_key(acl):
+    # PVE 5.x (unnecessarily) uses a string for propagate
+    return (acl['path'], acl['type'], acl['ugid'], acl['roleid'], int(acl['propagate']))
+
+def index_acls(acls):
+    return set(acl_key(acl) for acl in acls or [])
+
+def expand_acl(path, roles, users=None, groups=None, propagate=1):
+    """Returns the ACL entries for every combination of role and user/group."""
+    constituents = [("user", user) for user in users or []]
+    constituents += [("group", group) for group in groups or []]
+    return [(path, ugid_type, ugid, role, propagate)
+            for role in roles for (ugid_type, ugid) in constituents]
+
+def without_propagate(keys):
+    return set(key[:4] for key in keys)
+
+def batch_acl_changes(keys, delete=False):
+    """Groups ACL entries into as few calls to set access/acl as possible.
+
+    Each call applies every listed role to every listed user, group and API
+    token on a path, so those that need the same set of roles on a path (with
+    the same propagate flag) are combined into one call. Returns the
+    arguments for each call.
+    """
+    roles_per_ugid = {}
+    for (path, ugid_type, ugid, role, propagate) in keys:
+        # Deletions match regardless of propagate
+        scope = (path, None if delete else propagate)
+        roles_per_ugid.setdefault(scope, {}).setdefault((ugid_type, ugid), set()).add(role)
+
+    calls = {}
+    for scope, ugids in roles_per_ugid.items():
+        for (ugid_type, ugid), roles in ugids.items():
+            call = calls.setdefault(scope + (tuple(sorted(roles)),), {"user": [], "group": [], "token": []})
+            call[ugid_type].append(ugid)
+
+    batches = []
+    for (path, propagate, roles) in sorted(calls, key=lambda call: (call[0], str(call[1]), call[2])):
+        ugids = calls[(path, propagate, roles)]
+        args = {"path": path, "roles": ",".join(roles)}
+        if ugids["user"]:
+            args["users"] = ",".join(sorted(ugids["user"]))
+        if ugids["group"]:
+            args["groups"] = ",".join(sorted(ugids["group"]))
+        if ugids["token"]:
+            args["tokens"] = ",".join(sorted(ugids["token"]))
+        if delete:
+            args["delete"] = 1
+        else:
+            args["propagate"] = propagate
+        batches.append(args)
+    return batches
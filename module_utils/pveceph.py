@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# Helpers for modules that manage Ceph with the ceph and pveceph commands.
+# Cluster state is read as JSON, so that it can be compared structurally with
+# what the role is configured with instead of by parsing human readable output.
+
+import json
+import os
+
+# Fields ceph-volume reads from LVM for each logical volume
+LVS_FIELDS = ['lv_tags', 'lv_path', 'lv_name', 'vg_name', 'lv_uuid', 'lv_size', 'devices']
+# Fields of the volume groups that change whenever any of the above do
+VGS_FIELDS = ['vg_uuid', 'vg_seqno', 'pv_name']
+# Where OSDs found from LVM tags are cached
+OSD_CACHE_PATH = '/run/ansible-pve-ceph-volume.json'
+
+class CephCommandError(Exception):
+    """Exception raised when a ceph or pveceph command fails."""
+    def __init__(self, cmd, rc, stderr):
+        self.cmd = cmd
+        self.rc = rc
+        self.message = "{} failed: {}".format(" ".join(cmd), stderr.strip() or "exit status {}".format(rc))
+
+def ceph_command(module, args, binary="ceph"):
+    cmd = [module.get_bin_path(binary, required=True)] + [str(arg) for arg in args]
+    rc, out, err = module.run_command(cmd)
+    if rc != 0:
+        raise CephCommandError(cmd, rc, err)
+    return out
+
+def ceph_json(module, args):
+    return json.loads(ceph_command(module, list(args) + ["-f", "json"]) or "null")
+
+def crush_rule_ids(module):
+    return dict((rule["rule_name"], rule["rule_id"])
+                for rule in ceph_json(module, ["osd", "crush", "rule", "dump"]))
+
+def apply_with_second_pass(manager, items, results):
+    """Applies the commands manager planned for items, then plans and applies
+    again for the items that were just created.
+
+    Some settings can only be applied once pveceph has created the object.
+    manager needs read_state(), plan(items) and apply() (returning an error
+    message or None), and its planned commands in commands. The fields
+    updated by the second pass are merged into results. Returns an error
+    message or None.
+    """
+    created = [item for (item, result) in zip(items, results) if result['created']]
+    error = manager.apply()
+    if error is not None or not created:
+        return error
+
+    try:
+        manager.read_state()
+    except CephCommandError as e:
+        return e.message
+    manager.commands = []
+    second_pass = dict((result['name'], result) for result in manager.plan(created))
+    for result in results:
+        if 'updated_fields' in second_pass.get(result['name'], {}):
+            result['updated_fields'] = second_pass[result['name']]['updated_fields']
+    return manager.apply()
+
+def lvm_report(module, binary, fields, commands):
+    """Runs lvs or vgs and returns the rows of its JSON report."""
+    path = module.get_bin_path(binary)
+    if path is None:
+        raise OSError("{0} not found".format(binary))
+    cmd = [path, '--reportformat', 'json', '--units', 'b', '--nosuffix', '-o', ','.join(fields)]
+    commands.append(cmd)
+    rc, out, err = module.run_command(cmd)
+    if rc != 0:
+        raise OSError("{0} failed: {1}".format(' '.join(cmd), err.strip()))
+    rows = []
+    for report in json.loads(out)['report']:
+        rows.extend(report.get(binary[:-1], []))
+    return rows
+
+def parse_tags(lv_tags):
+    tags = {}
+    for tag in lv_tags.split(','):
+        if tag.startswith('ceph.') and '=' in tag:
+            key, value = tag.split('=', 1)
+            tags[key] = value
+    return tags
+
+def lvm_osds(module, commands):
+    """Builds the output of ceph-volume lvm list from the tags of all logical volumes."""
+    osds = {}
+    volumes = {}
+    for row in lvm_report(module, 'lvs', LVS_FIELDS, commands):
+        tags = parse_tags(row['lv_tags'])
+        if 'ceph.osd_id' not in tags:
+            continue
+        # lvs returns a row for each segment of a logical volume
+        devices = [device.split('(')[0] for device in row['devices'].split(',') if device]
+        if row['lv_uuid'] in volumes:
+            volumes[row['lv_uuid']]['devices'].extend(
+                device for device in devices if device not in volumes[row['lv_uuid']]['devices'])
+            continue
+        volume = dict((field, row[field]) for field in LVS_FIELDS if field != 'devices')
+        volume.update(
+            devices=devices,
+            name=row['lv_name'],
+            path=row['lv_path'],
+            tags=tags,
+            type=tags.get('ceph.type', ''),
+        )
+        volumes[row['lv_uuid']] = volume
+        osds.setdefault(tags['ceph.osd_id'], []).append(volume)
+    return osds
+
+def cached_lvm_osds(module, cache_path, commands):
+    """Returns the OSDs found by lvm_osds and whether they came from the cache.
+
+    The cache is valid as long as the metadata of all volume groups and the
+    devices they're on are unchanged.
+    """
+    if not cache_path:
+        return lvm_osds(module, commands), False
+
+    # Device names may change on boot without touching any LVM metadata
+    with open('/proc/sys/kernel/random/boot_id') as f:
+        boot_id = f.read().strip()
+    vgs = sorted((row['vg_uuid'], row['vg_seqno'], row['pv_name'])
+                 for row in lvm_report(module, 'vgs', VGS_FIELDS, commands))
+    tag = [boot_id] + [list(row) for row in vgs]
+
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache['tag'] == tag:
+            return cache['osds'], True
+    except (OSError, IOError, ValueError, KeyError):
+        pass
+
+    osds = lvm_osds(module, commands)
+    try:
+        tmp_path = '{0}.{1}'.format(cache_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({'tag': tag, 'osds': osds}, f)
+        os.rename(tmp_path, cache_path)
+    except (OSError, IOError):
+        pass
+    return osds, False
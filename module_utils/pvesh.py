@@ -1,11 +1,91 @@
 #!/usr/bin/python
 
+import atexit
 import subprocess
 import json
 import os
+import random
 import re
+import fcntl
+import signal
+import socket
+import ssl
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
+from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils._text import to_text
+import ansible.module_utils.pmxcfs as pmxcfs
+from urllib.parse import quote, urlencode, urlsplit
+import http.client as http_client
+
+# The local API is only used when credentials for it are provided through the
+# environment, otherwise (or when it can't be reached) we fork pvesh.
+#
+#   PVESH_BACKEND        auto (default), api or cli
+#   PVESH_API_URL        defaults to https://127.0.0.1:8006/api2/json
+#   PVESH_API_TOKEN      USER@REALM!TOKENID=SECRET
+#   PVESH_API_TICKET     PVEAuthCookie value, used along with PVESH_API_CSRF_TOKEN
+#   PVESH_API_USER       used with PVESH_API_PASSWORD to request a ticket
+#   PVESH_API_VERIFY     verify the TLS certificate of the API (default yes)
+#   PVESH_API_CA_FILE    defaults to /etc/pve/pve-root-ca.pem
+#
+# PVESH_BIN can point to another pvesh executable, e.g. tests/fake_pvesh.py.
+#
+# GETs for resources that are backed by a config file in /etc/pve are served
+# by reading that file directly, unless PVESH_LOCAL_READS is disabled.
+#
+# Every call to pvesh or the API is bounded by a timeout, and all calls made
+# by a module run can be bounded by a deadline. Both can be set with the
+# pvesh_timeout/pvesh_deadline module options or through the environment.
+#
+#   PVESH_TIMEOUT        seconds a single call may take (default 300)
+#   PVESH_DEADLINE       seconds all calls of a module run may take (default none)
+#
+# Calls failing because another writer holds a pmxcfs lock, or for other
+# transient reasons (no quorum, pmxcfs/pveproxy briefly unreachable), are
+# retried with exponential backoff and full jitter, within the deadline.
+#
+#   PVESH_RETRIES        retries per call (default 5, pvesh_retries option)
+#   PVESH_RETRY_BUDGET   seconds a module run may spend waiting between
+#                        retries (default 60, pvesh_retry_budget option)
+#
+# With PVESH_PROFILE (or the pvesh_profile option) enabled, every call made
+# through run_command is recorded (without parameter values) and returned by
+# modules as pvesh_calls.
+API_DEFAULT_URL = "https://127.0.0.1:8006/api2/json"
+API_DEFAULT_CA_FILE = "/etc/pve/pve-root-ca.pem"
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_RETRIES = 5
+DEFAULT_RETRY_BUDGET = 60
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10
+
+# Errors after which the request wasn't (and can't have been) carried out
+TRANSIENT_ERRORS = [
+    re.compile(r"got lock (request )?timeout"),
+    re.compile(r"cluster not ready - no quorum"),
+    re.compile(r"ipcc_send_rec\[\d+\] failed"),
+    re.compile(r"Transport endpoint is not connected"),
+]
+# Bad Gateway, Service Unavailable, and pveproxy's "Connection refused". These
+# don't say whether a write got through, so only reads are retried after them.
+TRANSIENT_STATUSES = [502, 503, 595]
+
+# Returned (like HTTP's Gateway Timeout) when a call didn't finish in time
+TIMEOUT_STATUS = 504
+
+# How often the status of a worker task started through the API is polled
+TASK_POLL_INTERVAL = 1
+
+HTTP_METHODS = {
+    "get": "GET",
+    "create": "POST",
+    "set": "PUT",
+    "delete": "DELETE",
+}
 
 class ProxmoxShellError(Exception):
     """Exception raised when an unexpected response code is thrown from pvesh."""
@@ -16,13 +96,629 @@ class ProxmoxShellError(Exception):
         if "data" in response:
             self.data = response["data"]
 
+class ProxmoxAPIUnavailable(Exception):
+    """Exception raised when the local API can't be used for a request."""
+
+class ProxmoxAPIRequestInterrupted(Exception):
+    """Exception raised when the connection is lost after a write was sent."""
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() in ["1", "yes", "true", "on"]
+
+class ProxmoxAPIClient(object):
+    """Minimal client for the local PVE API that reuses one keep-alive connection."""
+    def __init__(self, url=None, token=None, ticket=None, csrf_token=None,
+                 user=None, password=None, verify=True, ca_file=None, timeout=None):
+        parsed = urlsplit(url or API_DEFAULT_URL)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path.rstrip('/')
+        self.token = token
+        self.ticket = ticket
+        self.csrf_token = csrf_token
+        self.user = user
+        self.password = password
+        self.verify = verify
+        self.ca_file = ca_file
+        self.timeout = timeout
+        self.connection = None
+
+    @classmethod
+    def from_environment(cls):
+        token = os.environ.get("PVESH_API_TOKEN")
+        ticket = os.environ.get("PVESH_API_TICKET")
+        user = os.environ.get("PVESH_API_USER")
+        password = os.environ.get("PVESH_API_PASSWORD")
+        if not (token or ticket or (user and password)):
+            return None
+
+        ca_file = os.environ.get("PVESH_API_CA_FILE")
+        if ca_file is None and os.path.exists(API_DEFAULT_CA_FILE):
+            ca_file = API_DEFAULT_CA_FILE
+
+        return cls(url=os.environ.get("PVESH_API_URL"),
+                   token=token,
+                   ticket=ticket,
+                   csrf_token=os.environ.get("PVESH_API_CSRF_TOKEN"),
+                   user=user,
+                   password=password,
+                   verify=env_bool("PVESH_API_VERIFY", True),
+                   ca_file=ca_file)
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+
+        if self.scheme == "https":
+            if self.verify:
+                context = ssl.create_default_context(cafile=self.ca_file)
+                # The node certificate is issued for the node name, not for
+                # the loopback address we usually talk to.
+                context.check_hostname = False
+            else:
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            self.connection = http_client.HTTPSConnection(
+                self.host, self.port or 8006, timeout=self.timeout, context=context)
+        elif self.scheme == "http":
+            self.connection = http_client.HTTPConnection(
+                self.host, self.port or 80, timeout=self.timeout)
+        else:
+            raise ProxmoxAPIUnavailable("unsupported API URL scheme '{}'".format(self.scheme))
+
+        try:
+            self.connection.connect()
+        except (socket.error, ssl.SSLError) as e:
+            self.close()
+            raise ProxmoxAPIUnavailable(to_text(e))
+
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def login(self, timeout=None):
+        body = urlencode({"username": self.user, "password": self.password})
+        status, reason, payload = self.send("POST", "/access/ticket", body=body, auth=False,
+                                            timeout=timeout)
+        if status != 200 or not isinstance(payload, dict) or not payload.get("data"):
+            raise ProxmoxAPIUnavailable("unable to obtain a ticket: {} {}".format(status, reason))
+        self.ticket = payload["data"]["ticket"]
+        self.csrf_token = payload["data"]["CSRFPreventionToken"]
+
+    def headers(self, method):
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = "PVEAPIToken={}".format(self.token)
+        elif self.ticket:
+            headers["Cookie"] = "PVEAuthCookie={}".format(quote(self.ticket, safe=''))
+            if method != "GET" and self.csrf_token:
+                headers["CSRFPreventionToken"] = self.csrf_token
+        return headers
+
+    def send(self, method, resource, body=None, auth=True, timeout=None):
+        headers = self.headers(method) if auth else {"Accept": "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        # A kept-alive connection may have been closed by the server in the
+        # meantime, in which case we reconnect and try exactly once more.
+        # Writes are only replayed if they couldn't be sent at all, as the
+        # server may otherwise have carried them out already.
+        for attempt in range(2):
+            connection = self.connect()
+            connection.sock.settimeout(self.timeout if timeout is None else timeout)
+            sent = False
+            try:
+                connection.request(method, self.path + resource, body=body, headers=headers)
+                sent = True
+                response = connection.getresponse()
+                raw = response.read()
+                break
+            except socket.timeout:
+                raise
+            except (socket.error, ssl.SSLError, http_client.HTTPException) as e:
+                self.close()
+                if sent and method != "GET":
+                    raise ProxmoxAPIRequestInterrupted(to_text(e))
+                if attempt or not isinstance(e, (http_client.RemoteDisconnected, http_client.BadStatusLine,
+                                                 BrokenPipeError, ConnectionResetError)):
+                    raise ProxmoxAPIUnavailable(to_text(e))
+
+        if response.getheader("Connection", "").lower() == "close":
+            self.close()
+
+        try:
+            payload = json.loads(to_text(raw)) if raw else None
+        except ValueError:
+            payload = to_text(raw)
+
+        return (response.status, to_text(response.reason), payload)
+
+    def request(self, handler, resource, params, timeout=None):
+        if not self.token and not self.ticket:
+            self.login(timeout)
+
+        method = HTTP_METHODS[handler]
+        query = urlencode(params, doseq=True)
+        path = "/" + quote(resource, safe="/!@:=.-_~")
+        body = None
+        if method in ["GET", "DELETE"]:
+            if query:
+                path = "{}?{}".format(path, query)
+        else:
+            body = query
+
+        status, reason, payload = self.send(method, path, body=body, timeout=timeout)
+        return response_from_api(handler, resource, status, reason, payload)
+
+def response_from_api(handler, resource, status, reason, payload):
+    # Translates an API response into what run_command returns for pvesh
+    if status == 200:
+        data = payload.get("data") if isinstance(payload, dict) else payload
+        if data is None:
+            return {u"status": 200}
+        return {u"status": 200, u"data": data}
+
+    lines = [reason]
+    if isinstance(payload, dict) and isinstance(payload.get("errors"), dict):
+        lines += ["{}: {}".format(k, v.strip()) for k, v in sorted(payload["errors"].items())]
+
+    if status == 400:
+        return {u"status": 400, u"message": u"\n".join(lines)}
+
+    if status == 501 and reason.startswith("Method "):
+        return {u"status": 405, u"message": "no '{}' handler for '{}'".format(handler, resource)}
+
+    if status == 500 and handler == "get" and is_not_found(reason):
+        return {u"status": 404, u"message": reason}
+
+    return {u"status": status, u"message": u"\n".join(lines)}
+
+def is_not_found(message):
+    return any(re.match(pattern, message) for pattern in [
+        r"^no such user \('.{3,64}?'\)$",
+        r"^(group|role|pool) '[A-Za-z0-9\.\-_]+' does not exist$",
+        r"^domain '[A-Za-z][A-Za-z0-9\.\-_]+' does not exist$"])
+
+# GET responses for resources that only depend on (a few) files in pmxcfs are
+# cached on the host, tagged with the change counters pmxcfs keeps for those
+# files in /etc/pve/.version. An entry is only used while the counters (and
+# pmxcfs' start time) are unchanged, so lookups repeated by consecutive module
+# runs are free until the underlying file actually changes. Resources whose
+# responses include runtime state (e.g. pool members) aren't cached.
+#
+#   PVESH_CACHE          enable the cache (default yes)
+#   PVESH_CACHE_DIR      defaults to /run/ansible-pvesh
+#   PVESH_CACHE_SIZE     maximum number of entries (default 256)
+#   PVESH_CACHE_BYTES    maximum total size of entries (default 16 MiB)
+#   PVESH_CACHE_TTL      maximum age of an entry in seconds (default 3600)
+CACHE_DEFAULT_DIR = "/run/ansible-pvesh"
+
+CACHE_SOURCES = [
+    (r"^access/users(/|$)", ["user.cfg", "domains.cfg", "priv/tfa.cfg"]),
+    (r"^access/(groups|roles|acl)(/|$)", ["user.cfg"]),
+    (r"^access/domains(/|$)", ["domains.cfg"]),
+    (r"^storage(/|$)", ["storage.cfg"]),
+    (r"^cluster/metrics/server(/|$)", ["status.cfg"]),
+    (r"^cluster/ha/groups(/|$)", ["ha/groups.cfg"]),
+    (r"^cluster/options$", ["datacenter.cfg"]),
+]
+
+def cache_sources(resource):
+    for (pattern, sources) in CACHE_SOURCES:
+        if re.match(pattern, resource):
+            return sources
+    return None
+
+class GetCache(object):
+    """Size-bounded LRU cache of GET responses, shared by module runs on a host."""
+    def __init__(self, directory, size, max_bytes, ttl):
+        self.directory = directory
+        self.path = os.path.join(directory, "cache.json")
+        self.lock_path = os.path.join(directory, "cache.lock")
+        self.size = size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.stamp = None
+        # Keys of entries used since the file was last saved
+        self.used = []
+
+    @classmethod
+    def from_environment(cls):
+        if not env_bool("PVESH_CACHE", True) or not pmxcfs.available():
+            return None
+        try:
+            directory = os.environ.get("PVESH_CACHE_DIR", CACHE_DEFAULT_DIR)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            return cls(directory,
+                       int(os.environ.get("PVESH_CACHE_SIZE", 256)),
+                       int(os.environ.get("PVESH_CACHE_BYTES", 16 * 1024 * 1024)),
+                       float(os.environ.get("PVESH_CACHE_TTL", 3600)))
+        except (OSError, ValueError):
+            return None
+
+    def key(self, resource, params):
+        if not params:
+            return resource
+        return "{}?{}".format(resource, urlencode(sorted(params.items()), doseq=True))
+
+    def tag(self, resource):
+        sources = cache_sources(resource)
+        if sources is None:
+            return None
+        versions = pmxcfs.read_versions()
+        if versions is None:
+            return None
+        return [versions.get("starttime")] + [versions.get(source, 0) for source in sources]
+
+    def lookup(self, key, tag):
+        with self.locked():
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry["tag"] != tag or time.time() - entry["time"] > self.ttl:
+                # Replaced by store() once the resource was read again
+                return None
+            # The new order is only saved along with the next change, or
+            # by flush() when the module exits
+            self.used.append(key)
+            return entry["response"]
+
+    def store(self, key, tag, response):
+        size = len(json.dumps(response))
+        if size > self.max_bytes:
+            return
+        with self.locked():
+            self.touch()
+            self.entries.pop(key, None)
+            self.entries[key] = {"tag": tag, "time": time.time(), "size": size, "response": response}
+            total = sum(entry["size"] for entry in self.entries.values())
+            while len(self.entries) > self.size or total > self.max_bytes:
+                (_, evicted) = self.entries.popitem(last=False)
+                total -= evicted["size"]
+            self.save()
+
+    def invalidate(self, resource):
+        sources = cache_sources(resource)
+        if sources is None:
+            return
+        with self.locked():
+            stale = [key for key in self.entries
+                     if any(source in sources for source in cache_sources(key.split("?")[0]) or [])]
+            for key in stale:
+                del self.entries[key]
+            if stale:
+                self.save()
+
+    def touch(self):
+        # Moves the entries used by lookup() to the end, since load() may
+        # have replaced the ones we had moved with another run's
+        for key in self.used:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        self.used = []
+
+    def flush(self):
+        if not self.used:
+            return
+        with self.locked():
+            self.touch()
+            self.save()
+
+    @contextmanager
+    def locked(self):
+        fd = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self.load()
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self.entries = OrderedDict()
+            self.stamp = None
+            return
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp == self.stamp:
+            return
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f, object_pairs_hook=OrderedDict)
+        except ValueError:
+            self.entries = OrderedDict()
+        self.stamp = stamp
+
+    def save(self):
+        tmp_path = "{}.{}".format(self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self.stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+
+_cache = None
+_cache_disabled = False
+
+def get_cache():
+    global _cache, _cache_disabled
+    if _cache is None and not _cache_disabled:
+        _cache = GetCache.from_environment()
+        _cache_disabled = _cache is None
+        if _cache is not None:
+            atexit.register(_cache.flush)
+    return _cache
+
+PVESH_ARGUMENT_SPEC = dict(
+    pvesh_timeout=dict(type='float', default=None),
+    pvesh_deadline=dict(type='float', default=None),
+    pvesh_retries=dict(type='int', default=None),
+    pvesh_retry_budget=dict(type='float', default=None),
+    pvesh_profile=dict(type='bool', default=None),
+)
+
+class PveshModule(AnsibleModule):
+    """AnsibleModule which also accepts the options controlling pvesh calls."""
+    def __init__(self, argument_spec, **kwargs):
+        spec = dict(PVESH_ARGUMENT_SPEC)
+        spec.update(argument_spec)
+        super(PveshModule, self).__init__(argument_spec=spec, **kwargs)
+        configure(timeout=self.params['pvesh_timeout'],
+                  deadline=self.params['pvesh_deadline'],
+                  retries=self.params['pvesh_retries'],
+                  retry_budget=self.params['pvesh_retry_budget'],
+                  profile=self.params['pvesh_profile'])
+
+    def exit_json(self, **kwargs):
+        kwargs.update(statistics())
+        super(PveshModule, self).exit_json(**kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        kwargs.update(statistics())
+        super(PveshModule, self).fail_json(msg, **kwargs)
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+_timeout = env_float("PVESH_TIMEOUT", DEFAULT_TIMEOUT)
+_deadline = env_float("PVESH_DEADLINE", None)
+_retries = int(env_float("PVESH_RETRIES", DEFAULT_RETRIES))
+_retry_budget = env_float("PVESH_RETRY_BUDGET", DEFAULT_RETRY_BUDGET)
+_profile = env_bool("PVESH_PROFILE", False)
+_started = time.monotonic()
+
+# Reported in the module's result by PveshModule
+_stats = {"retries": 0, "retry_wait": 0.0}
+_calls = []
+# Which backend answered the current call, see run_command
+_backend_used = None
+
+def configure(timeout=None, deadline=None, retries=None, retry_budget=None, profile=None):
+    global _timeout, _deadline, _retries, _retry_budget, _profile
+    if profile is not None:
+        _profile = profile
+    if timeout is not None:
+        _timeout = timeout
+    if deadline is not None:
+        _deadline = deadline
+    if retries is not None:
+        _retries = retries
+    if retry_budget is not None:
+        _retry_budget = retry_budget
+
+def statistics():
+    result = dict(pvesh_retries=_stats["retries"],
+                  pvesh_retry_wait=round(_stats["retry_wait"], 3))
+    if _profile:
+        result["pvesh_calls"] = _calls
+    return result
+
+def response_size(response):
+    if "data" not in response:
+        return 0
+    if isinstance(response["data"], str):
+        return len(response["data"])
+    return len(json.dumps(response["data"], separators=(',', ':')))
+
+def call_timeout():
+    # Returns how long the next call may take, which is 0 once the deadline
+    # has passed, or None if there's no limit at all.
+    timeout = _timeout if _timeout else None
+    if _deadline:
+        remaining = max(_deadline - (time.monotonic() - _started), 0)
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    return timeout
+
+def timeout_response(handler, resource, timeout):
+    if timeout == 0:
+        message = u"Deadline of {}s for pvesh calls exceeded before '{} {}'".format(
+            _deadline, handler, resource)
+    else:
+        message = u"'{} {}' timed out after {:.1f}s".format(handler, resource, timeout)
+    return {u"status": TIMEOUT_STATUS, u"message": message}
+
+_api_client = None
+_api_unavailable = False
+
+def api_client():
+    global _api_client
+    if _api_client is None:
+        _api_client = ProxmoxAPIClient.from_environment()
+    return _api_client
+
+def run_api_command(handler, resource, params, timeout):
+    global _api_unavailable
+    client = api_client()
+    if client is None:
+        raise ProxmoxAPIUnavailable("no credentials configured for the local API")
+
+    try:
+        return client.request(handler, resource, params, timeout)
+    except socket.timeout:
+        # The request may still be processed, so this must not make us retry
+        # it through pvesh. Drop the connection so no late response is read.
+        client.close()
+        return timeout_response(handler, resource, timeout)
+    except ProxmoxAPIRequestInterrupted as e:
+        # Same as above, this must neither be retried nor sent through pvesh
+        return {u"status": 500, u"message": u"Connection to the local API was lost during '{} {}', "
+                                            u"it may have been carried out: {}".format(handler, resource, e)}
+    except (ProxmoxAPIUnavailable, socket.error, ssl.SSLError, http_client.HTTPException):
+        # Don't bother with the API for the rest of this module's run
+        client.close()
+        _api_unavailable = True
+        raise
+
 def run_command(handler, resource, **params):
+    global _backend_used
     # pvesh strips these before handling, so might as well
     resource = resource.strip('/')
     # pvesh only has lowercase handlers
     handler = handler.lower()
+
+    if not _profile:
+        return dispatch_command(handler, resource, params)
+
+    _backend_used = None
+    retries = _stats["retries"]
+    started = time.monotonic()
+    response = dispatch_command(handler, resource, params)
+    _calls.append({
+        "handler": handler,
+        "resource": resource,
+        "params": sorted(params),
+        "backend": _backend_used,
+        "time": round(time.monotonic() - started, 6),
+        "retries": _stats["retries"] - retries,
+        "status": response["status"],
+        "size": response_size(response),
+    })
+    return response
+
+def dispatch_command(handler, resource, params):
+    global _backend_used
+    cache = get_cache()
+
+    if handler != "get":
+        response = run_backend_command(handler, resource, **params)
+        if cache is not None:
+            cache.invalidate(resource)
+        return response
+
+    if env_bool("PVESH_LOCAL_READS", True):
+        response = pmxcfs.read(resource, **params)
+        if response is not None:
+            _backend_used = "pmxcfs"
+            return response
+
+    # The tag has to be read before the resource itself, so that a change
+    # in between can only make the cached entry look older than it is.
+    tag = cache.tag(resource) if cache is not None else None
+    if tag is None:
+        return run_backend_command(handler, resource, **params)
+
+    key = cache.key(resource, params)
+    response = cache.lookup(key, tag)
+    if response is not None:
+        _backend_used = "cache"
+    else:
+        response = run_backend_command(handler, resource, **params)
+        if response["status"] in [200, 404]:
+            cache.store(key, tag, response)
+
+    return response
+
+def is_transient(handler, response):
+    if response["status"] in TRANSIENT_STATUSES:
+        return handler == "get"
+    if response["status"] != 500:
+        return False
+    message = response.get("message") or ""
+    return any(pattern.search(message) for pattern in TRANSIENT_ERRORS)
+
+def retry_delay(attempt):
+    # Exponential backoff with full jitter, so that concurrent writers
+    # waiting on the same lock don't all come back at the same time.
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def run_backend_command(handler, resource, **params):
+    attempt = 0
+    while True:
+        response = run_backend_attempt(handler, resource, params)
+        if attempt >= _retries or not is_transient(handler, response):
+            return response
+
+        delay = min(retry_delay(attempt), _retry_budget - _stats["retry_wait"])
+        timeout = call_timeout()
+        # Only wait if there's time left to make another attempt afterwards
+        if delay <= 0 or (timeout is not None and delay >= timeout):
+            return response
+
+        time.sleep(delay)
+        _stats["retries"] += 1
+        _stats["retry_wait"] += delay
+        attempt += 1
+
+def run_backend_attempt(handler, resource, params):
+    global _backend_used
+    _backend_used = None
+    timeout = call_timeout()
+    if timeout == 0:
+        return timeout_response(handler, resource, timeout)
+
+    backend = os.environ.get("PVESH_BACKEND", "auto").lower()
+    if backend == "api" and api_client() is None:
+        # Not transient, so that this fails right away instead of being retried
+        return {u"status": 500, u"message": u"PVESH_BACKEND is set to api, but no credentials "
+                                            u"for the local API are configured"}
+    if backend == "api" or (backend == "auto" and not _api_unavailable):
+        try:
+            _backend_used = "api"
+            return run_api_command(handler, resource, params, timeout)
+        except (ProxmoxAPIUnavailable, socket.error, ssl.SSLError, http_client.HTTPException) as e:
+            if backend == "api":
+                return {u"status": 503, u"message": u"Local API is unavailable: {}".format(to_text(e))}
+
+    _backend_used = "cli"
+    return run_cli_command(handler, resource, params, call_timeout())
+
+def kill_process_group(pipe):
+    # pvesh may have spawned children of its own (e.g. when it's stuck on a
+    # storage), so we kill its whole process group rather than just pvesh.
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+        try:
+            os.killpg(pipe.pid, sig)
+        except OSError:
+            return
+        try:
+            pipe.communicate(timeout=2)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+    # A process in uninterruptible sleep can't be reaped until its I/O
+    # completes. Don't wait for it, that's the whole point of the timeout.
+
+def run_cli_command(handler, resource, params, timeout=None):
     command = [
-        "/usr/bin/pvesh",
+        os.environ.get("PVESH_BIN", "/usr/bin/pvesh"),
         handler,
         resource,
         "--output=json"]
@@ -34,8 +730,13 @@ def run_command(handler, resource, **params):
 
     cmd_env = dict(os.environ)
     cmd_env["LC_ALL"] = "C"
-    pipe = subprocess.Popen(command, env=cmd_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    (result, stderr) = pipe.communicate()
+    pipe = subprocess.Popen(command, env=cmd_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            start_new_session=True)
+    try:
+        (result, stderr) = pipe.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_process_group(pipe)
+        return timeout_response(handler, resource, timeout)
     result = to_text(result)
     stderr = to_text(stderr).splitlines()
 
@@ -60,12 +761,8 @@ def run_command(handler, resource, **params):
         if stderr[0] == "no '{}' handler for '{}'".format(handler, resource):
             return {u"status": 405, u"message": stderr[0]}
 
-        if handler == "get":
-            if any(re.match(pattern, stderr[0]) for pattern in [
-                r"^no such user \('.{3,64}?'\)$",
-                r"^(group|role|pool) '[A-Za-z0-9\.\-_]+' does not exist$",
-                r"^domain '[A-Za-z][A-Za-z0-9\.\-_]+' does not exist$"]):
-                return {u"status": 404, u"message": stderr[0]}
+        if handler == "get" and is_not_found(stderr[0]):
+            return {u"status": 404, u"message": stderr[0]}
 
         # This will occur when a param is invalid
         if len(stderr) >=2 and stderr[-2].startswith("400 unable to parse"):
@@ -75,8 +772,8 @@ def run_command(handler, resource, **params):
 
     return {u"status": 500, u"message": u"Unexpected result occurred but no error message was provided by pvesh."}
 
-def get(resource):
-    response = run_command("get", resource)
+def get(resource, **params):
+    response = run_command("get", resource, **params)
 
     if response["status"] == 404:
         return None
@@ -103,3 +800,31 @@ def set(resource, **params):
 
     if response["status"] != 200:
         raise ProxmoxShellError(response)
+
+def run_task(resource, **params):
+    """Creates resource and waits for the worker task this starts to finish.
+
+    pvesh runs workers in the foreground, but the API returns their UPID
+    right away, so their status has to be polled until they've stopped.
+    """
+    response = run_command("create", resource, **params)
+
+    if response["status"] != 200:
+        raise ProxmoxShellError(response)
+
+    upid = response.get("data")
+    if not isinstance(upid, str) or not upid.startswith("UPID:"):
+        return
+    node = upid.split(":")[1]
+
+    while True:
+        status = get("nodes/{}/tasks/{}/status".format(node, upid))
+        if status is not None and status.get("status") == "stopped":
+            break
+        if call_timeout() == 0:
+            raise ProxmoxShellError(timeout_response("create", resource, 0))
+        time.sleep(TASK_POLL_INTERVAL)
+
+    if status.get("exitstatus") != "OK":
+        raise ProxmoxShellError({u"status": 500, u"message": u"Task {} failed: {}".format(
+            upid, status.get("exitstatus"))})
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmarks the role's access, storage and metric server modules.
+
+Each module is run once per object, the way Ansible would run it, against
+fake_pvesh.py: first to create the objects (unconverged), then again with the
+same arguments (converged). proxmox_access is instead run once with all the
+objects of the other access modules. For every module, state and number of objects,
+the number of pvesh calls and the wall time are reported.
+
+    ./tests/benchmark.py --sizes 10,100 --latency 0.6 --modules proxmox_user
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_PVESH = os.path.join(ROLE_DIR, "tests", "fake_pvesh.py")
+
+# Runs a module from library/ with its arguments the same way AnsiballZ would,
+# except that module_utils are imported from this role.
+BOOTSTRAP = """
+import json, runpy, sys
+import ansible.module_utils
+ansible.module_utils.__path__.append({module_utils!r})
+import ansible.module_utils.basic as basic
+basic._ANSIBLE_ARGS = json.dumps({{"ANSIBLE_MODULE_ARGS": json.loads(sys.argv[2])}}).encode()
+basic._ANSIBLE_PROFILE = "legacy"
+sys.argv = [sys.argv[1]]
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+
+def group_args(i):
+    return {"name": "bench-g{}".format(i), "comment": "Benchmark group {}".format(i)}
+
+
+def user_args(i):
+    return {"name": "bench-u{}@pve".format(i), "firstname": "Bench", "lastname": str(i),
+            "email": "bench{}@example.com".format(i), "groups": ["bench-g0"]}
+
+
+def role_args(i):
+    return {"name": "bench-r{}".format(i), "privileges": ["VM.Audit", "Sys.Audit"]}
+
+
+def acl_args(i):
+    return {"path": "/vms/{}".format(100 + i), "roles": ["PVEAuditor"],
+            "users": ["bench-u{}@pve".format(i)]}
+
+
+def pool_args(i):
+    return {"name": "bench-p{}".format(i), "comment": "Benchmark pool {}".format(i)}
+
+
+def storage_args(i):
+    return {"name": "bench-s{}".format(i), "type": "dir", "path": "/srv/bench{}".format(i),
+            "content": ["images", "rootdir"]}
+
+
+def metric_server_args(i):
+    return {"id": "bench-m{}".format(i), "server": "10.1.{}.{}".format(i // 250, i % 250 + 1),
+            "port": 8089}
+
+
+# In dependency order: users are created in a group and ACLs refer to users.
+MODULES = [
+    ("proxmox_group", group_args),
+    ("proxmox_user", user_args),
+    ("proxmox_role", role_args),
+    ("proxmox_acl", acl_args),
+    ("proxmox_pool", pool_args),
+    ("proxmox_storage", storage_args),
+    ("proxmox_metric_server", metric_server_args),
+]
+
+# proxmox_access takes all objects in a single run
+BULK_MODULES = {
+    "proxmox_access": [
+        ("pools", pool_args), ("roles", role_args), ("groups", group_args),
+        ("users", user_args), ("acls", acl_args),
+    ],
+}
+
+
+def pvesh_calls(state_file):
+    with open(state_file) as f:
+        return sum(json.load(f)["calls"].values())
+
+
+def run_module(module, args, env):
+    path = os.path.join(ROLE_DIR, "library", "{}.py".format(module))
+    bootstrap = BOOTSTRAP.format(module_utils=os.path.join(ROLE_DIR, "module_utils"))
+    process = subprocess.run([sys.executable, "-c", bootstrap, path, json.dumps(args)],
+                             env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        result = json.loads(process.stdout)
+    except ValueError:
+        raise RuntimeError("{} failed: {}".format(module, process.stderr.decode()))
+    if result.get("failed"):
+        raise RuntimeError("{} failed with {}: {}".format(module, args, result.get("msg")))
+    return result
+
+
+def bulk_args(module, size):
+    return dict((option, [make_args(i) for i in range(size)])
+                for option, make_args in BULK_MODULES[module])
+
+
+def benchmark(size, modules, env, state_file):
+    results = []
+    for module, make_args in MODULES + [(module, None) for module in BULK_MODULES]:
+        if module not in modules:
+            continue
+        for state in ["unconverged", "converged"]:
+            calls = pvesh_calls(state_file)
+            changed = 0
+            started = time.monotonic()
+            if module in BULK_MODULES:
+                result = run_module(module, bulk_args(module, size), env)
+                changed = sum(obj["changed"] for option, _ in BULK_MODULES[module]
+                              for obj in result[option])
+            for i in range(size if make_args else 0):
+                changed += bool(run_module(module, make_args(i), env).get("changed"))
+            results.append({
+                "module": module,
+                "objects": size,
+                "state": state,
+                "changed": changed,
+                "pvesh_calls": pvesh_calls(state_file) - calls,
+                "time": time.monotonic() - started,
+            })
+            report(results[-1])
+    return results
+
+
+def report(result):
+    print("{module:<24} {objects:>6} {state:<12} {changed:>7} {pvesh_calls:>8} "
+          "{time:>10.2f} {per_object:>10.1f}".format(
+              per_object=result["time"] / result["objects"] * 1000, **result))
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000",
+                        help="comma-separated numbers of objects (default: %(default)s)")
+    parser.add_argument("--modules", default=",".join([module for module, _ in MODULES] + list(BULK_MODULES)),
+                        help="comma-separated modules to benchmark (default: all)")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds every pvesh call takes (default: %(default)s)")
+    parser.add_argument("--lock-errors", type=float, default=0,
+                        help="probability that a write fails on a cfs-lock (default: %(default)s)")
+    parser.add_argument("--json", help="also write the results to this file")
+    options = parser.parse_args()
+
+    modules = options.modules.split(",")
+    for module in modules:
+        if module not in dict(MODULES) and module not in BULK_MODULES:
+            parser.error("unknown module '{}'".format(module))
+    # The groups users are created in
+    if "proxmox_user" in modules and "proxmox_group" not in modules:
+        modules.append("proxmox_group")
+    if "proxmox_acl" in modules and "proxmox_user" not in modules:
+        modules += ["proxmox_group", "proxmox_user"]
+    # Runs the bulk module against a fresh state rather than after the others
+    bulk = [module for module in modules if module in BULK_MODULES]
+    modules = [module for module in modules if module not in BULK_MODULES]
+
+    print("{:<24} {:>6} {:<12} {:>7} {:>8} {:>10} {:>10}".format(
+        "module", "objects", "state", "changed", "calls", "time (s)", "ms/object"))
+    results = []
+    for size in [int(size) for size in options.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as directory:
+            state_file = os.path.join(directory, "state.json")
+            env = dict(os.environ,
+                       PVESH_BIN=FAKE_PVESH,
+                       PVESH_BACKEND="cli",
+                       PVESH_LOCAL_READS="no",
+                       PVESH_CACHE="no",
+                       PVESH_FAKE_STATE=state_file,
+                       PVESH_FAKE_LATENCY=str(options.latency),
+                       PVESH_FAKE_LOCK_ERRORS=str(options.lock_errors))
+            # Creates the initial state
+            subprocess.run([FAKE_PVESH, "get", "cluster/status"], env=env,
+                           stdout=subprocess.DEVNULL, check=True)
+            if modules:
+                results += benchmark(size, modules, env, state_file)
+            os.unlink(state_file)
+            subprocess.run([FAKE_PVESH, "get", "cluster/status"], env=env,
+                           stdout=subprocess.DEVNULL, check=True)
+            if bulk:
+                results += benchmark(size, bulk, env, state_file)
+
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stand-in for the PVE API, to test the role's API client against.
+
+It listens on a loopback port over plain HTTP, authenticates requests like
+pveproxy does (API tokens, or tickets obtained from /access/ticket with a CSRF
+token for writes) and records every request it gets. Responses are scripted
+per method and path; anything that isn't scripted is answered with its own
+method and parameters, so that tests can see what was sent.
+
+    api = FakePVEAPI(token="root@pam!test=secret")
+    api.script("POST", "/nodes", (500, "cfs-lock 'file-user_cfg' error: got lock request timeout"))
+    api.start()
+    ...  # point PVESH_API_URL at api.url
+    api.stop()
+
+Scripted responses are (status, reason) or (status, reason, payload) tuples,
+used in order with the last one repeating, or DROP to close the connection
+without answering.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+API_PATH = "/api2/json"
+TICKET = "PVE:root@pam:4EEC61E2::fake"
+CSRF_TOKEN = "4EEC61E2:fake"
+
+DROP = object()
+
+
+class FakePVEAPI(object):
+    def __init__(self, token=None, user=None, password=None):
+        self.token = token
+        self.user = user
+        self.password = password
+        self.requests = []
+        self.scripts = {}
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}{}".format(self.server.server_address[1], API_PATH)
+
+    def script(self, method, path, *responses):
+        self.scripts[(method, path)] = list(responses)
+
+    def start(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler_for(self))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def next_response(self, method, path):
+        responses = self.scripts.get((method, path))
+        if not responses:
+            return None
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def authenticated(self, method, headers):
+        if self.token is not None and headers.get("Authorization") == "PVEAPIToken={}".format(self.token):
+            return True
+        cookies = dict(cookie.strip().partition("=")[::2] for cookie in headers.get("Cookie", "").split(";"))
+        if self.user is not None and unquote(cookies.get("PVEAuthCookie", "")) == TICKET:
+            return method == "GET" or headers.get("CSRFPreventionToken") == CSRF_TOKEN
+        return False
+
+
+def handler_for(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def handle_any(self):
+            url = urlsplit(self.path)
+            path = unquote(url.path)[len(API_PATH):]
+            query = url.query
+            if self.command in ["POST", "PUT"]:
+                query = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+            params = dict((key, values[0] if len(values) == 1 else values)
+                          for (key, values) in parse_qs(query).items())
+            api.requests.append({"method": self.command, "path": path, "params": params,
+                                 "headers": dict(self.headers)})
+
+            if path == "/access/ticket" and self.command == "POST":
+                if (params.get("username"), params.get("password")) != (api.user, api.password):
+                    return self.reply(401, "authentication failure")
+                return self.reply(200, "OK", {"data": {"ticket": TICKET, "CSRFPreventionToken": CSRF_TOKEN,
+                                                       "username": api.user}})
+            if not api.authenticated(self.command, self.headers):
+                return self.reply(401, "No ticket")
+
+            response = api.next_response(self.command, path)
+            if response is DROP:
+                self.close_connection = True
+                return
+            if response is None:
+                response = (200, "OK", {"data": {"method": self.command, "params": params}})
+            self.reply(*response)
+
+        def reply(self, status, reason, payload=None):
+            body = json.dumps(payload if payload is not None else {"data": None}).encode()
+            self.send_response(status, reason)
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = do_PUT = do_DELETE = handle_any
+
+    return Handler
@@ -0,0 +1,597 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stand-in for pvesh that keeps a model of a PVE cluster's configuration.
+
+Point the role's modules at it with PVESH_BIN (and PVESH_BACKEND=cli,
+PVESH_LOCAL_READS=no) to exercise or benchmark them without a PVE node. It
+emulates pvesh's output and error messages for /access/{users,groups,roles,acl},
+/access/domains, /pools, /storage, /cluster/metrics/server, /cluster/options,
+/cluster/ha/{groups,resources} and /cluster/status.
+
+    PVESH_FAKE_STATE        JSON file holding the model (default
+                            /tmp/fake-pvesh.json), created on first use
+    PVESH_FAKE_LATENCY      seconds every call takes, e.g. 0.6 to emulate the
+                            startup time of the real pvesh
+    PVESH_FAKE_LOCK_ERRORS  probability (0-1) that a write fails with a cfs-lock
+                            timeout
+    PVESH_FAKE_FAIL         regex of "<handler> <resource>" calls that always
+                            fail with a 500
+
+Every call is counted per handler in the "calls" key of the state file.
+"""
+
+import fcntl
+import json
+import os
+import random
+import re
+import sys
+import time
+
+STATE_FILE = os.environ.get("PVESH_FAKE_STATE", "/tmp/fake-pvesh.json")
+
+# Parameters which PVE stores (and returns) as integers
+INTEGER_KEYS = [
+    "enable", "expire", "propagate", "shared", "disable", "krbd", "maxfiles",
+    "sparse", "port", "mtu", "timeout", "max-body-size", "verify-certificate",
+    "create-subdirs", "snapshot-as-volume-chain",
+]
+
+BUILTIN_ROLES = {
+    "Administrator": "Datastore.Allocate,Datastore.Audit,Group.Allocate,Permissions.Modify,"
+                     "Pool.Allocate,Realm.Allocate,Sys.Audit,Sys.Modify,User.Modify,VM.Audit",
+    "NoAccess": "",
+    "PVEAdmin": "Datastore.Allocate,Datastore.Audit,Pool.Allocate,Sys.Audit,VM.Audit",
+    "PVEAuditor": "Datastore.Audit,Pool.Audit,Sys.Audit,VM.Audit",
+    "PVEDatastoreUser": "Datastore.AllocateSpace,Datastore.Audit",
+    "PVEPoolAdmin": "Pool.Allocate,Pool.Audit",
+    "PVEUserAdmin": "Group.Allocate,Realm.AllocateUser,User.Modify",
+    "PVEVMUser": "VM.Audit,VM.Console,VM.PowerMgmt",
+}
+
+
+class PveshError(Exception):
+    def __init__(self, lines, code=255):
+        super(PveshError, self).__init__(lines)
+        self.lines = lines if isinstance(lines, list) else [lines]
+        self.code = code
+
+
+def initial_state():
+    return {
+        "calls": {},
+        "users": {"root@pam": {"enable": 1, "expire": 0, "email": "root@localhost"}},
+        "groups": {},
+        "roles": dict((roleid, {"privs": privs, "special": 1})
+                      for roleid, privs in BUILTIN_ROLES.items()),
+        "acl": [],
+        "pools": {},
+        "storage": {
+            "local": {"type": "dir", "path": "/var/lib/vz", "content": "iso,vztmpl,backup"},
+            "local-lvm": {"type": "lvmthin", "vgname": "pve", "thinpool": "data",
+                          "content": "rootdir,images"},
+        },
+        "metrics": {},
+        "options": {},
+        "ha_groups": {},
+        "ha_resources": {},
+        "nodes": ["pve01"],
+        "domains": {"pam": {"type": "pam"}, "pve": {"type": "pve"}},
+        # The users (with their properties) and groups (with their members)
+        # found in the directory of each LDAP/AD realm
+        "directories": {},
+    }
+
+
+def usage(handler, resource):
+    return "pvesh {} {} [OPTIONS] [FORMAT_OPTIONS]".format(handler, resource)
+
+
+def verification_failed(handler, resource, errors):
+    lines = ["400 Parameter verification failed."]
+    lines += ["{}: {}".format(key, message) for key, message in sorted(errors.items())]
+    lines += ["", usage(handler, resource)]
+    raise PveshError(lines)
+
+
+def require(handler, resource, params, *keys):
+    missing = dict((key, "property is missing and it is not optional")
+                   for key in keys if key not in params)
+    if missing:
+        verification_failed(handler, resource, missing)
+
+
+def split_list(value):
+    return [item for item in re.split(r"[,;\s]+", value or "") if item]
+
+
+def parse_args(argv):
+    if len(argv) < 2:
+        raise PveshError("ERROR: no command specified")
+    handler, resource = argv[0], argv[1].strip("/")
+    params = {}
+    args = argv[2:]
+    while args:
+        arg = args.pop(0)
+        if not arg.startswith("--"):
+            raise PveshError("400 unable to parse option\n{}".format(usage(handler, resource)))
+        key = arg[2:]
+        if "=" in key:
+            key, value = key.split("=", 1)
+        elif args:
+            value = args.pop(0)
+        else:
+            value = "1"
+        if key == "output":
+            continue
+        if key in INTEGER_KEYS and re.match(r"^-?\d+$", value):
+            value = int(value)
+        if key in params:
+            if not isinstance(params[key], list):
+                params[key] = [params[key]]
+            params[key].append(value)
+        else:
+            params[key] = value
+    return handler, resource, params
+
+
+def listing(collection, key):
+    return [dict(item, **{key: name}) for name, item in sorted(collection.items())]
+
+
+def lookup(collection, name, message):
+    if name not in collection:
+        raise PveshError(message)
+    return collection[name]
+
+
+def user_groups(state, userid):
+    return sorted(groupid for groupid, group in state["groups"].items()
+                  if userid in group.get("members", []))
+
+
+def set_user_groups(state, userid, groups):
+    for groupid in groups:
+        lookup(state["groups"], groupid, "no such group ('{}')".format(groupid))
+    for groupid, group in state["groups"].items():
+        members = [member for member in group.get("members", []) if member != userid]
+        if groupid in groups:
+            members.append(userid)
+        group["members"] = members
+
+
+def handle_users(state, handler, resource, params):
+    parts = resource.split("/")
+    users = state["users"]
+    if len(parts) == 2:
+        if handler == "get":
+            result = []
+            for userid, user in sorted(users.items()):
+                entry = dict(user, userid=userid, **{"realm-type": userid.split("@")[-1]})
+                if params.get("full"):
+                    entry["groups"] = ",".join(user_groups(state, userid))
+                result.append(entry)
+            return result
+        if handler == "create":
+            require(handler, resource, params, "userid")
+            userid = params.pop("userid")
+            if userid in users:
+                raise PveshError("create user failed: user '{}' already exists".format(userid))
+            groups = split_list(params.pop("groups", ""))
+            params.pop("password", None)
+            params.setdefault("enable", 1)
+            params.setdefault("expire", 0)
+            users[userid] = params
+            set_user_groups(state, userid, groups)
+            return None
+    elif len(parts) == 3:
+        userid = parts[2]
+        user = lookup(users, userid, "no such user ('{}')".format(userid))
+        if handler == "get":
+            return dict(user, groups=user_groups(state, userid))
+        if handler == "set":
+            if "groups" in params:
+                set_user_groups(state, userid, split_list(params.pop("groups")))
+            params.pop("append", None)
+            user.update(params)
+            return None
+        if handler == "delete":
+            del users[userid]
+            set_user_groups(state, userid, [])
+            state["acl"] = [acl for acl in state["acl"]
+                            if not (acl["type"] == "user" and acl["ugid"] == userid)]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_groups(state, handler, resource, params):
+    parts = resource.split("/")
+    groups = state["groups"]
+    if len(parts) == 2:
+        if handler == "get":
+            return [{"groupid": groupid, "comment": group.get("comment", ""),
+                     "users": ",".join(group.get("members", []))}
+                    for groupid, group in sorted(groups.items())]
+        if handler == "create":
+            require(handler, resource, params, "groupid")
+            groupid = params.pop("groupid")
+            if groupid in groups:
+                raise PveshError("create group failed: group '{}' already exists".format(groupid))
+            groups[groupid] = dict(params, members=[])
+            return None
+    elif len(parts) == 3:
+        groupid = parts[2]
+        group = lookup(groups, groupid, "group '{}' does not exist".format(groupid))
+        if handler == "get":
+            return dict(group)
+        if handler == "set":
+            group.update(params)
+            return None
+        if handler == "delete":
+            del groups[groupid]
+            state["acl"] = [acl for acl in state["acl"]
+                            if not (acl["type"] == "group" and acl["ugid"] == groupid)]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_domains(state, handler, resource, params):
+    parts = resource.split("/")
+    domains = state.setdefault("domains", initial_state()["domains"])
+    if len(parts) == 2:
+        if handler == "get":
+            return [dict([(key, domain[key]) for key in ["type", "comment"] if key in domain], realm=realm)
+                    for realm, domain in sorted(domains.items())]
+        if handler == "create":
+            require(handler, resource, params, "realm", "type")
+            realm = params.pop("realm")
+            if realm in domains:
+                raise PveshError("create auth server failed: domain '{}' already exists".format(realm))
+            params.pop("password", None)
+            domains[realm] = params
+            return None
+    elif len(parts) == 3:
+        realm = parts[2]
+        domain = lookup(domains, realm, "domain '{}' does not exist".format(realm))
+        if handler == "get":
+            return dict(domain, digest="0" * 40)
+        if handler == "set":
+            if "type" in params:
+                verification_failed(handler, resource, {"type": "property is not defined in schema"})
+            for key in split_list(params.pop("delete", "")):
+                domain.pop(key, None)
+            params.pop("password", None)
+            domain.update(params)
+            return None
+        if handler == "delete":
+            if domain["type"] in ["pam", "pve"]:
+                raise PveshError("can't remove domain '{}' - builtin domain".format(realm))
+            del domains[realm]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_realm_sync(state, handler, resource, params):
+    realm = resource.split("/")[2]
+    if handler != "create":
+        raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+    directory = lookup(state.get("directories", {}), realm,
+                       "domain '{}' does not exist".format(realm))
+
+    scope = params.get("scope", "both")
+    remove_vanished = split_list(params.get("remove-vanished", "none"))
+    suffix = "@{}".format(realm)
+    if scope in ["users", "both"]:
+        for name, properties in directory["users"].items():
+            userid = name + suffix
+            if userid not in state["users"]:
+                state["users"][userid] = {"enable": int(params.get("enable-new", 1)), "expire": 0}
+            state["users"][userid].update(properties)
+        if "entry" in remove_vanished:
+            for userid in [userid for userid in state["users"] if userid.endswith(suffix)]:
+                if userid[:-len(suffix)] not in directory["users"]:
+                    del state["users"][userid]
+                    set_user_groups(state, userid, [])
+    if scope in ["groups", "both"]:
+        suffix = "-{}".format(realm)
+        for name, members in directory["groups"].items():
+            group = state["groups"].setdefault(name + suffix, {"members": []})
+            group["members"] = sorted("{}@{}".format(member, realm) for member in members
+                                      if "{}@{}".format(member, realm) in state["users"])
+        if "entry" in remove_vanished:
+            for groupid in [groupid for groupid in state["groups"] if groupid.endswith(suffix)]:
+                if groupid[:-len(suffix)] not in directory["groups"]:
+                    del state["groups"][groupid]
+    # pvesh runs the worker in the foreground and prints its log
+    print("starting sync for realm {}".format(realm))
+    return None
+
+
+def handle_roles(state, handler, resource, params):
+    parts = resource.split("/")
+    roles = state["roles"]
+    if len(parts) == 2:
+        if handler == "get":
+            return listing(roles, "roleid")
+        if handler == "create":
+            require(handler, resource, params, "roleid")
+            roleid = params.pop("roleid")
+            if roleid in roles:
+                raise PveshError("create role failed: role '{}' already exists".format(roleid))
+            roles[roleid] = {"privs": ",".join(sorted(split_list(params.get("privs")))), "special": 0}
+            return None
+    elif len(parts) == 3:
+        roleid = parts[2]
+        role = lookup(roles, roleid, "role '{}' does not exist".format(roleid))
+        if handler == "get":
+            return dict((priv, 1) for priv in split_list(role["privs"]))
+        if role.get("special") and handler in ["set", "delete"]:
+            raise PveshError("cannot modify built-in role '{}'".format(roleid))
+        if handler == "set":
+            privs = split_list(params.get("privs"))
+            if params.get("append"):
+                privs += split_list(role["privs"])
+            role["privs"] = ",".join(sorted(privs))
+            return None
+        if handler == "delete":
+            del roles[roleid]
+            state["acl"] = [acl for acl in state["acl"] if acl["roleid"] != roleid]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_acl(state, handler, resource, params):
+    if handler == "get":
+        return list(state["acl"])
+    if handler != "set":
+        raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+    require(handler, resource, params, "path", "roles")
+    propagate = int(params.get("propagate", 1))
+    ugids = [("user", user) for user in split_list(params.get("users"))]
+    ugids += [("group", group) for group in split_list(params.get("groups"))]
+    ugids += [("token", token) for token in split_list(params.get("tokens"))]
+    for roleid in split_list(params["roles"]):
+        lookup(state["roles"], roleid, "role '{}' does not exist".format(roleid))
+        for ugid_type, ugid in ugids:
+            if ugid_type == "user":
+                lookup(state["users"], ugid, "no such user ('{}')".format(ugid))
+            elif ugid_type == "token":
+                lookup(state["users"], ugid.split("!")[0], "no such user ('{}')".format(ugid.split("!")[0]))
+            else:
+                lookup(state["groups"], ugid, "group '{}' does not exist".format(ugid))
+            state["acl"] = [acl for acl in state["acl"] if not (
+                acl["path"] == params["path"] and acl["type"] == ugid_type and
+                acl["ugid"] == ugid and acl["roleid"] == roleid)]
+            if not int(params.get("delete", 0)):
+                state["acl"].append({"path": params["path"], "type": ugid_type, "ugid": ugid,
+                                     "roleid": roleid, "propagate": propagate})
+    return None
+
+
+def handle_pools(state, handler, resource, params):
+    parts = resource.split("/")
+    pools = state["pools"]
+    if len(parts) == 1:
+        if handler == "get":
+            return listing(pools, "poolid")
+        if handler == "create":
+            require(handler, resource, params, "poolid")
+            poolid = params.pop("poolid")
+            if poolid in pools:
+                raise PveshError("create pool failed: pool '{}' already exists".format(poolid))
+            pools[poolid] = params
+            return None
+    elif len(parts) == 2:
+        poolid = parts[1]
+        pool = lookup(pools, poolid, "pool '{}' does not exist".format(poolid))
+        if handler == "get":
+            return dict(pool, members=[])
+        if handler == "set":
+            pool.update(params)
+            return None
+        if handler == "delete":
+            del pools[poolid]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_storage(state, handler, resource, params):
+    parts = resource.split("/")
+    storages = state["storage"]
+    if len(parts) == 1:
+        if handler == "get":
+            return listing(storages, "storage")
+        if handler == "create":
+            require(handler, resource, params, "storage", "type")
+            storage = params.pop("storage")
+            if storage in storages:
+                raise PveshError("create storage failed: storage ID '{}' already defined".format(storage))
+            storages[storage] = params
+            return None
+    elif len(parts) == 2:
+        storage = parts[1]
+        config = lookup(storages, storage, "storage '{}' does not exist".format(storage))
+        if handler == "get":
+            return dict(config, storage=storage)
+        if handler == "set":
+            if "type" in params:
+                verification_failed(handler, resource, {"type": "property is not defined in schema"})
+            for key in split_list(params.pop("delete", "")):
+                config.pop(key, None)
+            config.update(params)
+            return None
+        if handler == "delete":
+            del storages[storage]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_metrics(state, handler, resource, params):
+    parts = resource.split("/")
+    servers = state["metrics"]
+    if len(parts) == 3:
+        if handler == "get":
+            return [{"id": name, "type": server["type"], "server": server["server"],
+                     "port": server["port"], "disable": server.get("disable", 0)}
+                    for name, server in sorted(servers.items())]
+    elif len(parts) == 4:
+        name = parts[3]
+        if handler == "create":
+            require(handler, resource, params, "type", "server", "port")
+            if name in servers:
+                raise PveshError("create metric server failed: metric server '{}' already exists".format(name))
+            servers[name] = params
+            return None
+        server = lookup(servers, name, "metric server '{}' does not exist".format(name))
+        if handler == "get":
+            result = dict(server, id=name)
+            result.pop("token", None)
+            return result
+        if handler == "set":
+            if "type" in params:
+                verification_failed(handler, resource, {"type": "property is not defined in schema"})
+            server.update(params)
+            return None
+        if handler == "delete":
+            del servers[name]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_ha(state, handler, resource, params):
+    parts = resource.split("/")
+    # PVE stores "enabled" as "started", and rejects empty values
+    if params.get("state") == "enabled":
+        params["state"] = "started"
+    empty = sorted(option for (option, value) in params.items() if value == "")
+    if empty:
+        verification_failed(handler, resource, dict((option, "value may not be empty") for option in empty))
+    kind, key = ("ha_groups", "group") if parts[2] == "groups" else ("ha_resources", "sid")
+    entries = state.setdefault(kind, {})
+    if len(parts) == 3:
+        if handler == "get":
+            return listing(entries, key)
+        if handler == "create":
+            require(handler, resource, params, key)
+            name = params.pop(key)
+            if name in entries:
+                raise PveshError("{} '{}' already defined".format(key, name))
+            if kind == "ha_resources" and "group" in params:
+                lookup(state["ha_groups"], params["group"], "group '{}' does not exist".format(params["group"]))
+            entries[name] = dict(params, type="group" if kind == "ha_groups" else name.split(":")[0])
+            return None
+    elif len(parts) == 4:
+        name = parts[3]
+        entry = lookup(entries, name, "no such {} '{}'".format(key, name))
+        if handler == "get":
+            return dict(entry, **{key: name})
+        if handler == "set":
+            for option in split_list(params.pop("delete", "")):
+                entry.pop(option, None)
+            entry.update(params)
+            return None
+        if handler == "delete":
+            if kind == "ha_groups" and any(r.get("group") == name for r in state["ha_resources"].values()):
+                raise PveshError("ha group '{}' is used by a resource".format(name))
+            del entries[name]
+            return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_cluster_options(state, handler, resource, params):
+    options = state.setdefault("options", {})
+    if handler == "get":
+        return dict(options)
+    if handler == "set":
+        for key in split_list(params.pop("delete", "")):
+            options.pop(key, None)
+        options.update(params)
+        return None
+    raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+
+
+def handle_cluster_status(state, handler, resource, params):
+    if handler != "get":
+        raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+    status = [{"type": "cluster", "id": "cluster", "name": "fake", "nodes": len(state["nodes"]),
+               "quorate": 1, "version": 1}]
+    for index, node in enumerate(state["nodes"]):
+        status.append({"type": "node", "id": "node/{}".format(node), "name": node,
+                       "nodeid": index + 1, "online": 1, "local": int(index == 0),
+                       "ip": "10.0.0.{}".format(index + 1), "level": ""})
+    return status
+
+
+HANDLERS = [
+    (r"^access/users(/[^/]+)?$", handle_users),
+    (r"^access/groups(/[^/]+)?$", handle_groups),
+    (r"^access/roles(/[^/]+)?$", handle_roles),
+    (r"^access/domains(/[^/]+)?$", handle_domains),
+    (r"^access/domains/[^/]+/sync$", handle_realm_sync),
+    (r"^access/acl$", handle_acl),
+    (r"^pools(/[^/]+)?$", handle_pools),
+    (r"^storage(/[^/]+)?$", handle_storage),
+    (r"^cluster/metrics/server(/[^/]+)?$", handle_metrics),
+    (r"^cluster/options$", handle_cluster_options),
+    (r"^cluster/ha/(groups|resources)(/[^/]+)?$", handle_ha),
+    (r"^cluster/status$", handle_cluster_status),
+]
+
+
+def load_state(f):
+    f.seek(0)
+    raw = f.read()
+    return json.loads(raw) if raw else initial_state()
+
+
+def save_state(f, state):
+    f.seek(0)
+    f.truncate()
+    json.dump(state, f, separators=(",", ":"))
+
+
+def run(argv):
+    handler, resource, params = parse_args(argv)
+    latency = float(os.environ.get("PVESH_FAKE_LATENCY", 0))
+    if latency:
+        time.sleep(latency)
+
+    with open(STATE_FILE, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        state = load_state(f)
+        state["calls"][handler] = state["calls"].get(handler, 0) + 1
+        try:
+            fail = os.environ.get("PVESH_FAKE_FAIL")
+            if fail and re.search(fail, "{} {}".format(handler, resource)):
+                raise PveshError("injected failure for '{} {}'".format(handler, resource))
+
+            lock_errors = float(os.environ.get("PVESH_FAKE_LOCK_ERRORS", 0))
+            if handler != "get" and random.random() < lock_errors:
+                raise PveshError([
+                    "trying to acquire cfs lock 'file-user_cfg' ...",
+                    "cfs-lock 'file-user_cfg' error: got lock request timeout"])
+
+            for pattern, handle in HANDLERS:
+                if re.match(pattern, resource):
+                    result = handle(state, handler, resource, params)
+                    break
+            else:
+                raise PveshError("no '{}' handler for '{}'".format(handler, resource))
+        finally:
+            save_state(f, state)
+
+    if result is not None:
+        sys.stdout.write(json.dumps(result) + "\n")
+
+
+def main():
+    try:
+        run(sys.argv[1:])
+    except PveshError as e:
+        sys.stderr.write("\n".join(e.lines) + "\n")
+        sys.exit(e.code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Tests the user.cfg parser pmxcfs.py answers access lookups with.
+
+    python -m pytest tests
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+ROLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(ROLE_DIR, "module_utils"))
+import ansible.module_utils.pmxcfs as pmxcfs
+
+USER_CFG = """\
+user:root@pam:1:0:::root@localhost::
+user:ops@pve:1:0:Ops:Team:::
+token:ops@pve!ci:0:1::
+
+group:admins:ops@pve,gone@pve::
+group:empty:gone@pve::
+
+role:Custom:VM.Audit:
+
+acl:1:/:ops@pve,@admins,ops@pve!ci:PVEAuditor,Custom:
+acl:1:/vms:gone@pve,@missing,ops@pve!gone:PVEAuditor:
+acl:1:/storage:ops@pve:Deleted:
+"""
+
+
+class TestParseUserConfig(unittest.TestCase):
+    def setUp(self):
+        self.cfg = pmxcfs.parse_user_config(USER_CFG)
+
+    def test_members_must_exist(self):
+        self.assertEqual(self.cfg["groups"]["admins"]["users"], ["ops@pve"])
+        self.assertEqual(self.cfg["groups"]["empty"]["users"], [])
+        self.assertEqual(self.cfg["users"]["ops@pve"]["groups"], ["admins"])
+
+    def test_acl_entries_must_resolve(self):
+        self.assertEqual(sorted(self.cfg["acl"]), [
+            ("/", "group", "admins", "Custom"),
+            ("/", "group", "admins", "PVEAuditor"),
+            ("/", "token", "ops@pve!ci", "Custom"),
+            ("/", "token", "ops@pve!ci", "PVEAuditor"),
+            ("/", "user", "ops@pve", "Custom"),
+            ("/", "user", "ops@pve", "PVEAuditor"),
+        ])
+
+
+class TestAccessLookups(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        with open(os.path.join(self.root, "user.cfg"), "w") as f:
+            f.write(USER_CFG)
+        self.addCleanup(setattr, pmxcfs, "PMXCFS_ROOT", pmxcfs.PMXCFS_ROOT)
+        pmxcfs.PMXCFS_ROOT = self.root
+
+    def test_groups(self):
+        groups = pmxcfs.get_groups()["data"]
+        self.assertEqual([(group["groupid"], group["users"]) for group in groups],
+                         [("admins", "ops@pve"), ("empty", "")])
+
+    def test_acl(self):
+        acls = pmxcfs.get_acl()["data"]
+        self.assertEqual(set(acl["path"] for acl in acls), set(["/"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Tests the ACL helpers, and proxmox_acl against fake_pvesh.py.
+
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+ROLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROLE_DIR, "tests"))
+
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(ROLE_DIR, "module_utils"))
+from ansible.module_utils.pveacl import batch_acl_changes, expand_acl
+
+from benchmark import FAKE_PVESH, run_module
+import fake_pvesh
+
+
+class TestBatchACLChanges(unittest.TestCase):
+    def test_same_roles_are_combined(self):
+        keys = expand_acl("/vms", ["PVEAuditor"], users=["a@pve", "b@pve"], groups=["ops"])
+        self.assertEqual(batch_acl_changes(keys), [
+            {"path": "/vms", "roles": "PVEAuditor", "users": "a@pve,b@pve", "groups": "ops", "propagate": 1},
+        ])
+
+    def test_different_propagate_is_split(self):
+        keys = [("/vms", "user", "a@pve", "PVEAuditor", 1), ("/vms", "user", "b@pve", "PVEAuditor", 0)]
+        self.assertEqual([args["users"] for args in batch_acl_changes(keys)], ["b@pve", "a@pve"])
+
+    def test_deletions_ignore_propagate(self):
+        keys = [("/vms", "user", "a@pve", "PVEAuditor", 1), ("/vms", "group", "ops", "PVEAuditor", 0)]
+        self.assertEqual(batch_acl_changes(keys, delete=True), [
+            {"path": "/vms", "roles": "PVEAuditor", "users": "a@pve", "groups": "ops", "delete": 1},
+        ])
+
+    def test_tokens(self):
+        keys = [("/", "token", "root@pam!ci", "PVEAuditor", 1), ("/", "user", "a@pve", "PVEAuditor", 1)]
+        self.assertEqual(batch_acl_changes(keys, delete=True), [
+            {"path": "/", "roles": "PVEAuditor", "users": "a@pve", "tokens": "root@pam!ci", "delete": 1},
+        ])
+
+
+class TestExclusiveACL(unittest.TestCase):
+    def setUp(self):
+        handle, self.state_file = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        self.addCleanup(os.unlink, self.state_file)
+
+        state = fake_pvesh.initial_state()
+        state["users"]["ops@pve"] = {"enable": 1, "expire": 0}
+        state["acl"] = [
+            {"path": "/storage", "type": "user", "ugid": "ops@pve", "roleid": "PVEAuditor", "propagate": 1},
+            {"path": "/storage", "type": "token", "ugid": "root@pam!ci", "roleid": "PVEAuditor", "propagate": 1},
+            {"path": "/vms", "type": "token", "ugid": "root@pam!ci", "roleid": "PVEAuditor", "propagate": 1},
+        ]
+        with open(self.state_file, "w") as f:
+            json.dump(state, f)
+
+        self.env = dict(os.environ, PVESH_BIN=FAKE_PVESH, PVESH_BACKEND="cli", PVESH_LOCAL_READS="no",
+                        PVESH_CACHE="no", PVESH_FAKE_STATE=self.state_file)
+
+    def acl(self):
+        with open(self.state_file) as f:
+            return sorted((acl["path"], acl["type"], acl["ugid"]) for acl in json.load(f)["acl"])
+
+    def test_unmanaged_token_is_removed(self):
+        args = {"path": "/storage", "roles": ["PVEAuditor"], "users": ["ops@pve"], "exclusive": True}
+        result = run_module("proxmox_acl", args, self.env)
+        self.assertTrue(result["changed"])
+        self.assertEqual(self.acl(), [("/storage", "user", "ops@pve"), ("/vms", "token", "root@pam!ci")])
+
+        result = run_module("proxmox_acl", args, self.env)
+        self.assertFalse(result["changed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
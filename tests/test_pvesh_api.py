@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Tests pvesh's local API client against fake_pve_api.py.
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import unittest
+
+ROLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROLE_DIR, "tests"))
+
+import ansible.module_utils
+ansible.module_utils.__path__.append(os.path.join(ROLE_DIR, "module_utils"))
+import ansible.module_utils.pvesh as pvesh
+
+from fake_pve_api import DROP, FakePVEAPI
+
+TOKEN = "root@pam!test=secret"
+LOCK_TIMEOUT = "cfs-lock 'file-user_cfg' error: got lock request timeout"
+
+
+class APITestCase(unittest.TestCase):
+    api_options = {"token": TOKEN}
+    environment = {}
+
+    def setUp(self):
+        self.api = FakePVEAPI(**self.api_options).start()
+        self.addCleanup(self.api.stop)
+
+        environment = {
+            "PVESH_BACKEND": "api",
+            "PVESH_API_URL": self.api.url,
+            "PVESH_API_TOKEN": TOKEN,
+            "PVESH_CACHE": "no",
+            "PVESH_LOCAL_READS": "no",
+            # Whatever ends up running pvesh mustn't answer with a 200
+            "PVESH_BIN": "/nonexistent/pvesh",
+        }
+        environment.update(self.environment)
+        saved = dict((key, os.environ.get(key)) for key in environment)
+        for (key, value) in environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        self.addCleanup(self.restore_environment, saved)
+
+        self.addCleanup(setattr, pvesh, "RETRY_BASE_DELAY", pvesh.RETRY_BASE_DELAY)
+        pvesh.RETRY_BASE_DELAY = 0.01
+        self.reset()
+        self.addCleanup(self.reset)
+
+    def reset(self):
+        if pvesh._api_client is not None:
+            pvesh._api_client.close()
+        pvesh._api_client = None
+        pvesh._api_unavailable = False
+        pvesh._stats.update(retries=0, retry_wait=0.0)
+        pvesh.configure(retries=pvesh.DEFAULT_RETRIES, retry_budget=pvesh.DEFAULT_RETRY_BUDGET)
+
+    def restore_environment(self, saved):
+        for (key, value) in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    def requests(self, method, path):
+        return [request for request in self.api.requests
+                if request["method"] == method and request["path"] == path]
+
+
+class TestRequests(APITestCase):
+    def test_get_params_in_query(self):
+        data = pvesh.get("access/users", full=1, enabled=[0, 1])
+        self.assertEqual(data, {"method": "GET", "params": {"full": "1", "enabled": ["0", "1"]}})
+
+    def test_set_params_in_body(self):
+        pvesh.set("access/acl", path="/vms/100", roles="PVEAuditor", users="test@pve")
+        (request,) = self.requests("PUT", "/access/acl")
+        self.assertEqual(request["params"], {"path": "/vms/100", "roles": "PVEAuditor", "users": "test@pve"})
+
+    def test_resource_is_quoted(self):
+        pvesh.get("access/users/test@pve")
+        self.assertEqual(len(self.requests("GET", "/access/users/test@pve")), 1)
+
+    def test_connection_is_reused(self):
+        pvesh.get("version")
+        connection = pvesh._api_client.connection
+        pvesh.get("version")
+        self.assertIs(pvesh._api_client.connection, connection)
+
+
+class TestErrors(APITestCase):
+    def test_parameter_errors(self):
+        self.api.script("POST", "/access/users", (400, "Parameter verification failed.",
+                                                  {"data": None, "errors": {"email": "invalid format\n"}}))
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.create("access/users", userid="test@pve", email="nope")
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertEqual(context.exception.message, "Parameter verification failed.\nemail: invalid format")
+
+    def test_not_found(self):
+        self.api.script("GET", "/access/users/test@pve", (500, "no such user ('test@pve')"))
+        self.assertIsNone(pvesh.get("access/users/test@pve"))
+
+    def test_missing_handler(self):
+        self.api.script("DELETE", "/version", (501, "Method 'DELETE /version' not implemented"))
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.delete("version")
+        self.assertEqual(context.exception.status_code, 405)
+        self.assertEqual(context.exception.message, "no 'delete' handler for 'version'")
+
+    def test_other_errors(self):
+        self.api.script("POST", "/pools", (500, "pool 'test' already exists"))
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.create("pools", poolid="test")
+        self.assertEqual(context.exception.status_code, 500)
+        self.assertEqual(len(self.requests("POST", "/pools")), 1)
+
+
+class TestLockRetries(APITestCase):
+    def test_lock_timeouts_are_retried(self):
+        self.api.script("PUT", "/access/acl", (500, LOCK_TIMEOUT), (500, LOCK_TIMEOUT), (200, "OK"))
+        pvesh.set("access/acl", path="/", roles="PVEAuditor", users="test@pve")
+        self.assertEqual(len(self.requests("PUT", "/access/acl")), 3)
+        self.assertEqual(pvesh._stats["retries"], 2)
+
+    def test_retries_are_bounded(self):
+        pvesh.configure(retries=2)
+        self.api.script("PUT", "/access/acl", (500, LOCK_TIMEOUT))
+        with self.assertRaises(pvesh.ProxmoxShellError):
+            pvesh.set("access/acl", path="/", roles="PVEAuditor", users="test@pve")
+        self.assertEqual(len(self.requests("PUT", "/access/acl")), 3)
+
+    def test_no_retries_without_budget(self):
+        pvesh.configure(retry_budget=0)
+        self.api.script("PUT", "/access/acl", (500, LOCK_TIMEOUT))
+        with self.assertRaises(pvesh.ProxmoxShellError):
+            pvesh.set("access/acl", path="/", roles="PVEAuditor", users="test@pve")
+        self.assertEqual(len(self.requests("PUT", "/access/acl")), 1)
+
+    def test_missing_credentials_are_not_retried(self):
+        os.environ.pop("PVESH_API_TOKEN")
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.get("version")
+        self.assertIn("no credentials", context.exception.message)
+        self.assertEqual(pvesh._stats["retries"], 0)
+
+    def test_unavailable_reads_are_retried(self):
+        self.api.script("GET", "/version", (503, "Service Unavailable"), (200, "OK", {"data": {"version": "9.0"}}))
+        self.assertEqual(pvesh.get("version"), {"version": "9.0"})
+        self.assertEqual(pvesh._stats["retries"], 1)
+
+    def test_unavailable_writes_are_not_retried(self):
+        self.api.script("POST", "/pools", (503, "Service Unavailable"), (200, "OK"))
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.create("pools", poolid="test")
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(len(self.requests("POST", "/pools")), 1)
+
+    def test_other_errors_are_not_retried(self):
+        self.api.script("POST", "/pools", (500, "pool 'test' already exists"))
+        with self.assertRaises(pvesh.ProxmoxShellError):
+            pvesh.create("pools", poolid="test")
+        self.assertEqual(pvesh._stats["retries"], 0)
+
+
+class TestDroppedConnections(APITestCase):
+    environment = {"PVESH_BACKEND": "auto"}
+
+    def test_get_is_replayed(self):
+        self.api.script("GET", "/version", DROP, (200, "OK", {"data": {"version": "9.0"}}))
+        self.assertEqual(pvesh.get("version"), {"version": "9.0"})
+        self.assertEqual(len(self.requests("GET", "/version")), 2)
+
+    def test_write_is_not_replayed(self):
+        self.api.script("POST", "/nodes/pve01/migrateall", DROP, (200, "OK"))
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.create("nodes/pve01/migrateall", target="pve02")
+        self.assertIn("may have been carried out", context.exception.message)
+        self.assertEqual(len(self.requests("POST", "/nodes/pve01/migrateall")), 1)
+        # Nor is it sent through pvesh instead
+        self.assertNotEqual(pvesh._backend_used, "cli")
+
+
+class TestTicketAuthentication(APITestCase):
+    api_options = {"user": "root@pam", "password": "hunter2"}
+    environment = {"PVESH_API_TOKEN": None, "PVESH_API_USER": "root@pam", "PVESH_API_PASSWORD": "hunter2"}
+
+    def test_ticket_is_requested_once(self):
+        pvesh.get("version")
+        pvesh.get("version")
+        self.assertEqual(len(self.requests("POST", "/access/ticket")), 1)
+        self.assertEqual(len(self.requests("GET", "/version")), 2)
+
+    def test_writes_send_csrf_token(self):
+        pvesh.create("pools", poolid="test")
+        (request,) = self.requests("POST", "/pools")
+        self.assertIn("CSRFPreventionToken", request["headers"])
+
+    def test_wrong_password(self):
+        os.environ["PVESH_API_PASSWORD"] = "wrong"
+        with self.assertRaises(pvesh.ProxmoxShellError) as context:
+            pvesh.get("version")
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertIn("unable to obtain a ticket", context.exception.message)
+
+
+if __name__ == "__main__":
+    unittest.main()